@@ -9,25 +9,29 @@ class Port:
 
     def reset(self):
         self.value = 0x00
+        self.latch = 0x00
         self.dir = 0xFF
         self.pullup = 0x00
+        self.interrupt = 0x00
 
 
 class MCP23017:
 
-    __MCP23017_REG_BASE_A       = 0x00    # Base address for Port A registers
-    __MCP23017_REG_BASE_B       = 0x10    # Base address for Port B registers
+    # The device is used with paired registers (IOCON.BANK = 0), the port B
+    # register follows the port A register.  With sequential operation one
+    # block transfer accesses a register of both ports.
     __MCP23017_REG_IODIR        = 0x00    # I/O direction register
-    __MCP23017_REG_IOPOL        = 0x01    # Input polarity register
-    __MCP23017_REG_GPINTEN      = 0x02    # Interrupt on change register
-    __MCP23017_REG_DEFVAL       = 0x03    # Default value register
-    __MCP23017_REG_INTCON       = 0x04    # Interrupt on change control register
-    __MCP23017_REG_IOCON        = 0x05    # Configuration register
-    __MCP23017_REG_GPPU         = 0x06    # GPIO pull-up resistor register
-    __MCP23017_REG_INTF         = 0x07    # Interrupt flag register
-    __MCP23017_REG_INTCAP       = 0x08    # Interrupt capture register
-    __MCP23017_REG_GPIO         = 0x09    # Port register
-    __MCP23017_REG_OLAT         = 0x0A    # Output latch register
+    __MCP23017_REG_IOPOL        = 0x02    # Input polarity register
+    __MCP23017_REG_GPINTEN      = 0x04    # Interrupt on change register
+    __MCP23017_REG_DEFVAL       = 0x06    # Default value register
+    __MCP23017_REG_INTCON       = 0x08    # Interrupt on change control register
+    __MCP23017_REG_IOCON        = 0x0A    # Configuration register
+    __MCP23017_REG_GPPU         = 0x0C    # GPIO pull-up resistor register
+    __MCP23017_REG_INTF         = 0x0E    # Interrupt flag register
+    __MCP23017_REG_INTCAP       = 0x10    # Interrupt capture register
+    __MCP23017_REG_GPIO         = 0x12    # Port register
+    __MCP23017_REG_OLAT         = 0x14    # Output latch register
+    __MCP23017_REG_IOCON_BANK1  = 0x05    # Configuration register with IOCON.BANK = 1
 
     __MCP23017_IO_IN            = 1       # I/O direction is input
     __MCP23017_IO_OUT           = 0       # I/O direction is output
@@ -41,16 +45,16 @@ class MCP23017:
     __MCP23017_IOCON_BANK1      = 0b10000000       # Registers associated with each port are segregated
     __MCP23017_IOCON_MIRROR_DIS = 0b00000000       # INT pins are seperated
     __MCP23017_IOCON_MIRROR_EN  = 0b01000000       # INT pins are functionally OR'ed
-    __MCP23017_IOCON_SEQOP_DIS  = 0b00000000       # Address pointer does not automaticall increment
-    __MCP23017_IOCON_SEQOP_EN   = 0b00100000       # Address pointer does automaticall increment
+    __MCP23017_IOCON_SEQOP_DIS  = 0b00100000       # Address pointer does not automaticall increment
+    __MCP23017_IOCON_SEQOP_EN   = 0b00000000       # Address pointer does automaticall increment
     __MCP23017_IOCON_DISSLW_DIS = 0b00000000       # Slew rate control is disabled
     __MCP23017_IOCON_DISSLW_EN  = 0b00010000       # Slew rate control is enabled
     __MCP23017_IOCON_HAEN_DIS   = 0b00000000       # Hardware address is disabled A2,A1,A0 = 0
     __MCP23017_IOCON_HAEN_EN    = 0b00001000       # Hardware address is enabled
     __MCP23017_IOCON_ODR_DIS    = 0b00000000       # Disables interrupt for open drain pins
     __MCP23017_IOCON_ODR_EN     = 0b00000100       # Enables interrupt for open drain pins
-    __MCP23017_IOCON_INTPOL_HIGH= 0b00000000       # Polarity of INT pin is set to active high
-    __MCP23017_IOCON_INTPOL_LOW = 0b00000010       # Polarity of INT pin is set to active low
+    __MCP23017_IOCON_INTPOL_HIGH= 0b00000010       # Polarity of INT pin is set to active high
+    __MCP23017_IOCON_INTPOL_LOW = 0b00000000       # Polarity of INT pin is set to active low
     __MCP23017_GPPU_EN          = 1                # Pull-up resistor is enabled
     __MCP23017_GPPU_DIS         = 0                # Pull-up resistor is disabled
 
@@ -65,33 +69,35 @@ class MCP23017:
 
     def __init__(self, address=0x20, busId=2, debug=False):
         self.port = [Port(), Port()]
-        self.portOld = [Port(), Port()]
-        self.portBase = [self.__MCP23017_REG_BASE_A, self.__MCP23017_REG_BASE_B]
+        self.portOld = [Port(), Port()]  # register contents of the device
         self.i2c = smbus.SMBus(busId)
         self.address = address
         self.debug = debug
 
     def init(self):
         config = 0
-        config |= self.__MCP23017_IOCON_BANK1
-        config |= self.__MCP23017_IOCON_MIRROR_DIS
-        config |= self.__MCP23017_IOCON_SEQOP_DIS
+        config |= self.__MCP23017_IOCON_BANK0
+        config |= self.__MCP23017_IOCON_MIRROR_EN
+        config |= self.__MCP23017_IOCON_SEQOP_EN
         config |= self.__MCP23017_IOCON_DISSLW_EN
         config |= self.__MCP23017_IOCON_HAEN_EN
         config |= self.__MCP23017_IOCON_ODR_DIS
         config |= self.__MCP23017_IOCON_INTPOL_HIGH
+        # switch a device left in segregated mode back to paired registers,
+        # in paired mode this address is GPINTENB which is written below
+        self.i2c.write_byte_data(self.address, self.__MCP23017_REG_IOCON_BANK1, config)
         self.i2c.write_byte_data(self.address, self.__MCP23017_REG_IOCON, config)
 
         # Enable all latches
-        for i in range(0, 2):
-            reg = self.portBase[i] + self.__MCP23017_REG_OLAT
-            self.i2c.write_byte_data(self.address, reg, 0xFF)
+        self.writeRegister(self.__MCP23017_REG_OLAT, 0xFF, 0xFF)
 
+        for i in range(0, 2):
             self.port[i].reset()
             self.portOld[i].reset()
-            self.updateDir(i, self.port[i].dir)
-            self.updatePullup(i, self.port[i].pullup)
-            self.updateValue(i, self.port[i].value)
+        self.writeRegister(self.__MCP23017_REG_IODIR, self.port[0].dir, self.port[1].dir)
+        self.writeRegister(self.__MCP23017_REG_GPPU, self.port[0].pullup, self.port[1].pullup)
+        self.writeRegister(self.__MCP23017_REG_GPINTEN, self.port[0].interrupt, self.port[1].interrupt)
+        self.writeRegister(self.__MCP23017_REG_OLAT, self.port[0].latch, self.port[1].latch)
 
     def setDir(self, port, pin, dir):
         newDir = self.port[port].dir
@@ -100,10 +106,10 @@ class MCP23017:
         self.port[port].dir = newDir
 
     def setValue(self, port, pin, value):
-        newValue = self.port[port].value
+        newValue = self.port[port].latch
         newValue &= ~(1 << pin)
         newValue |= (value << pin)
-        self.port[port].value = newValue
+        self.port[port].latch = newValue
 
     def setPullup(self, port, pin, pullup):
         newPullup = self.port[port].pullup
@@ -111,52 +117,41 @@ class MCP23017:
         newPullup |= (pullup << pin)
         self.port[port].pullup = newPullup
 
+    def setInterrupt(self, port, pin, enable):
+        newInterrupt = self.port[port].interrupt
+        newInterrupt &= ~(1 << pin)
+        newInterrupt |= (int(enable) << pin)
+        self.port[port].interrupt = newInterrupt
+
     def getValue(self, port, pin):
         return bool(self.port[port].value & (1 << pin))
 
-    def updateValue(self, port, value):
-        reg = self.portBase[port] + self.__MCP23017_REG_GPIO
-        self.i2c.write_byte_data(self.address, reg, value)
-        if (self.debug):
-            print(("wrote value: " + "{0:b}".format(value)))
-
-    def updateDir(self, port, dir):
-        reg = self.portBase[port] + self.__MCP23017_REG_IODIR
-        self.i2c.write_byte_data(self.address, reg, dir)
-        if (self.debug):
-            print(("wrote dir value: " + "{0:b}".format(dir)))
-
-    def updatePullup(self, port, pullup):
-        reg = self.portBase[port] + self.__MCP23017_REG_GPPU
-        self.i2c.write_byte_data(self.address, reg, pullup)
+    def writeRegister(self, reg, valueA, valueB):
+        self.i2c.write_i2c_block_data(self.address, reg, [valueA, valueB])
         if (self.debug):
-            print(("wrote pullup value: " + "{0:b}".format(pullup)))
-
-    def readValues(self, port):
-        reg = self.portBase[port] + self.__MCP23017_REG_GPIO
-        values = self.i2c.read_byte_data(self.address, reg)
-        if (self.debug):
-            print(("read values: " + "{0:b}".format(values)))
-        return values
+            print(("wrote register 0x%02x: " % reg + "{0:08b} {1:08b}".format(valueA, valueB)))
 
     def read(self):
+        # reading the port register also clears a pending interrupt
+        values = self.i2c.read_i2c_block_data(self.address, self.__MCP23017_REG_GPIO, 2)
+        if (self.debug):
+            print(("read values: " + "{0:08b} {1:08b}".format(values[0], values[1])))
         for i in range(0, 2):
-            self.port[i].value = self.readValues(i)
-            self.portOld[i].value = self.port[i].value
+            self.port[i].value = values[i]
+            self.portOld[i].value = values[i]
 
     def write(self):
-        for i in range(0, 2):
-            if (self.port[i].dir != self.portOld[i].dir):
-                self.updateDir(i, self.port[i].dir)
-                self.portOld[i].dir = self.port[i].dir
-
-            if (self.port[i].pullup != self.portOld[i].pullup):
-                self.updatePullup(i, self.port[i].pullup)
-                self.portOld[i].pullup = self.port[i].pullup
-
-            if (self.port[i].value != self.portOld[i].value):
-                self.updateValue(i, self.port[i].value)
-                self.portOld[i].value = self.port[i].value
+        # only registers changed since the last write are transferred, the
+        # register of both ports in one block
+        for name, reg in (('dir', self.__MCP23017_REG_IODIR),
+                          ('pullup', self.__MCP23017_REG_GPPU),
+                          ('interrupt', self.__MCP23017_REG_GPINTEN),
+                          ('latch', self.__MCP23017_REG_OLAT)):
+            values = [getattr(self.port[i], name) for i in range(0, 2)]
+            if values != [getattr(self.portOld[i], name) for i in range(0, 2)]:
+                self.writeRegister(reg, values[0], values[1])
+                for i in range(0, 2):
+                    setattr(self.portOld[i], name, values[i])
 
 
 #gpio = MCP23017(0x20, 2, True)
@@ -166,6 +161,6 @@ class MCP23017:
 
 #while True:
 ##    time.sleep(0.01)
-#    gpio.update()
+#    gpio.read()
 #    for i in range(0, 6):
 #        print "pin" + str(i) + "value: " + str(gpio.getValue(MCP23017.PORT_A,i))
@@ -63,16 +63,20 @@ class PCA9685:
     __PCA9685_MODE2_OUTNE_1            = 0b00000001    # LEDn=1 when OE=1 and OUTDRV=1 or high-impedance when OUTDRV=0
     __PCA9685_MODE2_OUTNE_2            = 0b00000010    # LEDn=high-impedance
 
+    CHANNELS = 16
+
     def __init__(self, address=0x46, busId=2, debug=False):
         self.i2c = smbus.SMBus(busId)
         self.address = address
         self.debug = debug
+        self.pwm = [(0, 0)] * self.CHANNELS      # (on, off) set per channel
+        self.pwmOld = [(0, 0)] * self.CHANNELS   # (on, off) in the device
 
     def init(self):
         config = 0
         config |= self.__PCA9685_MODE1_RESTART_DISABLED
         config |= self.__PCA9685_MODE1_EXTCLK_DISABLED
-        config |= self.__PCA9685_MODE1_AI_DISABLED
+        config |= self.__PCA9685_MODE1_AI_ENABLED
         config |= self.__PCA9685_MODE1_SLEEP_DISABLED
         config |= self.__PCA9685_MODE1_SUB1_DISABLED
         config |= self.__PCA9685_MODE1_SUB1_DISABLED
@@ -89,32 +93,51 @@ class PCA9685:
 
         self.setAllPwm(0,0)
 
+    def pwmBytes(self, on, off):
+        return [on & 0xFF, (on >> 8) & 0x0F, off & 0xFF, (off >> 8) & 0x0F]
+
+    # The channels are written with write(), setPwm only changes the value
+    # kept for the channel.
     def setPwm(self, ch, on, off):
-        regAddress = self.__PCA9685_REG_LED_BASE + self.__PCA9685_REG_LED_SIZE * ch
-        on_l = on & 0xFF
-        on_h = (on >> 8) & 0x0F
-        off_l = off & 0xFF
-        off_h = (off >> 8) & 0x0F
-        self.i2c.write_byte_data(self.address, regAddress + self.__PCA9685_REG_LED_ON_L, on_l)
-        self.i2c.write_byte_data(self.address, regAddress + self.__PCA9685_REG_LED_ON_H, on_h)
-        self.i2c.write_byte_data(self.address, regAddress + self.__PCA9685_REG_LED_OFF_L, off_l)
-        self.i2c.write_byte_data(self.address, regAddress + self.__PCA9685_REG_LED_OFF_H, off_h)
+        self.pwm[ch] = (on, off)
 
     def setAllPwm(self, on, off):
-        on_l = on & 0xFF
-        on_h = (on >> 8) & 0x0F
-        off_l = off & 0xFF
-        off_h = (off >> 8) & 0x0F
-        self.i2c.write_byte_data(self.address, self.__PCA9685_REG_ALL_LED_ON_L, on_l)
-        self.i2c.write_byte_data(self.address, self.__PCA9685_REG_ALL_LED_ON_H, on_h)
-        self.i2c.write_byte_data(self.address, self.__PCA9685_REG_ALL_LED_OFF_L, off_l)
-        self.i2c.write_byte_data(self.address, self.__PCA9685_REG_ALL_LED_OFF_H, off_h)
+        self.i2c.write_i2c_block_data(self.address, self.__PCA9685_REG_ALL_LED_ON_L,
+                                      self.pwmBytes(on, off))
+        self.pwm = [(on, off)] * self.CHANNELS
+        self.pwmOld = [(on, off)] * self.CHANNELS
 
     def setPwmDuty(self, ch, duty):
         on = 0
         off = int(duty * 4095)
         self.setPwm(ch, on, off)
 
+    def refresh(self, ch):
+        # write the channel with the next write() even if it did not change
+        self.pwmOld[ch] = None
+
+    def dirty(self):
+        return self.pwm != self.pwmOld
+
+    def write(self):
+        # changed channels next to each other are written in one block,
+        # an SMBus block holds up to 32 bytes or 8 channels
+        ch = 0
+        while ch < self.CHANNELS:
+            if self.pwm[ch] == self.pwmOld[ch]:
+                ch += 1
+                continue
+            first = ch
+            data = []
+            while (ch < self.CHANNELS) and (self.pwm[ch] != self.pwmOld[ch]) and (len(data) < 32):
+                data += self.pwmBytes(*self.pwm[ch])
+                ch += 1
+            regAddress = self.__PCA9685_REG_LED_BASE + self.__PCA9685_REG_LED_SIZE * first
+            self.i2c.write_i2c_block_data(self.address, regAddress, data)
+            self.pwmOld[first:ch] = self.pwm[first:ch]
+            if (self.debug):
+                print(("wrote channels %i to %i" % (first, ch - 1)))
+
     def setPrescaler(self, prescaler):
         mode1Save = self.i2c.read_byte_data(self.address, self.__PCA9685_REG_MODE1)
         config = mode1Save | self.__PCA9685_MODE1_SLEEP_ENABLED
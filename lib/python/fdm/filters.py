@@ -0,0 +1,88 @@
+#!/usr/bin/python2
+
+import bisect
+
+
+# Low pass filters for sensor readings.  add() takes a sample and returns
+# the filtered value, which is also kept in value.  The samples of the
+# window are kept in a fixed size ring buffer.
+
+
+class MeanFilter:
+    # running mean of the last size samples
+    def __init__(self, size=10):
+        self.size = max(int(size), 1)
+        self.samples = [0.0] * self.size
+        self.index = 0
+        self.count = 0
+        self.sum = 0.0
+        self.value = 0.0
+
+    def add(self, value):
+        if self.count < self.size:
+            self.count += 1
+        self.sum += value - self.samples[self.index]
+        self.samples[self.index] = value
+        self.index += 1
+        if self.index == self.size:
+            self.index = 0
+            # start over from the window once per round to not accumulate
+            # rounding errors in the running sum
+            self.sum = sum(self.samples)
+        self.value = self.sum / self.count
+        return self.value
+
+
+class MedianFilter:
+    # median of the last size samples, a sorted copy of the window is
+    # updated with every sample
+    def __init__(self, size=10):
+        self.size = max(int(size), 1)
+        self.samples = []
+        self.sorted = []
+        self.index = 0
+        self.value = 0.0
+
+    def add(self, value):
+        if len(self.samples) < self.size:
+            self.samples.append(value)
+        else:
+            del self.sorted[bisect.bisect_left(self.sorted, self.samples[self.index])]
+            self.samples[self.index] = value
+            self.index = (self.index + 1) % self.size
+        bisect.insort(self.sorted, value)
+        count = len(self.sorted)
+        middle = count // 2
+        if count % 2:
+            self.value = self.sorted[middle]
+        else:
+            self.value = (self.sorted[middle - 1] + self.sorted[middle]) / 2.0
+        return self.value
+
+
+class IIRFilter:
+    # exponential moving average with the same delay as a running mean
+    # of size samples
+    def __init__(self, size=10):
+        self.size = max(int(size), 1)
+        self.alpha = 2.0 / (self.size + 1)
+        self.value = None
+
+    def add(self, value):
+        if self.value is None:
+            self.value = float(value)
+        else:
+            self.value += self.alpha * (value - self.value)
+        return self.value
+
+
+filterTypes = {'mean': MeanFilter,
+               'median': MedianFilter,
+               'iir': IIRFilter}
+
+
+def createFilter(filterType, size):
+    if filterType not in filterTypes:
+        raise ValueError('unknown filter type %s, valid types are: %s'
+                         % (filterType, ', '.join(sorted(filterTypes))))
+    return filterTypes[filterType](size)
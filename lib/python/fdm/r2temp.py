@@ -3,12 +3,187 @@
 import bisect
 import os
 import sys
+
+import numpy
+
 from machinekit import config
 
 
+# Thermistor tables are loaded at runtime from thermistor_tables folders
+# once per process and shared by all channels using them.  Every entry is
+# [temperature, resistance, alpha], ordered by resistance from low to high.
+_tables = {}
+# (table, circuit, parameters, counts) -> temperature for every ADC count
+_lookupTables = {}
+
+
+def findTable(name):
+    c = config.Config()
+    localInputFile = os.path.join(os.getcwd(), 'thermistor_tables', name + '.txt')
+    systemInputFile = os.path.join(c.datadir, 'fdm', 'thermistor_tables', name + '.txt')
+
+    if os.path.exists(name):
+        return name
+    elif os.path.exists(localInputFile):
+        return localInputFile
+    elif os.path.exists(systemInputFile):
+        return systemInputFile
+    else:
+        raise RuntimeError('Thermistor table was not found')
+
+
+def parseTable(inputFile):
+    table = []
+    with open(inputFile, "r") as f:
+        content = f.readlines()
+        for line in content:
+            line = ' '.join(line.split())
+            if ((len(line) == 0) or (line[0] == '#')):
+                continue
+            datas = line.split(' ')
+            tableEntry = []
+            for data in datas:
+                tableEntry.append(float(data))
+            table.append(tableEntry)
+    return table
+
+
+def registerTable(name, table):
+    # Temperature table needs resistance to be ordered low [0] to high [n]
+    table = [list(entry) for entry in table]
+    if (len(table) > 0) and (table[0][0] < table[-1][0]):
+        table.reverse()
+    _tables[name] = table
+
+
+def loadTable(name):
+    if name not in _tables:
+        registerTable(name, parseTable(findTable(name)))
+    return _tables[name]
+
+
+def tableColumns(name):
+    table = loadTable(name)
+    if len(table) == 0:
+        raise RuntimeError('thermistor_table_raw table not found')
+    temperatures = numpy.array([entry[0] for entry in table])
+    resistances = numpy.array([entry[1] for entry in table])
+    return temperatures, resistances
+
+
+# Convert resistance values into temperatures, same interpolation as R2Temp.r2t
+def r2t(name, R_T):
+    temperatures, resistances = tableColumns(name)
+    R_T = numpy.asarray(R_T, dtype=float)
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        slopes = numpy.append(numpy.diff(temperatures) / numpy.diff(resistances), 0.0)
+        i = numpy.searchsorted(resistances, R_T, side='right') - 1
+        i = numpy.clip(i, 0, len(resistances) - 1)
+        return temperatures[i] + ((R_T - resistances[i]) * slopes[i])
+
+
+# Front end circuits, convert arrays of ADC counts into thermistor resistances
+
+# The BeBoPr board thermistor input has one side grounded and the other side
+# pulled high through a 2.05K resistor to 3.6V.  Following this is a 470R
+# resistor, some protection diodes, and a voltage divider cosisting of two
+# 10.0K resistors.  The ADC voltage read is the voltage across the lower 10K
+# resistor in the 470R + 10K + 10K series chain
+def adc2r_bebopr(counts):
+    V_adc = counts * 1.8 / 4096.0
+
+    # Voltage across the thermistor (and the 470R + 10K + 10K resistor chain)
+    V_T = V_adc * 2.0470
+
+    # No dividing by zero or negative voltages despite what the ADC says!
+    # Clip to a small positive value
+    I_PU = numpy.maximum((3.6 - V_T) / 2050, 0.000001)
+
+    # Resistance of thermistor and the 470R + 10K + 10K divider chain in parallel
+    R_TD = V_T / I_PU
+
+    # Acutal resistance can't be negative, but we can get a negative value
+    # from the equation below for some real ADC values, so clip to avoid
+    # reporting crazy temperature values or dividing by zero
+    R_TD = numpy.minimum(R_TD, 20470 - 0.1)
+
+    # 1 / Rtotal = 1 / ( 1 / R1 + 1 / R2 )
+    # R2  = ( R1 * Rtotal ) / ( R1 - Rtotal )
+    return (20470 * R_TD) / (20470 - R_TD)
+
+
+# CRAMPS board:  A voltage divider is formed by a pull-up resistor,
+# tied to 1.8V VDD_ADC, and thermistor, tied to ground.  The ADC
+# directly reads the thermistor voltage (V_T).  All the thermistor
+# current flows through the pull-up (I_PU), and those two values are
+# used to calculate the thermistor resistance.  The pull-up resistance
+# R_PU is 2k on the CRAMPS, and may be supplied to reuse this function
+# for custom circuits.  V_adc is 1.8V, and resolution is 12 bits for
+# 4096 possible values.
+def adc2r_cramps(counts, R_PU=2000):
+    # Voltage across the thermistor
+    V_T = counts * 1.8 / 4096.0
+
+    # Current flowing through the pull-up resistor
+    # No dividing by zero or negative voltages despite what the ADC says!
+    # Clip to a small positive value
+    I_PU = numpy.maximum((1.8 - V_T) / R_PU, 0.000001)
+
+    # Resistance of the thermistor
+    return V_T / I_PU
+
+
+# Replicookie baseboard: the thermistor and a pull-down resistor in series
+# form a divider with a pull-up resistor, the ADC full scale is the supply.
+def adc2r_replicookie(counts, R_PU=2000, R_PD=2000):
+    V_T = counts / 4096.0
+    I_PU = numpy.maximum((1 - V_T) / R_PU, 0.000001)
+    return (V_T / I_PU) - R_PD
+
+
+# ADS7828 boards: the thermistor is the lower half of a divider with a
+# 4.7K pull-up resistor, the ADC reference is the divider supply.
+def adc2r_ads7828(counts, R1=4700.0):
+    with numpy.errstate(divide='ignore'):
+        return R1 / numpy.maximum(4095.0 / counts - 1.0, 0.000001)
+
+
+circuits = {'BeBoPr': adc2r_bebopr,
+            'CRAMPS': adc2r_cramps,
+            'Replicookie': adc2r_replicookie,
+            'ADS7828': adc2r_ads7828}
+
+
+def lookupTable(name, circuit, counts=4096, **parameters):
+    # temperature for every ADC count of a thermistor behind a front end
+    # circuit, computed once per process and combination
+    key = (name, circuit, counts, tuple(sorted(parameters.items())))
+    if key not in _lookupTables:
+        with numpy.errstate(invalid='ignore', divide='ignore'):
+            resistances = circuits[circuit](numpy.arange(counts, dtype=float), **parameters)
+        _lookupTables[key] = r2t(name, resistances)
+    return _lookupTables[key]
+
+
+class TempConverter:
+    # Converts the ADC values of a set of channels into temperatures with
+    # one call.  The lookup tables of the channels are placed back to back,
+    # a reading is interpolated between the two neighbouring counts.
+    def __init__(self, tables):
+        self.sizes = numpy.array([len(table) for table in tables])
+        self.offsets = numpy.concatenate(([0], numpy.cumsum(self.sizes)[:-1])).astype(int)
+        self.temperatures = numpy.concatenate([numpy.zeros(0)] + [numpy.asarray(table, dtype=float) for table in tables])
+
+    def convert(self, values):
+        values = numpy.clip(numpy.asarray(values, dtype=float), 0, self.sizes - 1)
+        counts = numpy.minimum(values.astype(int), self.sizes - 2)
+        index = self.offsets + counts
+        low = self.temperatures[index]
+        return low + (values - counts) * (self.temperatures[index + 1] - low)
+
+
 class R2Temp:
     def __init__(self, name):
-        # Thermistor data is loaded at runtime from thermistor_tables folder
         self.thermistor_table_raw = []
         self.thermistor_table = []
         self.R_key = []
@@ -26,38 +201,7 @@ class R2Temp:
         self.R_key = self.thermistor_table[1]
 
     def loadTable(self, name):
-        c = config.Config()
-        localInputFile = os.path.join(os.getcwd(), 'thermistor_tables', name + '.txt')
-        systemInputFile = os.path.join(c.datadir, 'fdm', 'thermistor_tables', name + '.txt')
-        
-        if os.path.exists(name):
-            inputFile = name
-        elif os.path.exists(localInputFile):
-            inputFile = localInputFile
-        elif os.path.exists(systemInputFile):
-            inputFile = systemInputFile
-        else:
-            raise RuntimeError('Thermistor table was not found')
-        
-        with open(inputFile, "r") as f:
-            self.thermistor_table_raw = []
-            content = f.readlines()
-            for line in content:
-                line = ' '.join(line.split())
-                if ((len(line) == 0) or (line[0] == '#')):
-                    continue
-                datas = line.split(' ')
-                tableEntry = []
-                for data in datas:
-                    tableEntry.append(float(data))
-                self.thermistor_table_raw.append(tableEntry)
-
-        if len(self.thermistor_table_raw) == 0:
-            return
-
-        # Temperature table needs resistance to be ordered low [0] to high [n]
-        if (self.thermistor_table_raw[0][0] < self.thermistor_table_raw[-1][0]):
-            self.thermistor_table_raw.reverse()
+        self.thermistor_table_raw = loadTable(name)
 
     # Convert resistance value into temperature, using thermistor_table table
     def r2t(self, R_T):
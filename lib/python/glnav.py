@@ -277,16 +277,20 @@ class GlNavBase:
         self.activate()
 
         # Scale mouse translations to object viewplane so object tracks with mouse
+        scale = self.pixel_size()
+
+        glTranslateScene(self, scale, x, y, self.xmouse, self.ymouse)
+        self._redraw()
+        self.recordMouse(x, y)
+
+    def pixel_size(self):
+        """Size of a pixel in object units at the center of the view."""
         win_height = max( 1,self.winfo_height() )
         obj_c     = ( self.xcenter, self.ycenter, self.zcenter )
         win     = gluProject( obj_c[0], obj_c[1], obj_c[2])
         obj     = gluUnProject( win[0], win[1] + 0.5 * win_height, win[2])
         dist       = math.sqrt( v3distsq( obj, obj_c ) )
-        scale     = abs( dist / ( 0.5 * win_height ) )
-
-        glTranslateScene(self, scale, x, y, self.xmouse, self.ymouse)
-        self._redraw()
-        self.recordMouse(x, y)
+        return abs( dist / ( 0.5 * win_height ) )
 
 
     def set_viewangle(self, lat, lon):
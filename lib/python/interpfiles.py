@@ -0,0 +1,76 @@
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+# Files besides the program the interpreter may read while it runs a
+# program: O-word subroutines and remap code.  Which of them a program
+# uses is not known beforehand, so all files in the places the interpreter
+# searches are returned.  Used by the AXIS preview cache and the mkwrapper
+# preview replay to decide whether an earlier preview is still valid.
+#
+# The module lives outside the rs274 package, whose __init__ imports the
+# gcode interpreter module: mkwrapper must load no interpreter module but
+# preview, and that one only in its worker process.
+
+import os
+
+import linuxcnc
+
+def list_files(directory, extension, recursive=False):
+    files = []
+    for root, dirs, names in os.walk(directory):
+        files.extend(os.path.join(root, name) for name in names
+                     if name.endswith(extension))
+        if not recursive: break
+    return files
+
+def interpreter_files(inifile):
+    # searched in the same places as the interpreter does
+    if not inifile or not os.path.isfile(inifile):
+        return []
+    ini = linuxcnc.ini(inifile)
+    def directory(path):
+        return os.path.realpath(os.path.expanduser(path))
+
+    files = []
+    subroutine_dirs = [ini.find('DISPLAY', 'PROGRAM_PREFIX') or '']
+    subroutine_dirs += (ini.find('RS274NGC', 'SUBROUTINE_PATH') or '').split(':')
+    for path in subroutine_dirs:
+        if path:
+            files += list_files(directory(path), '.ngc')
+    wizard_root = ini.find('WIZARD', 'WIZARD_ROOT')
+    if wizard_root:
+        files += list_files(directory(wizard_root), '.ngc', recursive=True)
+
+    # remaps and O-word subroutines written in Python
+    toplevel = ini.find('PYTHON', 'TOPLEVEL')
+    if toplevel:
+        python_dirs = [os.path.dirname(directory(toplevel))]
+        python_dirs += ini.findall('PYTHON', 'PATH_PREPEND') or []
+        python_dirs += ini.findall('PYTHON', 'PATH_APPEND') or []
+        for path in python_dirs:
+            files += list_files(directory(path), '.py')
+    return sorted(set(files))
+
+def interpreter_file_stats(inifile):
+    # (path, size, modification time) of the INI file and of every file
+    # returned by interpreter_files, changes when any of them changes
+    stats = []
+    paths = [inifile] if inifile else []
+    for path in paths + interpreter_files(inifile):
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        stats.append((path, st.st_size, st.st_mtime))
+    return tuple(stats)
@@ -122,9 +122,20 @@ class Event:
 	if isinstance(f, int):
 	    buf = os.read(f, cls.size)
 	else:
-	    buf = f.read(size)
+	    buf = f.read(cls.size)
 	return cls(buf)
 
+    # read up to count events with one read, the kernel only returns
+    # complete events
+    @classmethod
+    def read_many(cls, f, count=64):
+	if isinstance(f, int):
+	    buf = os.read(f, cls.size * count)
+	else:
+	    buf = f.read(cls.size * count)
+	size = cls.size
+	return [cls(buf[i:i+size]) for i in range(0, len(buf) - size + 1, size)]
+
     @classmethod
     def write(cls, f, *args):
 	if len(args) == 3:
@@ -864,11 +875,20 @@ class InputDevice:
     def get_absinfo(self, arg): return AbsInfo.get(self.f, arg)
     def read_event(self):
 	e = Event.read(self.f)
+	self.decode_event(e)
+	return e
+
+    # the events available, at most count, with a single read
+    def read_events(self, count=64):
+	events = Event.read_many(self.f, count)
+	for e in events: self.decode_event(e)
+	return events
+
+    def decode_event(self, e):
 	if e.type == 'EV_KEY': e.code = decode(KEYBTN_invert, 'KEY', e.code)
 	elif e.type == 'EV_ABS': e.code = decode(ABS_invert, 'ABS', e.code)
 	elif e.type == 'EV_REL': e.code = decode(REL_invert, 'REL', e.code)
 	elif e.type == 'EV_LED': e.code = decode(LED_invert, 'LED', e.code)
-	return e
 
     def write_event(self, *args):
 	Event.write(self.f, *args)
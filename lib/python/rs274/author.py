@@ -313,7 +313,12 @@ that the last 'cut' coordinate is actually in the output file, and it may
 give better performance because this means that the simplification algorithm
 will examine fewer points per run."""
         if not self.cuts: return
-        for move, (x, y, z), cent in douglas(self.cuts, self.tolerance, self.plane):
+        self.write_moves(douglas(self.cuts, self.tolerance, self.plane))
+        self.cuts = []
+
+    def write_moves(self, moves):
+	"Output moves as returned by the simplification algorithm"
+        for move, (x, y, z), cent in moves:
 	    if cent:
 		self.write("%s X%.4f Y%.4f Z%.4f %s" % (move, x, y, z, cent))
 		self.lastgcode = None
@@ -322,7 +327,6 @@ will examine fewer points per run."""
 		self.lastz = z
 	    else:
 		self.move_common(x, y, z, gcode="G1")
-        self.cuts = []
 
     def end(self):
 	"""End the program"""
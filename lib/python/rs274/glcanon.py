@@ -16,7 +16,9 @@
 #    Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
 
 from rs274 import Translated, ArcsToSegmentsMixin, OpenGLTk
+from rs274.segments import SegmentList
 from minigl import *
+import minigl
 import math
 import glnav
 import hershey
@@ -24,6 +26,11 @@ import linuxcnc
 import array
 import gcode
 
+try:
+    from rs274.toolpath import ToolpathBuffer, available as vertex_buffers
+except ImportError:
+    vertex_buffers = False
+
 def minmax(*args):
     return min(*args), max(*args)
 
@@ -40,15 +47,24 @@ limiticon = array.array('B',
 
 class GLCanon(Translated, ArcsToSegmentsMixin):
     lineno = -1
+    # when chunk_callback is set, it is called as chunk_callback(canon,
+    # first, last) every chunk_size moves while the program is parsed.
+    # first and last are the (traverse, feed, arcfeed, dwell) counts
+    # before and after the chunk.
+    chunk_size = 0
+    chunk_callback = None
     def __init__(self, colors, geometry, is_foam=0):
         # traverse list - [line number, [start position], [end position], [tlo x, tlo y, tlo z]]
-        self.traverse = []; self.traverse_append = self.traverse.append
+        self.traverse = SegmentList(has_feedrate=False)
+        self.traverse_append = self.traverse.append
         # feed list - [line number, [start position], [end position], feedrate, [tlo x, tlo y, tlo z]]
-        self.feed = []; self.feed_append = self.feed.append
+        self.feed = SegmentList(); self.feed_append = self.feed.append
         # arcfeed list - [line number, [start position], [end position], feedrate, [tlo x, tlo y, tlo z]]
-        self.arcfeed = []; self.arcfeed_append = self.arcfeed.append
+        self.arcfeed = SegmentList(); self.arcfeed_append = self.arcfeed.append
         # dwell list - [line number, color, pos x, pos y, pos z, plane]
         self.dwells = []; self.dwells_append = self.dwells.append
+        # line number -> indices into the dwell list
+        self.dwell_index = {}
         self.choice = None
         self.feedrate = 1
         self.lo = (0,) * 9
@@ -58,6 +74,12 @@ class GLCanon(Translated, ArcsToSegmentsMixin):
         self.max_extents = [-9e99,-9e99,-9e99]
         self.min_extents_notool = [9e99,9e99,9e99]
         self.max_extents_notool = [-9e99,-9e99,-9e99]
+        # running extents and the number of segments of the traverse, feed
+        # and arcfeed lists they include
+        self.extents = [[9e99,9e99,9e99], [-9e99,-9e99,-9e99],
+                        [9e99,9e99,9e99], [-9e99,-9e99,-9e99]]
+        self.extents_done = [0, 0, 0]
+        self.chunk_marks = (0, 0, 0, 0)
         self.colors = colors
         self.in_arc = 0
         self.xo = self.yo = self.zo = self.ao = self.bo = self.co = self.uo = self.vo = self.wo = 0
@@ -125,8 +147,25 @@ class GLCanon(Translated, ArcsToSegmentsMixin):
     def next_line(self, st):
         self.state = st
         self.lineno = self.state.sequence_number
+        if self.chunk_callback is not None:
+            t, f, a, d = self.chunk_marks
+            if (len(self.traverse) + len(self.feed) + len(self.arcfeed)
+                    - t - f - a >= self.chunk_size):
+                self.publish_chunk()
+
+    def publish_chunk(self):
+        first = self.chunk_marks
+        last = (len(self.traverse), len(self.feed), len(self.arcfeed),
+                len(self.dwells))
+        if last == first: return
+        self.chunk_marks = last
+        self.calc_extents()
+        self.chunk_callback(self, first, last)
 
     def draw_lines(self, lines, for_selection, j=0, geometry=None):
+        if isinstance(lines, SegmentList):
+            return linuxcnc.draw_segments(geometry or self.geometry,
+                    lines.pos, lines.start, lines.lineno, for_selection)
         return linuxcnc.draw_lines(geometry or self.geometry, lines, for_selection)
 
     def colored_lines(self, color, lines, for_selection, j=0):
@@ -152,7 +191,14 @@ class GLCanon(Translated, ArcsToSegmentsMixin):
         return linuxcnc.draw_dwells(self.geometry, dwells, alpha, for_selection, self.is_lathe())
 
     def calc_extents(self):
-        self.min_extents, self.max_extents, self.min_extents_notool, self.max_extents_notool = gcode.calc_extents(self.arcfeed, self.feed, self.traverse)
+        # only the segments added since the last call are looked at, so
+        # this is cheap to call repeatedly while the program is parsed
+        extents = self.extents
+        done = self.extents_done
+        for i, segments in enumerate((self.traverse, self.feed, self.arcfeed)):
+            segments.update_extents(extents, done[i])
+            done[i] = len(segments)
+        self.min_extents, self.max_extents, self.min_extents_notool, self.max_extents_notool = [e[:] for e in extents]
         if self.is_foam:
             min_z = min(self.foam_z, self.foam_w)
             max_z = max(self.foam_z, self.foam_w)
@@ -188,7 +234,7 @@ class GLCanon(Translated, ArcsToSegmentsMixin):
         if self.suppress > 0: return
         l = self.rotate_and_translate(x,y,z,a,b,c,u,v,w)
         if not self.first_move:
-                self.traverse_append((self.lineno, self.lo, l, [self.xo, self.yo, self.zo]))
+                self.traverse_append(self.lineno, self.lo, l, 0, (self.xo, self.yo, self.zo))
         self.lo = l
 
     def rigid_tap(self, x, y, z):
@@ -197,9 +243,9 @@ class GLCanon(Translated, ArcsToSegmentsMixin):
         l = self.rotate_and_translate(x,y,z,0,0,0,0,0,0)[:3]
         l += [self.lo[3], self.lo[4], self.lo[5],
                self.lo[6], self.lo[7], self.lo[8]]
-        self.feed_append((self.lineno, self.lo, l, self.feedrate, [self.xo, self.yo, self.zo]))
+        self.feed_append(self.lineno, self.lo, l, self.feedrate, (self.xo, self.yo, self.zo))
 #        self.dwells_append((self.lineno, self.colors['dwell'], x + self.offset_x, y + self.offset_y, z + self.offset_z, 0))
-        self.feed_append((self.lineno, l, self.lo, self.feedrate, [self.xo, self.yo, self.zo]))
+        self.feed_append(self.lineno, l, self.lo, self.feedrate, (self.xo, self.yo, self.zo))
 
     def arc_feed(self, *args):
         if self.suppress > 0: return
@@ -212,34 +258,33 @@ class GLCanon(Translated, ArcsToSegmentsMixin):
 
     def straight_arcsegments(self, segs):
         self.first_move = False
-        lo = self.lo
-        lineno = self.lineno
-        feedrate = self.feedrate
-        to = [self.xo, self.yo, self.zo]
-        append = self.arcfeed_append
-        for l in segs:
-            append((lineno, lo, l, feedrate, to))
-            lo = l
-        self.lo = lo
+        self.arcfeed.extend_polyline(self.lineno, self.lo, segs, self.feedrate,
+                                     (self.xo, self.yo, self.zo))
+        if segs:
+            self.lo = segs[-1]
 
     def straight_feed(self, x,y,z, a,b,c, u, v, w):
         if self.suppress > 0: return
         self.first_move = False
         l = self.rotate_and_translate(x,y,z,a,b,c,u,v,w)
-        self.feed_append((self.lineno, self.lo, l, self.feedrate, [self.xo, self.yo, self.zo]))
+        self.feed_append(self.lineno, self.lo, l, self.feedrate, (self.xo, self.yo, self.zo))
         self.lo = l
     straight_probe = straight_feed
 
     def user_defined_function(self, i, p, q):
         if self.suppress > 0: return
         color = self.colors['m1xx']
-        self.dwells_append((self.lineno, color, self.lo[0], self.lo[1], self.lo[2], self.state.plane/10-17))
+        self.append_dwell((self.lineno, color, self.lo[0], self.lo[1], self.lo[2], self.state.plane/10-17))
 
     def dwell(self, arg):
         if self.suppress > 0: return
         self.dwell_time += arg
         color = self.colors['dwell']
-        self.dwells_append((self.lineno, color, self.lo[0], self.lo[1], self.lo[2], self.state.plane/10-17))
+        self.append_dwell((self.lineno, color, self.lo[0], self.lo[1], self.lo[2], self.state.plane/10-17))
+
+    def append_dwell(self, dwell):
+        self.dwell_index.setdefault(dwell[0], []).append(len(self.dwells))
+        self.dwells_append(dwell)
 
 
     def highlight(self, lineno, geometry):
@@ -248,24 +293,17 @@ class GLCanon(Translated, ArcsToSegmentsMixin):
         glColor3f(*c)
         glBegin(GL_LINES)
         coords = []
-        for line in self.traverse:
-            if line[0] != lineno: continue
-            linuxcnc.line9(geometry, line[1], line[2])
-            coords.append(line[1][:3])
-            coords.append(line[2][:3])
-        for line in self.arcfeed:
-            if line[0] != lineno: continue
-            linuxcnc.line9(geometry, line[1], line[2])
-            coords.append(line[1][:3])
-            coords.append(line[2][:3])
-        for line in self.feed:
-            if line[0] != lineno: continue
-            linuxcnc.line9(geometry, line[1], line[2])
-            coords.append(line[1][:3])
-            coords.append(line[2][:3])
+        for segments in self.traverse, self.arcfeed, self.feed:
+            for i in segments.segments_for_line(lineno):
+                v = segments.start[i]
+                p1 = segments.point(v)
+                p2 = segments.point(v + 1)
+                linuxcnc.line9(geometry, p1, p2)
+                coords.append(p1[:3])
+                coords.append(p2[:3])
         glEnd()
-        for line in self.dwells:
-            if line[0] != lineno: continue
+        for i in self.dwell_index.get(lineno, ()):
+            line = self.dwells[i]
             self.draw_dwells([(line[0], c) + line[2:]], 2, 0)
             coords.append(line[2:5])
         glLineWidth(1)
@@ -284,18 +322,27 @@ class GLCanon(Translated, ArcsToSegmentsMixin):
     def color(self, name):
         glColor3f(*self.colors[name])
 
-    def draw(self, for_selection=0, no_traverse=True):
+    def draw(self, for_selection=0, no_traverse=True, chunk=None):
+        traverse, feed, arcfeed, dwells = \
+            self.traverse, self.feed, self.arcfeed, self.dwells
+        if chunk is not None:
+            # only draw the moves of one chunk published while parsing
+            (t0, f0, a0, d0), (t1, f1, a1, d1) = chunk
+            traverse = traverse.window(t0, t1)
+            feed = feed.window(f0, f1)
+            arcfeed = arcfeed.window(a0, a1)
+            dwells = dwells[d0:d1]
         if not no_traverse:
             glEnable(GL_LINE_STIPPLE)
-            self.colored_lines('traverse', self.traverse, for_selection)
+            self.colored_lines('traverse', traverse, for_selection)
             glDisable(GL_LINE_STIPPLE)
         else:
-            self.colored_lines('straight_feed', self.feed, for_selection, len(self.traverse))
+            self.colored_lines('straight_feed', feed, for_selection, len(traverse))
 
-            self.colored_lines('arc_feed', self.arcfeed, for_selection, len(self.traverse) + len(self.feed))
+            self.colored_lines('arc_feed', arcfeed, for_selection, len(traverse) + len(feed))
 
             glLineWidth(2)
-            self.draw_dwells(self.dwells, self.colors.get('dwell_alpha', 1/3.), for_selection, len(self.traverse) + len(self.feed) + len(self.arcfeed))
+            self.draw_dwells(dwells, self.colors.get('dwell_alpha', 1/3.), for_selection, len(traverse) + len(feed) + len(arcfeed))
             glLineWidth(1)
 
 def with_context(f):
@@ -373,12 +420,24 @@ class GlCanonDraw:
         'axis_y': (1.00, 0.20, 0.20),
         'grid': (0.15, 0.15, 0.15),
     }
+    # rs274.previewcache.PreviewCache used by load_preview, if any
+    preview_cache = None
+    # number of moves after which the part of the program parsed so far is
+    # shown while load_preview runs, 0 to only show the complete program
+    preview_chunk_size = 0
+    preview_chunks = None
+    # draw the program from a vertex buffer and pick lines without
+    # rendering, instead of using display lists and GL_SELECT
+    use_vertex_buffers = vertex_buffers
+
     def __init__(self, s, lp, g=None):
         self.stat = s
         self.lp = lp
         self.canon = g
         self._dlists = {}
         self.select_buffer_size = 100
+        self.toolpath = None
+        self.toolpath_canon = None
         self.cached_tool = -1
         self.initialised = 0
 
@@ -406,6 +465,10 @@ class GlCanonDraw:
 
     def select(self, x, y):
         if self.canon is None: return
+        toolpath = self.get_toolpath()
+        if toolpath is not None:
+            self.select_toolpath(toolpath, x, y)
+            return
         pmatrix = glGetDoublev(GL_PROJECTION_MATRIX)
         glMatrixMode(GL_PROJECTION)
         glPushMatrix()
@@ -442,6 +505,43 @@ class GlCanonDraw:
         glPopMatrix()
         glMatrixMode(GL_MODELVIEW)
 
+    def select_toolpath(self, toolpath, x, y):
+        vport = glGetIntegerv(GL_VIEWPORT)
+        y = vport[3] - y
+        near = gluUnProject(x, y, 0.)
+        far = gluUnProject(x, y, 1.)
+        # the same 5x5 pixel pick region as select(), measured at the
+        # depth of the middle of the program
+        mid, size = self.extents_info()
+        depth = gluProject(*mid)[2]
+        p = gluUnProject(x, y, depth)
+        q = gluUnProject(x + 2.5, y, depth)
+        radius = math.sqrt(sum((a - b) ** 2 for a, b in zip(p, q)))
+        direction = [b - a for a, b in zip(near, far)]
+        self.set_highlight_line(toolpath.pick(near, direction, radius,
+                                              self.get_show_rapids()))
+
+    def get_toolpath(self):
+        if self.toolpath is not None and self.toolpath_canon is self.canon:
+            return self.toolpath
+        self.stale_toolpath()
+        if (not self.use_vertex_buffers or self.canon is None
+                or self.canon.is_foam or self.preview_chunks is not None):
+            return None
+        try:
+            self.toolpath = ToolpathBuffer(self.canon)
+        except minigl.error:
+            # no vertex buffer support, keep using display lists
+            self.use_vertex_buffers = False
+            return None
+        self.toolpath_canon = self.canon
+        return self.toolpath
+
+    def stale_toolpath(self):
+        if self.toolpath is None: return
+        self.toolpath.delete()
+        self.toolpath = self.toolpath_canon = None
+
     def dlist(self, name, n=1, gen=lambda n: None):
         if name not in self._dlists:
             base = glGenLists(n)
@@ -457,6 +557,7 @@ class GlCanonDraw:
     def __del__(self):
         for base, count in self._dlists.values():
             glDeleteLists(base, count)
+        self.stale_toolpath()
 
     def update_highlight_variable(self,line):
         self.highlight_line = line
@@ -930,9 +1031,15 @@ class GlCanonDraw:
                 glEnable(GL_BLEND)
                 glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
 
-            if self.get_show_rapids():
-                glCallList(self.dlist('program_rapids', gen=self.make_main_list))
-            glCallList(self.dlist('program_norapids', gen=self.make_main_list))
+            toolpath = self.get_toolpath()
+            if toolpath is not None:
+                if self.get_show_rapids():
+                    toolpath.draw(True)
+                toolpath.draw(False, self.pixel_size())
+            else:
+                if self.get_show_rapids():
+                    glCallList(self.dlist('program_rapids', gen=self.make_main_list))
+                glCallList(self.dlist('program_norapids', gen=self.make_main_list))
             glCallList(self.dlist('highlight'))
 
             if self.get_program_alpha():
@@ -1585,6 +1692,20 @@ class GlCanonDraw:
     def make_main_list(self, unused=None):
         program = self.dlist('program_norapids')
         rapids = self.dlist('program_rapids')
+        if self.preview_chunks is not None:
+            # still loading: each chunk gets its own lists so that chunks
+            # already compiled are not drawn again
+            chunks = [self.dlist(('preview_chunk', i), 2,
+                                 gen=lambda n, c=chunk: self.make_chunk_list(n, c))
+                      for i, chunk in enumerate(self.preview_chunks)]
+            glNewList(program, GL_COMPILE)
+            for base in chunks: glCallList(base)
+            glEndList()
+            glNewList(rapids, GL_COMPILE)
+            for base in chunks: glCallList(base + 1)
+            glEndList()
+            return
+
         glNewList(program, GL_COMPILE)
         if self.canon: self.canon.draw(0, True)
         glEndList()
@@ -1593,17 +1714,68 @@ class GlCanonDraw:
         if self.canon: self.canon.draw(0, False)
         glEndList()
 
+    def make_chunk_list(self, base, chunk):
+        glNewList(base, GL_COMPILE)
+        self.canon.draw(0, True, chunk)
+        glEndList()
+        glNewList(base + 1, GL_COMPILE)
+        self.canon.draw(0, False, chunk)
+        glEndList()
+
+    def preview_chunk(self, canon, first, last):
+        self.preview_chunks.append((first, last))
+        self.stale_dlist('program_rapids')
+        self.stale_dlist('program_norapids')
+        self.preview_chunk_ready()
+
+    def preview_chunk_ready(self):
+        """Called when part of the program has been added to the preview
+        while it is loading; redraw the preview to show it."""
+        pass
+
+    def end_preview_chunks(self):
+        if self.preview_chunks is None: return
+        for i in range(len(self.preview_chunks)):
+            self.stale_dlist(('preview_chunk', i))
+        self.preview_chunks = None
+
     def load_preview(self, f, canon, unitcode, initcode, interpname=""):
         self.set_canon(canon)
-        result, seq = gcode.parse(f, canon, unitcode, initcode, interpname)
+
+        key = None
+        cached = None
+        if self.preview_cache is not None:
+            key = self.preview_cache.key(f, canon, unitcode, initcode, interpname)
+            cached = self.preview_cache.load(key, canon)
+
+        if cached is not None:
+            result, seq = cached
+        elif self.preview_chunk_size > 0:
+            self.preview_chunks = []
+            canon.chunk_size = self.preview_chunk_size
+            canon.chunk_callback = self.preview_chunk
+            try:
+                result, seq = gcode.parse(f, canon, unitcode, initcode, interpname)
+            finally:
+                canon.chunk_callback = None
+                self.end_preview_chunks()
+                self.stale_dlist('program_rapids')
+                self.stale_dlist('program_norapids')
+        else:
+            result, seq = gcode.parse(f, canon, unitcode, initcode, interpname)
 
         if result <= gcode.MIN_ERROR:
             self.canon.progress.nextphase(1)
-            canon.calc_extents()
+            if cached is None:
+                canon.calc_extents()
             self.stale_dlist('program_rapids')
             self.stale_dlist('program_norapids')
             self.stale_dlist('select_rapids')
             self.stale_dlist('select_norapids')
+            self.stale_toolpath()
+
+        if key is not None and cached is None:
+            self.preview_cache.store(key, canon, result, seq)
 
         return result, seq
 
@@ -0,0 +1,171 @@
+#    This is a component of AXIS, a front-end for emc
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+import os
+import sys
+import cPickle
+import hashlib
+import tempfile
+
+from interpfiles import interpreter_file_stats
+from rs274.segments import SegmentList
+
+# On-disk cache of the moves collected by GLCanon.
+#
+# An entry is keyed by a hash of the program, the unit and startup code,
+# the parameter file, the tool table, the block delete state, axis mask
+# and units of the machine and the INI file, which holds the remap
+# configuration.  O-word subroutines and remap code live in files
+# of their own; as the files a preview opens are not known beforehand,
+# the size and modification time of every file the interpreter could load
+# from the subroutine and Python directories of the INI file go into the
+# key as well.  Python modules imported from elsewhere are not covered.
+# Entries hold the segment arrays, dwells, extents and the parse result,
+# and are evicted least recently used first once the cache directory
+# grows beyond max_size bytes.
+
+FORMAT = "machinekit-preview-1 %s" % sys.byteorder
+
+def default_directory():
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(base, 'machinekit', 'preview')
+
+def hash_file(h, filename):
+    try:
+        f = open(filename, 'rb')
+    except IOError:
+        h.update('\0')
+        return
+    with f:
+        while True:
+            chunk = f.read(1 << 20)
+            if not chunk: break
+            h.update(chunk)
+
+def canon_value(canon, name):
+    method = getattr(canon, name, None)
+    if method is None: return None
+    return method()
+
+class PreviewCache:
+    canon_state = ('dwells', 'dwell_index', 'dwell_time', 'foam_z', 'foam_w',
+                   'min_extents', 'max_extents',
+                   'min_extents_notool', 'max_extents_notool')
+
+    def __init__(self, directory=None, max_size=256*1024*1024, inifile=None):
+        self.directory = directory or default_directory()
+        self.max_size = max_size
+        # the interpreter reads the INI file named in the environment
+        self.inifile = inifile or os.environ.get('INI_FILE_NAME')
+
+    def key(self, filename, canon, unitcode, initcode, interpname=""):
+        h = hashlib.sha1(FORMAT)
+        hash_file(h, filename)
+        h.update(repr((unitcode, initcode, interpname,
+                       canon.__class__.__name__,
+                       getattr(canon, 'arcdivision', None),
+                       getattr(canon, 'is_foam', None),
+                       getattr(canon, 'random', None),
+                       [tuple(t) for t in getattr(canon, 'tools', ())],
+                       # machine state the interpreter asks the canon for
+                       canon_value(canon, 'get_block_delete'),
+                       canon_value(canon, 'get_axis_mask'),
+                       canon_value(canon, 'get_external_length_units'),
+                       canon_value(canon, 'get_external_angular_units'))))
+        parameter_file = getattr(canon, 'parameter_file', None)
+        if parameter_file:
+            hash_file(h, parameter_file)
+        if self.inifile:
+            hash_file(h, self.inifile)
+        h.update(repr(interpreter_file_stats(self.inifile)))
+        return h.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.preview')
+
+    def load(self, key, canon):
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                header = cPickle.load(f)
+                if header.get('format') != FORMAT: return None
+                traverse = SegmentList.read(f)
+                feed = SegmentList.read(f)
+                arcfeed = SegmentList.read(f)
+        except (IOError, EOFError, ValueError, KeyError,
+                cPickle.UnpicklingError):
+            return None
+        try:
+            os.utime(path, None)    # mark as recently used
+        except OSError:
+            pass
+
+        canon.traverse = traverse
+        canon.traverse_append = traverse.append
+        canon.feed = feed
+        canon.feed_append = feed.append
+        canon.arcfeed = arcfeed
+        canon.arcfeed_append = arcfeed.append
+        for name in self.canon_state:
+            setattr(canon, name, header[name])
+        canon.dwells_append = canon.dwells.append
+        return header['result'], header['seq']
+
+    def store(self, key, canon, result, seq):
+        header = dict((name, getattr(canon, name)) for name in self.canon_state)
+        header['format'] = FORMAT
+        header['result'] = result
+        header['seq'] = seq
+        temp = None
+        try:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            fd, temp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                cPickle.dump(header, f, 2)
+                canon.traverse.write(f)
+                canon.feed.write(f)
+                canon.arcfeed.write(f)
+            os.rename(temp, self.path(key))
+        except (IOError, OSError), detail:
+            print >>sys.stderr, "preview cache: %s" % detail
+            if temp and os.path.exists(temp):
+                os.unlink(temp)
+            return
+        self.evict()
+
+    def evict(self):
+        entries = []
+        total = 0
+        for name in os.listdir(self.directory):
+            if not name.endswith('.preview'): continue
+            path = os.path.join(self.directory, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+        entries.sort()
+        while total > self.max_size and entries:
+            mtime, size, path = entries.pop(0)
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+            total -= size
+
+# vim:ts=8:sts=4:sw=4:et:
@@ -0,0 +1,208 @@
+#    This is a component of AXIS, a front-end for emc
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+import array
+import bisect
+import cPickle
+
+# Columnar storage for the moves collected by GLCanon.
+#
+# Consecutive moves of a program nearly always continue where the previous
+# one ended, so the positions are stored as a chain of 9-axis vertices and
+# each segment only records the index of its start vertex; the end vertex
+# is always the next one.  A new start vertex is only added when a segment
+# does not continue the previous one.  Tool length offsets change rarely
+# and are stored as runs.  A feed segment costs 88 bytes (80 for a
+# traverse) plus 72 bytes for every break in the chain, compared to
+# several hundred bytes for the tuple of lists used before.
+#
+# The segments of each source line are indexed as ranges while they are
+# collected, so that looking up the moves of one line (highlighting,
+# selection) does not depend on the size of the program.
+#
+# Indexing still returns the old tuple format
+#   (line number, start position, end position, [feedrate,] [tlo x, y, z])
+# so that code walking the segment lists keeps working.
+
+class SegmentList(object):
+    def __init__(self, has_feedrate=True):
+        self.has_feedrate = has_feedrate
+        self.pos = array.array('d')      # 9 coordinates per vertex
+        self.start = array.array('i')    # start vertex of each segment
+        self.lineno = array.array('i')
+        self.feedrate = array.array('d')
+        self.tlo_first = []              # first segment of each tlo run
+        self.tlo = []                    # (x, y, z) of each tlo run
+        self.last = None                 # end position of the last segment
+        self.line_ranges = {}            # line number -> [first, end, ...]
+        self.last_lineno = None
+
+    def __len__(self):
+        return len(self.start)
+
+    def __nonzero__(self):
+        return len(self.start) > 0
+
+    def _begin(self, p1, tlo):
+        p1 = tuple(p1)
+        if p1 != self.last:
+            self.pos.extend(p1)
+        tlo = tuple(tlo)
+        if not self.tlo or self.tlo[-1] != tlo:
+            self.tlo_first.append(len(self.start))
+            self.tlo.append(tlo)
+
+    def _index(self, lineno, n):
+        if lineno == self.last_lineno:
+            self.line_ranges[lineno][-1] += n
+        else:
+            first = len(self.start)
+            self.line_ranges.setdefault(lineno, []).extend((first, first + n))
+            self.last_lineno = lineno
+
+    def append(self, lineno, p1, p2, feedrate=0.0, tlo=(0.0, 0.0, 0.0)):
+        self._begin(p1, tlo)
+        self._index(lineno, 1)
+        self.start.append(len(self.pos) // 9 - 1)
+        self.lineno.append(lineno)
+        if self.has_feedrate:
+            self.feedrate.append(feedrate)
+        p2 = tuple(p2)
+        self.pos.extend(p2)
+        self.last = p2
+
+    def extend_polyline(self, lineno, p1, points, feedrate=0.0,
+                        tlo=(0.0, 0.0, 0.0)):
+        if not points:
+            return
+        self._begin(p1, tlo)
+        first = len(self.pos) // 9 - 1
+        n = len(points)
+        self._index(lineno, n)
+        self.start.extend(xrange(first, first + n))
+        self.lineno.extend([lineno] * n)
+        if self.has_feedrate:
+            self.feedrate.extend([feedrate] * n)
+        pos = self.pos
+        for p in points:
+            pos.extend(p)
+        self.last = tuple(points[-1])
+
+    def segments_for_line(self, lineno):
+        ranges = self.line_ranges.get(lineno, ())
+        for i in range(0, len(ranges), 2):
+            for j in xrange(ranges[i], ranges[i + 1]):
+                yield j
+
+    def point(self, vertex):
+        return tuple(self.pos[9 * vertex:9 * vertex + 9])
+
+    def get_tlo(self, i):
+        return self.tlo[bisect.bisect_right(self.tlo_first, i) - 1]
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self.start)
+        if i < 0 or i >= len(self.start):
+            raise IndexError("segment index out of range")
+        s = self.start[i]
+        tlo = list(self.get_tlo(i))
+        if self.has_feedrate:
+            return (self.lineno[i], self.point(s), self.point(s + 1),
+                    self.feedrate[i], tlo)
+        return self.lineno[i], self.point(s), self.point(s + 1), tlo
+
+    def __iter__(self):
+        for i in xrange(len(self.start)):
+            yield self[i]
+
+    def window(self, first, last):
+        # the segments first..last-1 as a SegmentList sharing the vertices,
+        # for drawing part of the list
+        segments = SegmentList(has_feedrate=False)
+        segments.pos = self.pos
+        segments.start = self.start[first:last]
+        segments.lineno = self.lineno[first:last]
+        return segments
+
+    def update_extents(self, extents, start=0):
+        # extents: [min, max, min with tlo, max with tlo], 3 lists each
+        # only the segments from index start on are taken into account
+        mn, mx, mnt, mxt = extents
+        nseg = len(self.start)
+        firsts = self.tlo_first + [nseg]
+        for run, tlo in enumerate(self.tlo):
+            first, last = max(firsts[run], start), firsts[run + 1] - 1
+            if last < first:
+                continue
+            v0 = self.start[first]
+            v1 = self.start[last] + 1
+            chunk = self.pos[9 * v0:9 * v1 + 9]
+            for axis in range(3):
+                values = chunk[axis::9]
+                lo = min(values)
+                hi = max(values)
+                mn[axis] = min(mn[axis], lo)
+                mx[axis] = max(mx[axis], hi)
+                mnt[axis] = min(mnt[axis], lo + tlo[axis])
+                mxt[axis] = max(mxt[axis], hi + tlo[axis])
+        return extents
+
+    def totals(self, max_feedrate):
+        # returns the xyz distance and the time it takes at the programmed
+        # feedrate, limited to max_feedrate
+        distance = time = 0.0
+        pos = self.pos
+        feedrate = self.feedrate
+        for i, v in enumerate(self.start):
+            b = 9 * v
+            d = ((pos[b+9] - pos[b]) ** 2 + (pos[b+10] - pos[b+1]) ** 2
+                 + (pos[b+11] - pos[b+2]) ** 2) ** .5
+            distance += d
+            if self.has_feedrate:
+                time += d / min(max_feedrate, feedrate[i])
+            else:
+                time += d / max_feedrate
+        return distance, time
+
+    arrays = ('pos', 'start', 'lineno', 'feedrate')
+    state = ('has_feedrate', 'tlo_first', 'tlo', 'last', 'line_ranges',
+             'last_lineno')
+
+    def write(self, f):
+        header = dict((name, getattr(self, name)) for name in self.state)
+        header['sizes'] = [len(getattr(self, name)) for name in self.arrays]
+        cPickle.dump(header, f, 2)
+        for name in self.arrays:
+            getattr(self, name).tofile(f)
+
+    @classmethod
+    def read(cls, f):
+        header = cPickle.load(f)
+        segments = cls(header['has_feedrate'])
+        for name in cls.state:
+            setattr(segments, name, header[name])
+        for name, size in zip(cls.arrays, header['sizes']):
+            getattr(segments, name).fromfile(f, size)
+        return segments
+
+    def memory_usage(self):
+        return (self.pos.itemsize * len(self.pos)
+                + self.start.itemsize * len(self.start)
+                + self.lineno.itemsize * len(self.lineno)
+                + self.feedrate.itemsize * len(self.feedrate))
+
+# vim:ts=8:sts=4:sw=4:et:
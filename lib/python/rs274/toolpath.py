@@ -0,0 +1,332 @@
+#    This is a component of AXIS, a front-end for emc
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+import numpy
+import minigl
+from minigl import *
+import linuxcnc
+
+# Vertex buffer renderer for the moves collected by GLCanon.
+#
+# The traverse, feed, arc feed and dwell moves are converted once into a
+# single vertex buffer of colored GL_LINES, traverses first, so that
+# drawing the program is two glDrawArrays calls instead of display lists
+# compiled from immediate mode calls.  Picking does not render at all: the
+# same lines are put in a bounding volume hierarchy and the line under the
+# mouse is found by casting a ray through it.
+#
+# For large programs the feed moves are also kept at several levels of
+# detail.  The finest level joins consecutive collinear lines, which does
+# not change the picture; each coarser level snaps the vertices of the
+# previous one to a grid four times as coarse and drops the lines that
+# collapse or duplicate another one.  Every frame draws the coarsest level
+# whose grid is smaller than a pixel, picking always uses the full detail.
+
+available = hasattr(minigl, 'glGenBuffers')
+
+vertex_dtype = numpy.dtype([('color', numpy.uint8, 4), ('pos', numpy.float32, 3)])
+
+def frombuffer(data, dtype):
+    if not len(data):
+        return numpy.zeros(0, dtype)
+    return numpy.frombuffer(data, dtype)
+
+def rgba(colors, name):
+    return tuple(colors[name]) + (colors.get(name + '_alpha', 1/3.),)
+
+def dwell_lines(dwells, alpha, is_lathe, delta=0.015625):
+    # the same crosses as linuxcnc.draw_dwells
+    vertices = []
+    linenos = []
+    for lineno, color, x, y, z, axis in dwells:
+        c = tuple(int(min(max(v, 0), 1) * 255 + .5) for v in tuple(color) + (alpha,))
+        if is_lathe: axis = 1
+        if axis == 0:
+            points = [(x-delta, y-delta, z), (x+delta, y+delta, z),
+                      (x-delta, y+delta, z), (x+delta, y-delta, z)]
+        elif axis == 1:
+            points = [(x-delta, y, z-delta), (x+delta, y, z+delta),
+                      (x-delta, y, z+delta), (x+delta, y, z-delta)]
+        else:
+            points = [(x, y-delta, z-delta), (x, y+delta, z+delta),
+                      (x, y+delta, z-delta), (x, y-delta, z+delta)]
+        vertices.extend((c, p) for p in points)
+        linenos.extend((lineno, lineno))
+    return (numpy.array(vertices, vertex_dtype),
+            numpy.array(linenos, numpy.int32))
+
+def merge_collinear(pos, color, eps=1e-6):
+    # join runs of GL_LINES that continue each other in the same direction
+    # and color
+    p1 = pos[0::2]; p2 = pos[1::2]; c = color[0::2]
+    if len(c) < 2: return pos, color
+    u = p2[:-1] - p1[:-1]
+    v = p2[1:] - p1[1:]
+    cross = numpy.cross(u, v)
+    joined = ((p2[:-1] == p1[1:]).all(1) & (c[:-1] == c[1:])
+        & ((u * v).sum(1) > 0)
+        & ((cross * cross).sum(1) <= eps * eps * (u * u).sum(1) * (v * v).sum(1)))
+    starts = numpy.concatenate(([True], ~joined))
+    ends = numpy.concatenate((~joined, [True]))
+    n = starts.sum()
+    out = numpy.empty((2 * n, 3), pos.dtype)
+    out[0::2] = p1[starts]
+    out[1::2] = p2[ends]
+    return out, numpy.repeat(c[starts], 2)
+
+def cluster_lines(pos, color, tolerance):
+    # snap the vertices of GL_LINES to the centers of a grid, dropping the
+    # lines that become points or duplicates
+    cell = numpy.floor(pos / tolerance).astype(numpy.int64)
+    a = cell[0::2]; b = cell[1::2]; c = color[0::2]
+    keep = (a != b).any(1)
+    a = a[keep]; b = b[keep]; c = c[keep]
+    key = numpy.column_stack((a, b, c.astype(numpy.int64)))
+    key = key.view(numpy.dtype((numpy.void, key.dtype.itemsize * key.shape[1])))
+    unique = numpy.sort(numpy.unique(key.ravel(), return_index=True)[1])
+    out = numpy.empty((2 * len(unique), 3), numpy.float64)
+    out[0::2] = a[unique]
+    out[1::2] = b[unique]
+    return (out + .5) * tolerance, numpy.repeat(c[unique], 2)
+
+class SegmentBVH:
+    """Bounding volume hierarchy over line segments, for picking"""
+    leaf_size = 256
+
+    def __init__(self, p1, p2, names):
+        self.p1 = numpy.asarray(p1, numpy.float64).reshape(-1, 3)
+        self.p2 = numpy.asarray(p2, numpy.float64).reshape(-1, 3)
+        self.names = names
+        self.order = numpy.arange(len(self.p1))
+        # node i covers order[first[i]:last[i]] and has the children
+        # left[i] and left[i]+1, or none if left[i] is 0.  Built on the
+        # first query, so that loading a program does not wait for it.
+        self.lo = None
+
+    def build(self):
+        self.lo = []; self.hi = []
+        self.first = []; self.last = []; self.left = []
+        lo = numpy.minimum(self.p1, self.p2)
+        hi = numpy.maximum(self.p1, self.p2)
+        center = (lo + hi) * .5
+        order = self.order
+        stack = [(0, 0, len(order))]
+        self.add_node()
+        while stack:
+            node, first, last = stack.pop()
+            idx = order[first:last]
+            self.lo[node] = lo[idx].min(0)
+            self.hi[node] = hi[idx].max(0)
+            self.first[node] = first
+            self.last[node] = last
+            if last - first <= self.leaf_size:
+                continue
+            c = center[idx]
+            axis = (c.max(0) - c.min(0)).argmax()
+            half = (last - first) // 2
+            order[first:last] = idx[c[:, axis].argpartition(half)]
+            left = self.add_node()
+            self.add_node()
+            self.left[node] = left
+            stack.append((left, first, first + half))
+            stack.append((left + 1, first + half, last))
+        self.lo = numpy.array(self.lo)
+        self.hi = numpy.array(self.hi)
+
+    def add_node(self):
+        self.lo.append(None); self.hi.append(None)
+        self.first.append(0); self.last.append(0); self.left.append(0)
+        return len(self.left) - 1
+
+    def query(self, origin, direction, radius):
+        """Return (distance along the ray, name) of the segment closest to
+        origin that passes within radius of the ray, or None"""
+        if not len(self.order): return None
+        if self.lo is None: self.build()
+        origin = numpy.asarray(origin, numpy.float64)
+        direction = numpy.asarray(direction, numpy.float64)
+        direction = direction / numpy.sqrt(direction.dot(direction))
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            inverse = 1 / direction
+        best = None
+        best_t = numpy.inf
+        stack = [0]
+        while stack:
+            node = stack.pop()
+            # slab test against the node box grown by radius
+            with numpy.errstate(invalid='ignore'):
+                t1 = (self.lo[node] - radius - origin) * inverse
+                t2 = (self.hi[node] + radius - origin) * inverse
+            inside = (origin >= self.lo[node] - radius) & (origin <= self.hi[node] + radius)
+            parallel = direction == 0
+            if (parallel & ~inside).any(): continue
+            tmin = numpy.where(parallel, -numpy.inf, numpy.minimum(t1, t2)).max()
+            tmax = numpy.where(parallel, numpy.inf, numpy.maximum(t1, t2)).min()
+            if tmax < max(tmin, 0) or tmin > best_t: continue
+            left = self.left[node]
+            if left:
+                stack.append(left); stack.append(left + 1)
+                continue
+            idx = self.order[self.first[node]:self.last[node]]
+            t, d = self.ray_distance(idx, origin, direction)
+            hit = d <= radius
+            if not hit.any(): continue
+            i = numpy.where(hit, t, numpy.inf).argmin()
+            if t[i] < best_t:
+                best_t = t[i]
+                best = self.names[idx[i]]
+        if best is None: return None
+        return best_t, best
+
+    def ray_distance(self, idx, origin, direction):
+        # distance along the ray and from the ray of the point of each
+        # segment closest to the ray
+        a = self.p1[idx]
+        u = self.p2[idx] - a
+        w = a - origin
+        uu = (u * u).sum(1)
+        ud = u.dot(direction)
+        uw = (u * w).sum(1)
+        dw = w.dot(direction)
+        denom = uu - ud * ud
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            s = numpy.where(denom > 1e-12, (ud * dw - uw) / denom, 0)
+        s = numpy.clip(s, 0, 1)
+        p = a + u * s[:, None]
+        t = numpy.maximum((p - origin).dot(direction), 0)
+        q = origin + t[:, None] * direction
+        return t, numpy.sqrt(((p - q) ** 2).sum(1))
+
+class ToolpathBuffer:
+    """The moves of a GLCanon in a vertex buffer"""
+    # programs with fewer feed lines are always drawn at full detail
+    lod_threshold = 100000
+    # stop adding coarser levels below this many lines
+    lod_min_lines = 5000
+    lod_max_levels = 8
+    # the grid of the level drawn is at most this many pixels
+    lod_pixels = 1.
+
+    def __init__(self, canon):
+        colors = canon.colors
+        parts = []
+        linenos = []
+        for segments, color in ((canon.traverse, 'traverse'),
+                                (canon.feed, 'straight_feed'),
+                                (canon.arcfeed, 'arc_feed')):
+            vertices, owners = linuxcnc.segment_vertices(canon.geometry,
+                segments.pos, segments.start, rgba(colors, color))
+            parts.append(frombuffer(vertices, vertex_dtype))
+            owners = frombuffer(owners, numpy.int32)
+            linenos.append(frombuffer(segments.lineno, numpy.int32)[owners])
+        vertices, names = dwell_lines(canon.dwells,
+            colors.get('dwell_alpha', 1/3.), canon.is_lathe())
+        parts.append(vertices)
+        linenos.append(names)
+
+        counts = [len(p) for p in parts]
+        self.traverse_count = counts[0]
+        self.feed_count = counts[1] + counts[2]
+        self.dwell_count = counts[3]
+
+        data = numpy.concatenate(parts)
+        self.buffer = glGenBuffers()
+        glBindBuffer(GL_ARRAY_BUFFER, self.buffer)
+        glBufferData(GL_ARRAY_BUFFER, data, GL_STATIC_DRAW)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+        # (grid size, buffer, vertex count) of each level, finest first
+        self.levels = []
+        if self.feed_count // 2 >= self.lod_threshold:
+            self.build_levels(data[self.traverse_count:
+                                   self.traverse_count + self.feed_count])
+
+        pos = data['pos']
+        split = self.traverse_count // 2
+        self.rapids = SegmentBVH(pos[0:2*split:2], pos[1:2*split:2],
+                                 linenos[0])
+        self.program = SegmentBVH(pos[2*split::2], pos[2*split+1::2],
+                                  numpy.concatenate(linenos[1:]))
+
+    def build_levels(self, vertices):
+        pos = vertices['pos'].astype(numpy.float64)
+        color = numpy.ascontiguousarray(vertices['color']).view(numpy.uint32).ravel()
+        pos, color = merge_collinear(pos, color)
+        self.add_level(0, pos, color)
+        size = (pos.max(0) - pos.min(0)).max()
+        if not size > 0: return
+        tolerance = size / 4096.
+        while (len(color) // 2 > self.lod_min_lines
+                and len(self.levels) < self.lod_max_levels):
+            pos, color = cluster_lines(pos, color, tolerance)
+            self.add_level(tolerance, pos, color)
+            tolerance *= 4
+
+    def add_level(self, tolerance, pos, color):
+        data = numpy.empty(len(color), vertex_dtype)
+        data['pos'] = pos
+        data['color'] = color.view(numpy.uint8).reshape(-1, 4)
+        buffer = glGenBuffers()
+        glBindBuffer(GL_ARRAY_BUFFER, buffer)
+        glBufferData(GL_ARRAY_BUFFER, data, GL_STATIC_DRAW)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        self.levels.append((tolerance, buffer, len(data)))
+
+    def draw_lines(self, buffer, first, count):
+        glBindBuffer(GL_ARRAY_BUFFER, buffer)
+        glPushClientAttrib(GL_CLIENT_VERTEX_ARRAY_BIT)
+        glInterleavedArrays(GL_C4UB_V3F, 0, 0)
+        glDrawArrays(GL_LINES, first, count)
+        glPopClientAttrib()
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    def draw(self, rapids, pixel_size=None):
+        if rapids:
+            glEnable(GL_LINE_STIPPLE)
+            self.draw_lines(self.buffer, 0, self.traverse_count)
+            glDisable(GL_LINE_STIPPLE)
+            return
+        level = None
+        if pixel_size is not None:
+            for tolerance, buffer, count in self.levels:
+                if tolerance > pixel_size * self.lod_pixels: break
+                level = buffer, count
+        if level is not None:
+            self.draw_lines(level[0], 0, level[1])
+        else:
+            self.draw_lines(self.buffer, self.traverse_count, self.feed_count)
+        glLineWidth(2)
+        self.draw_lines(self.buffer, self.traverse_count + self.feed_count,
+                        self.dwell_count)
+        glLineWidth(1)
+
+    def pick(self, origin, direction, radius, rapids):
+        hits = [self.program.query(origin, direction, radius)]
+        if rapids:
+            hits.append(self.rapids.query(origin, direction, radius))
+        hits = [h for h in hits if h is not None]
+        if not hits: return None
+        return int(min(hits)[1])
+
+    def delete(self):
+        if self.buffer:
+            glDeleteBuffers(self.buffer)
+            self.buffer = 0
+        for tolerance, buffer, count in self.levels:
+            glDeleteBuffers(buffer)
+        self.levels = []
+
+# vim:ts=8:sts=4:sw=4:et:
@@ -0,0 +1,42 @@
+#!/usr/bin/python2
+
+# the ring buffer filters against the plain window computations
+
+import random
+
+from fdm import filters
+
+
+def window_test(filterType, reference):
+    f = filters.createFilter(filterType, 5)
+    samples = []
+    for n in range(100):
+        sample = random.uniform(0, 4095)
+        samples = (samples + [sample])[-5:]
+        assert abs(f.add(sample) - reference(samples)) < 1e-6
+
+
+def test_mean():
+    window_test('mean', lambda samples: sum(samples) / len(samples))
+
+
+def test_median():
+    def median(samples):
+        s = sorted(samples)
+        middle = len(s) // 2
+        return s[middle] if len(s) % 2 else (s[middle - 1] + s[middle]) / 2.0
+    window_test('median', median)
+
+
+def test_iir():
+    f = filters.createFilter('iir', 3)
+    assert f.add(10.0) == 10.0
+    assert f.add(20.0) == 15.0
+
+
+def test_unknown_type():
+    try:
+        filters.createFilter('foo', 3)
+    except ValueError:
+        return
+    assert False
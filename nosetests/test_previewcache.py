@@ -0,0 +1,75 @@
+#!/usr/bin/python2
+
+# the preview cache key follows the machine state the interpreter reads
+
+import os
+import shutil
+import tempfile
+
+from rs274.interpret import StatMixin
+from rs274.previewcache import PreviewCache
+
+
+class Stat:
+    block_delete = 0
+    axis_mask = 7
+    linear_units = 1.0
+    angular_units = 1.0
+
+
+class Canon(StatMixin):
+    def __init__(self, stat):
+        self.s = stat
+
+
+def test_key_block_delete():
+    directory = tempfile.mkdtemp()
+    try:
+        program = os.path.join(directory, 'program.ngc')
+        with open(program, 'w') as f:
+            f.write('G0 X1\n/G0 X2\nM2\n')
+        cache = PreviewCache(os.path.join(directory, 'cache'),
+                             inifile=os.devnull)
+        stat = Stat()
+        canon = Canon(stat)
+        key = cache.key(program, canon, 'G21', '')
+        assert cache.key(program, canon, 'G21', '') == key
+
+        stat.block_delete = 1
+        assert cache.key(program, canon, 'G21', '') != key
+        stat.block_delete = 0
+        stat.axis_mask = 15
+        assert cache.key(program, canon, 'G21', '') != key
+        stat.axis_mask = 7
+        stat.linear_units = 1 / 25.4
+        assert cache.key(program, canon, 'G21', '') != key
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_key_subroutines():
+    directory = tempfile.mkdtemp()
+    try:
+        subroutines = os.path.join(directory, 'subroutines')
+        os.mkdir(subroutines)
+        program = os.path.join(directory, 'program.ngc')
+        with open(program, 'w') as f:
+            f.write('o<probe> call\nM2\n')
+        inifile = os.path.join(directory, 'machine.ini')
+        with open(inifile, 'w') as f:
+            f.write('[RS274NGC]\nSUBROUTINE_PATH = %s\n' % subroutines)
+        cache = PreviewCache(os.path.join(directory, 'cache'),
+                             inifile=inifile)
+        canon = Canon(Stat())
+        key = cache.key(program, canon, 'G21', '')
+
+        subroutine = os.path.join(subroutines, 'probe.ngc')
+        with open(subroutine, 'w') as f:
+            f.write('o<probe> sub\nG0 X1\no<probe> endsub\n')
+        key2 = cache.key(program, canon, 'G21', '')
+        assert key2 != key
+        with open(subroutine, 'a') as f:
+            f.write('\n')
+        assert cache.key(program, canon, 'G21', '') != key2
+    finally:
+        shutil.rmtree(directory)
@@ -0,0 +1,32 @@
+#!/usr/bin/python2
+
+# the ADC count lookup tables give the same temperatures as R2Temp
+
+from fdm import r2temp
+
+
+def adc2r_cramps(value, R_PU=2000.0):
+    V_T = value * 1.8 / 4096.0
+    return V_T / max((1.8 - V_T) / R_PU, 0.000001)
+
+
+def test_lookup_table():
+    table = r2temp.lookupTable("semitec_103GT_2", 'CRAMPS', R_PU=4700.0)
+    reference = r2temp.R2Temp("semitec_103GT_2")
+    assert len(table) == 4096
+    for count in range(0, 4096, 7):
+        assert abs(table[count] - reference.r2t(adc2r_cramps(count, 4700.0))) < 1e-9
+    assert r2temp.lookupTable("semitec_103GT_2", 'CRAMPS', R_PU=4700.0) is table
+
+
+def test_converter():
+    tables = [r2temp.lookupTable("epcos_B57560G1104", 'CRAMPS'),
+              r2temp.lookupTable("semitec_103GT_2", 'CRAMPS')]
+    converter = r2temp.TempConverter(tables)
+    temps = converter.convert([1000, 3000.5])
+    assert abs(temps[0] - tables[0][1000]) < 1e-9
+    assert abs(temps[1] - (tables[1][3000] + tables[1][3001]) / 2) < 1e-9
+    # readings outside the ADC range are clipped
+    temps = converter.convert([-5, 5000])
+    assert temps[0] == tables[0][0]
+    assert temps[1] == tables[1][4095]
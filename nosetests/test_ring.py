@@ -4,6 +4,8 @@ import os,time,sys
 from nose import with_setup
 from machinekit.nosetests.realtime import setup_module ,teardown_module
 from machinekit import rtapi,hal
+from machinekit.ringwait import RingWatcher, RingNotifier
+import select
 
 import ConfigParser
 
@@ -57,5 +59,72 @@ def test_ring_read():
         r1.shift()
     assert nr > 0
 
+def test_ring_readinto():
+    r2 = hal.Ring("ring2", size=4096)
+    for record in ["a", "bb", "ccc", "dddd"]:
+        assert r2.write(record)
+
+    buf = bytearray(6)
+    sizes = []
+    # "dddd" does not fit any more
+    assert r2.readinto(buf, sizes=sizes) == 3
+    assert str(buf) == "abbccc"
+    assert sizes == [1, 2, 3]
+
+    assert r2.readinto(buf, count=0) == 0
+    assert r2.readinto(buf) == 1
+    assert str(buf[:4]) == "dddd"
+    assert r2.readinto(buf) == 0
+
+def test_ring_wait():
+    r3 = hal.Ring("ring3", size=4096)
+    assert not r3.ready()
+    assert not r3.wait(0.01)
+
+    watcher = RingWatcher()
+    notifier = watcher.watch(r3)
+    assert select.select([notifier], [], [], 0.05)[0] == []
+
+    r3.write("data")
+    assert r3.ready()
+    assert r3.wait(0)
+    assert select.select([notifier], [], [], 1.0)[0] == [notifier]
+
+    notifier.clear()
+    r3.shift()
+    assert select.select([notifier], [], [], 0.05)[0] == []
+    watcher.unwatch(notifier)
+    watcher.stop()
+    try:
+        watcher.watch(r3)
+    except RuntimeError:
+        pass
+    else:
+        assert False, "watch() after stop() must fail"
+
+class ReadyRing(object):
+    def ready(self):
+        return True
+
+def test_notifier_clear_signal_race():
+    # the watcher signals while clear() drains the pipe
+    notifier = RingNotifier(ReadyRing())
+    notifier.signal()
+    read = os.read
+    def interleaved_read(fd, n):
+        os.read = read
+        notifier.signal()
+        return read(fd, n)
+    os.read = interleaved_read
+    try:
+        notifier.clear()
+    finally:
+        os.read = read
+    # next pass of the watcher
+    if not notifier.signalled and notifier.ring.ready():
+        notifier.signal()
+    assert select.select([notifier], [], [], 0)[0] == [notifier]
+    notifier.close()
+
 (lambda s=__import__('signal'):
      s.signal(s.SIGTERM, s.SIG_IGN))()
@@ -25,6 +25,23 @@ def test_ring_write_read():
     m = sr.read()
     assert len(m) == size -1
 
+def test_ring_readinto():
+    # wrap around so that the readable bytes are split in two vectors
+    sr.write("A" * (size / 2))
+    sr.consume(size / 2)
+    sr.write("0123456789" * (size / 10 - 1))
+
+    views = sr.views()
+    assert len(views) == 2
+    assert "".join(v.tobytes() for v in views) == "0123456789" * (size / 10 - 1)
+
+    buf = bytearray(15)
+    assert sr.readinto(buf) == 15
+    assert str(buf) == "012345678901234"
+    assert sr.read() == "56789" + "0123456789" * (size / 10 - 3)
+    assert sr.readinto(buf) == 0
+    assert sr.views() == ()
+
 
 (lambda s=__import__('signal'):
      s.signal(s.SIGTERM, s.SIG_IGN))()
@@ -20,6 +20,11 @@
 #include <Python.h>
 #include <structmember.h>
 
+#include <cmath>
+#include <set>
+#include <string>
+#include <vector>
+
 #include <google/protobuf/message_lite.h>
 
 #include <machinetalk/protobuf/types.pb.h>
@@ -39,8 +44,28 @@ static zsock_t *z_preview, *z_status;
 static const char *istat_topic = "status";
 static int batch_limit = 100;
 static const char *p_client = "preview"; //NULL; // single client for now
-
-static machinetalk::Container istat, output;
+static const char *p_delta = "delta-preview"; // delta encoded preview
+static double delta_resolution = 1e-6;
+static long abort_interval = 50000; // us between check_abort() calls
+
+static machinetalk::Container istat, output, delta_output;
+static std::set<std::string> subscriptions; // topic prefixes subscribed to
+
+// state of the delta encoding, reset by PV_PREVIEW_START.  It follows
+// every batch, also while nobody is subscribed to the delta encoding, so
+// that it matches the preview whenever a subscriber joins.
+static struct {
+    int64_t pos[9];
+    int line_number;
+    double feed_rate, traverse_rate;
+    bool keyframe; // a subscriber joined, send the next position in full
+} delta;
+
+// the batches sent by the last parse, kept for replay() unless they
+// exceed record_limit bytes
+static std::vector<machinetalk::Container> recording;
+static size_t recording_bytes, record_limit = 64 << 20;
+static bool recording_active, recording_valid;
 
 static size_t n_containers, n_messages, n_bytes;
 
@@ -69,6 +94,122 @@ static void publish_istat(machinetalk::InterpreterStateType state)
     }
 }
 
+// track the subscriptions to the preview socket, so that each encoding
+// is only produced if somebody subscribed to it
+static void update_subscriptions(void)
+{
+    char buf[256];
+    int n;
+
+    while ((n = zmq_recv(zsock_resolve(z_preview), buf, sizeof(buf),
+			 ZMQ_DONTWAIT)) > 0) {
+	if (n > (int) sizeof(buf))
+	    n = sizeof(buf); // truncated
+	std::string topic(buf + 1, n - 1);
+	if (buf[0] == 1) {
+	    subscriptions.insert(topic);
+	    // a subscriber joining in the middle of a preview knows nothing
+	    // about the positions the deltas refer to
+	    if (strncmp(p_delta, topic.c_str(), topic.size()) == 0)
+		delta.keyframe = true;
+	}
+	else if (buf[0] == 0)
+	    subscriptions.erase(topic);
+    }
+}
+
+static bool subscribed(const char *topic)
+{
+    std::set<std::string>::const_iterator it;
+    for (it = subscriptions.begin(); it != subscriptions.end(); it++)
+	if (strncmp(topic, it->c_str(), it->size()) == 0)
+	    return true;
+    return false;
+}
+
+// append the delta encoding of the previews in 'in' to 'out'
+static void encode_delta(const machinetalk::Container &in,
+			 machinetalk::Container &out)
+{
+    for (int i = 0; i < in.preview_size(); i++) {
+	const machinetalk::Preview &p = in.preview(i);
+
+	switch (p.type()) {
+	case machinetalk::PV_PREVIEW_START:
+	    memset(delta.pos, 0, sizeof(delta.pos));
+	    delta.line_number = -1;
+	    delta.feed_rate = delta.traverse_rate = -1.0;
+	    delta.keyframe = false;
+	    break;
+	case machinetalk::PV_SET_FEED_RATE:
+	    if (p.rate() == delta.feed_rate)
+		continue;
+	    delta.feed_rate = p.rate();
+	    break;
+	case machinetalk::PV_SET_TRAVERSE_RATE:
+	    if (p.rate() == delta.traverse_rate)
+		continue;
+	    delta.traverse_rate = p.rate();
+	    break;
+	default:
+	    break;
+	}
+
+	machinetalk::Preview *q = out.add_preview();
+	q->CopyFrom(p);
+	if (p.type() == machinetalk::PV_PREVIEW_START)
+	    q->set_resolution(delta_resolution);
+	if (p.has_line_number()) {
+	    if (p.line_number() == delta.line_number)
+		q->clear_line_number();
+	    delta.line_number = p.line_number();
+	}
+	if (p.has_pos() &&
+	    ((p.type() == machinetalk::PV_STRAIGHT_FEED) ||
+	     (p.type() == machinetalk::PV_STRAIGHT_TRAVERSE) ||
+	     (p.type() == machinetalk::PV_ARC_FEED))) {
+	    const machinetalk::Position &pos = p.pos();
+	    double v[9] = { pos.x(), pos.y(), pos.z(),
+			    pos.a(), pos.b(), pos.c(),
+			    pos.u(), pos.v(), pos.w() };
+	    uint32_t mask = 0;
+	    for (int axis = 0; axis < 9; axis++) {
+		// deltas between quantized positions, so errors do not add up
+		int64_t value = llround(v[axis] / delta_resolution);
+		if (value != delta.pos[axis]) {
+		    mask |= 1 << axis;
+		    q->add_delta(value - delta.pos[axis]);
+		    delta.pos[axis] = value;
+		}
+	    }
+	    if (delta.keyframe) {
+		// keyframe: the quantized absolute position of all axes in
+		// pos, no deltas, and the state a new subscriber missed
+		machinetalk::Position *k = q->mutable_pos();
+		k->set_x(delta.pos[0] * delta_resolution);
+		k->set_y(delta.pos[1] * delta_resolution);
+		k->set_z(delta.pos[2] * delta_resolution);
+		k->set_a(delta.pos[3] * delta_resolution);
+		k->set_b(delta.pos[4] * delta_resolution);
+		k->set_c(delta.pos[5] * delta_resolution);
+		k->set_u(delta.pos[6] * delta_resolution);
+		k->set_v(delta.pos[7] * delta_resolution);
+		k->set_w(delta.pos[8] * delta_resolution);
+		q->clear_delta();
+		q->set_axis_mask(0x1ff);
+		q->set_resolution(delta_resolution);
+		if (p.has_line_number())
+		    q->set_line_number(p.line_number());
+		delta.feed_rate = delta.traverse_rate = -1.0;
+		delta.keyframe = false;
+	    } else {
+		q->clear_pos();
+		q->set_axis_mask(mask);
+	    }
+	}
+    }
+}
+
 // send off a preview frame if sufficent preview frames accumulated, or flushing
 // is is assumed a repeated submessage preview was just added
 static void send_preview(const char *client, bool flush = false)
@@ -77,14 +218,54 @@ static void send_preview(const char *client, bool flush = false)
     n_messages++;
 
     if ((output.preview_size() > batch_limit) || flush) {
-	n_containers++;
-	n_bytes += output.ByteSize();
-	output.set_type(machinetalk::MT_PREVIEW);
-	retval = send_pbcontainer(client, output, z_preview);
-	assert(retval == 0);
+	if (recording_active) {
+	    size_t size = output.ByteSize();
+	    if (recording_bytes + size > record_limit) {
+		recording_active = false;
+		recording.clear();
+	    } else {
+		recording_bytes += size;
+		recording.push_back(output);
+	    }
+	}
+	update_subscriptions();
+	encode_delta(output, delta_output);
+	if (subscribed(p_delta)) {
+	    n_containers++;
+	    n_bytes += delta_output.ByteSize();
+	    delta_output.set_type(machinetalk::MT_PREVIEW);
+	    retval = send_pbcontainer(p_delta, delta_output, z_preview);
+	    assert(retval == 0);
+	} else {
+	    delta_output.Clear();
+	}
+	if (subscribed(client)) {
+	    n_containers++;
+	    n_bytes += output.ByteSize();
+	    output.set_type(machinetalk::MT_PREVIEW);
+	    retval = send_pbcontainer(client, output, z_preview);
+	    assert(retval == 0);
+	}
+	output.Clear();
     }
 }
 
+static void record_start()
+{
+    recording.clear();
+    recording_bytes = 0;
+    recording_active = true;
+    recording_valid = false;
+}
+
+static void record_stop(bool complete)
+{
+    recording_valid = complete && recording_active;
+    recording_active = false;
+    if (!recording_valid)
+	recording.clear();
+}
+
 // send preview start message
 static void preview_start()
 {
@@ -110,6 +291,10 @@ static int z_init(void)
 
     if (getenv("BATCH"))
 	batch_limit = atoi(getenv("BATCH"));
+    if (getenv("DELTA_RESOLUTION"))
+	delta_resolution = atof(getenv("DELTA_RESOLUTION"));
+    if (getenv("PREVIEW_RECORD_LIMIT"))
+	record_limit = atol(getenv("PREVIEW_RECORD_LIMIT"));
 
     // Verify that the version of the library that we linked against is
     // compatible with the version of the headers we compiled against.
@@ -117,6 +302,10 @@ static int z_init(void)
 
 
     z_preview = zsock_new (ZMQ_XPUB);
+    assert(z_preview);
+    // report every subscription, a delta-preview subscriber joining after
+    // the first one needs a keyframe as well
+    zsock_set_xpub_verbose(z_preview, 1);
 #if 0
     rc = zsock_bind(z_preview, z_preview_uri);
     assert (rc != 0);
@@ -1012,7 +1201,6 @@ static PyObject *parse_file(PyObject *self, PyObject *args) {
     char *unitcode=0, *initcode=0, *interpname=0;
     int error_line_offset = 0;
     struct timeval t0, t1;
-    int wait = 1;
     if(!PyArg_ParseTuple(args, "sO|sss", &f, &callback, &unitcode, &initcode, &interpname))
         return NULL;
 
@@ -1039,6 +1227,7 @@ static PyObject *parse_file(PyObject *self, PyObject *args) {
 
     note_printf(istat, "open '%s'", f);
     publish_istat(machinetalk::INTERP_RUNNING);
+    record_start();
     preview_start();
     interp_new.init();
     interp_new.open(f);
@@ -1065,8 +1254,18 @@ static PyObject *parse_file(PyObject *self, PyObject *args) {
         error_line_offset = 1;
         result = interp_new.read();
         gettimeofday(&t1, NULL);
-        if(t1.tv_sec > t0.tv_sec + wait) {
-            if(check_abort()) return NULL;
+        if((t1.tv_sec - t0.tv_sec) * 1000000L
+           + t1.tv_usec - t0.tv_usec > abort_interval) {
+            if(check_abort()) {
+                // drop what is not sent yet, end the preview for the clients
+                output.Clear();
+                record_stop(false);
+                preview_end();
+                send_preview(p_client, true);
+                publish_istat(machinetalk::INTERP_IDLE);
+                pinterp->close();
+                return NULL;
+            }
             t0 = t1;
         }
         if(!RESULT_OK) break;
@@ -1077,6 +1276,7 @@ static PyObject *parse_file(PyObject *self, PyObject *args) {
 out_error:
     preview_end();
     send_preview(p_client, true);
+    record_stop(true);
     publish_istat(machinetalk::INTERP_IDLE);
 
     if(pinterp) pinterp->close();
@@ -1351,6 +1551,20 @@ static PyObject *bind_sockets(PyObject *self, PyObject *args) {
 			 zsock_last_endpoint(z_status));
 }
 
+// publish the preview of the last completed parse again, returns False
+// if there is none
+static PyObject *replay(PyObject *self, PyObject *args) {
+    if(!recording_valid)
+        Py_RETURN_FALSE;
+    publish_istat(machinetalk::INTERP_RUNNING);
+    for(size_t i = 0; i < recording.size(); i++) {
+        output.CopyFrom(recording[i]);
+        send_preview(p_client, true);
+    }
+    publish_istat(machinetalk::INTERP_IDLE);
+    Py_RETURN_TRUE;
+}
+
 static PyMethodDef gcode_methods[] = {
     {"parse", (PyCFunction)parse_file, METH_VARARGS, "Parse a G-Code file"},
     {"strerror", (PyCFunction)rs274_strerror, METH_VARARGS,
@@ -1360,6 +1574,8 @@ static PyMethodDef gcode_methods[] = {
     {"arc_to_segments", (PyCFunction)rs274_arc_to_segments, METH_VARARGS,
         "Convert an arc to straight segments"},
     {"bind", (PyCFunction)bind_sockets, METH_VARARGS, "pass an IP address and return a tuple (status uri, preview uri)"},
+    {"replay", (PyCFunction)replay, METH_NOARGS,
+        "Publish the preview of the last completed parse again"},
 
     {NULL}
 };
@@ -32,6 +32,7 @@
 #include "rcs_print.hh"
 
 #include <cmath>
+#include <vector>
 
 #ifndef T_BOOL
 // The C++ standard probably doesn't specify the amount of storage for a 'bool',
@@ -1745,6 +1746,158 @@ static PyObject *pydraw_lines(PyObject *s, PyObject *o) {
     return Py_None;
 }
 
+static bool get_read_buffer(PyObject *o, size_t itemsize,
+        const void **buf, Py_ssize_t *n, const char *name) {
+    Py_ssize_t len;
+    if(PyObject_AsReadBuffer(o, buf, &len) < 0)
+        return false;
+    if(len % itemsize) {
+        PyErr_Format(PyExc_ValueError, "draw_segments: %s has wrong item size", name);
+        return false;
+    }
+    *n = len / itemsize;
+    return true;
+}
+
+// Draw the segments of a rs274.segments.SegmentList: 'pos' holds 9 doubles
+// per vertex, segment i goes from vertex start[i] to vertex start[i]+1.
+static PyObject *pydraw_segments(PyObject *s, PyObject *o) {
+    PyObject *pos_o, *start_o, *lineno_o;
+    const void *pos_b, *start_b, *lineno_b;
+    Py_ssize_t npos, nstart, nlineno;
+    int for_selection = 0;
+    int first = 1;
+    int nl = -1, ve = -1;
+    char *geometry;
+
+    if(!PyArg_ParseTuple(o, "sOOO|i:draw_segments",
+                &geometry, &pos_o, &start_o, &lineno_o, &for_selection))
+        return NULL;
+    if(!get_read_buffer(pos_o, sizeof(double), &pos_b, &npos, "pos")
+            || !get_read_buffer(start_o, sizeof(int), &start_b, &nstart, "start")
+            || !get_read_buffer(lineno_o, sizeof(int), &lineno_b, &nlineno, "lineno"))
+        return NULL;
+    if(nlineno < nstart) {
+        PyErr_SetString(PyExc_ValueError, "draw_segments: lineno too short");
+        return NULL;
+    }
+
+    const double *pos = (const double*)pos_b;
+    const int *start = (const int*)start_b;
+    const int *lineno = (const int*)lineno_b;
+
+    for(Py_ssize_t i=0; i<nstart; i++) {
+        int v = start[i];
+        int n = lineno[i];
+        if(v < 0 || 9 * (Py_ssize_t)(v + 2) > npos) {
+            if(!first) glEnd();
+            PyErr_SetString(PyExc_IndexError, "draw_segments: vertex out of range");
+            return NULL;
+        }
+        const double *p1 = pos + 9 * v, *p2 = p1 + 9;
+        if(first || v != ve || (for_selection && n != nl)) {
+            if(!first) glEnd();
+            if(for_selection && n != nl) {
+                glLoadName(n);
+                nl = n;
+            }
+            glBegin(GL_LINE_STRIP);
+            glvertex9(p1, geometry);
+            first = 0;
+        }
+        line9(p1, p2, geometry);
+        ve = v + 1;
+    }
+
+    if(!first) glEnd();
+
+    Py_INCREF(Py_None);
+    return Py_None;
+}
+
+struct c4ub_v3f {
+    unsigned char c[4];
+    float v[3];
+};
+
+static void push_vertex9(std::vector<c4ub_v3f> &out, const unsigned char c[4],
+        const double pt[9], const char *geometry) {
+    double p[3];
+    c4ub_v3f vertex;
+    vertex9(pt, p, geometry);
+    memcpy(vertex.c, c, 4);
+    vertex.v[0] = p[0]; vertex.v[1] = p[1]; vertex.v[2] = p[2];
+    out.push_back(vertex);
+}
+
+// Convert the segments of a rs274.segments.SegmentList to GL_LINES vertex
+// data in GL_C4UB_V3F format, for use in a vertex buffer.  Moves of the
+// rotary axes are split into pieces as in line9.  Returns the vertex data
+// and, for each line piece, the index of the segment it belongs to.
+static PyObject *pysegment_vertices(PyObject *s, PyObject *o) {
+    PyObject *pos_o, *start_o;
+    const void *pos_b, *start_b;
+    Py_ssize_t npos, nstart;
+    double rgba[4];
+    unsigned char c[4];
+    char *geometry;
+
+    if(!PyArg_ParseTuple(o, "sOO(dddd):segment_vertices",
+                &geometry, &pos_o, &start_o,
+                &rgba[0], &rgba[1], &rgba[2], &rgba[3]))
+        return NULL;
+    if(!get_read_buffer(pos_o, sizeof(double), &pos_b, &npos, "pos")
+            || !get_read_buffer(start_o, sizeof(int), &start_b, &nstart, "start"))
+        return NULL;
+    for(int j=0; j<4; j++)
+        c[j] = (unsigned char)(max(0., rgba[j] < 1. ? rgba[j] : 1.) * 255 + .5);
+
+    const double *pos = (const double*)pos_b;
+    const int *start = (const int*)start_b;
+    std::vector<c4ub_v3f> vertices;
+    std::vector<int> owners;
+    vertices.reserve(2 * nstart);
+    owners.reserve(nstart);
+
+    for(Py_ssize_t i=0; i<nstart; i++) {
+        int v = start[i];
+        if(v < 0 || 9 * (Py_ssize_t)(v + 2) > npos) {
+            PyErr_SetString(PyExc_IndexError, "segment_vertices: vertex out of range");
+            return NULL;
+        }
+        const double *p1 = pos + 9 * v, *p2 = p1 + 9;
+        if(p1[3] != p2[3] || p1[4] != p2[4] || p1[5] != p2[5]) {
+            double dc = max3(
+                rtapi_fabs(p2[3] - p1[3]),
+                rtapi_fabs(p2[4] - p1[4]),
+                rtapi_fabs(p2[5] - p1[5]));
+            int st = (int)rtapi_ceil(max(10, dc/10));
+            double pl[9];
+            memcpy(pl, p1, sizeof(pl));
+            for(int k=1; k<=st; k++) {
+                double t = k * 1.0 / st;
+                double u = 1.0 - t;
+                double pt[9];
+                for(int j=0; j<9; j++) { pt[j] = t * p2[j] + u * p1[j]; }
+                push_vertex9(vertices, c, pl, geometry);
+                push_vertex9(vertices, c, pt, geometry);
+                owners.push_back(i);
+                memcpy(pl, pt, sizeof(pl));
+            }
+        } else {
+            push_vertex9(vertices, c, p1, geometry);
+            push_vertex9(vertices, c, p2, geometry);
+            owners.push_back(i);
+        }
+    }
+
+    return Py_BuildValue("(NN)",
+        PyString_FromStringAndSize(vertices.empty() ? "" : (const char *)&vertices[0],
+            vertices.size() * sizeof(c4ub_v3f)),
+        PyString_FromStringAndSize(owners.empty() ? "" : (const char *)&owners[0],
+            owners.size() * sizeof(int)));
+}
+
 static PyObject *pydraw_dwells(PyObject *s, PyObject *o) {
     PyListObject *li;
     int for_selection = 0, is_lathe = 0, i, n;
@@ -2182,6 +2335,8 @@ static PyTypeObject PositionLoggerType = {
 static PyMethodDef emc_methods[] = {
 #define METH(name, doc) { #name, (PyCFunction) py##name, METH_VARARGS, doc }
 METH(draw_lines, "Draw a bunch of lines in the 'rs274.glcanon' format"),
+METH(draw_segments, "Draw the segments of a 'rs274.segments.SegmentList'"),
+METH(segment_vertices, "Vertex buffer data for the segments of a 'rs274.segments.SegmentList'"),
 METH(draw_dwells, "Draw a bunch of dwell positions in the 'rs274.glcanon' format"),
 METH(line9, "Draw a single line in the 'rs274.glcanon' format; assumes glBegin(GL_LINES)"),
 METH(vertex9, "Get the 3d location for a 9d point"),
@@ -173,6 +173,7 @@ GLCALL2V(glDeleteLists, "ii", int, int)
 GLCALL2V(glBlendFunc, "ii", int, int)
 GLCALL0V(glFlush)
 GLCALL2V(glPixelStorei, "ii", int, int)
+GLCALL2V(glBindBuffer, "ii", int, int)
 
 static PyObject *pyglBitmap(PyObject *s, PyObject *o) {
     int width, height, nbitmap;
@@ -207,6 +208,37 @@ static PyObject *pyglGenLists(PyObject *s, PyObject *o) {
     return PyInt_FromLong(glGenLists(range));
 }
 
+static PyObject *pyglGenBuffers(PyObject *s, PyObject *o) {
+    GLuint buffer;
+    if(!PyArg_ParseTuple(o, ":glGenBuffers")) return NULL;
+    glGenBuffers(1, &buffer);
+    CHECK_ERROR;
+    return PyInt_FromLong(buffer);
+}
+
+static PyObject *pyglDeleteBuffers(PyObject *s, PyObject *o) {
+    GLuint buffer;
+    if(!PyArg_ParseTuple(o, "I:glDeleteBuffers", &buffer)) return NULL;
+    glDeleteBuffers(1, &buffer);
+    CHECK_ERROR;
+    Py_INCREF(Py_None);
+    return Py_None;
+}
+
+static PyObject *pyglBufferData(PyObject *s, PyObject *o) {
+    int target, usage;
+    PyObject *data;
+    const void *buf;
+    Py_ssize_t size;
+    if(!PyArg_ParseTuple(o, "iOi:glBufferData", &target, &data, &usage))
+        return NULL;
+    if(PyObject_AsReadBuffer(data, &buf, &size) < 0) return NULL;
+    glBufferData(target, size, buf, usage);
+    CHECK_ERROR;
+    Py_INCREF(Py_None);
+    return Py_None;
+}
+
 static PyObject *pyglGetDoublev(PyObject *s, PyObject *o) {
     int what;
     if(!PyArg_ParseTuple(o, "i:glGetDoublev", &what)) return NULL;
@@ -265,6 +297,15 @@ static PyObject *pyglInterleavedArrays(PyObject *s, PyObject *o) {
         return NULL;
     }
 
+    // an integer is an offset into the bound GL_ARRAY_BUFFER
+    if(PyInt_Check(str)) {
+        glInterleavedArrays(format, stride,
+                (const void *)(intptr_t)PyInt_AsLong(str));
+        CHECK_ERROR;
+        Py_INCREF(Py_None);
+        return Py_None;
+    }
+
     if(!PyString_Check(str)) {
         PyErr_Format( PyExc_TypeError, "Expected string" );
         return NULL;
@@ -761,6 +802,10 @@ METH(glPixelStorei, "set pixel storage modes"),
 METH(glSelectBuffer, "establish a buffer for selection mode values"),
 METH(glFeedbackBuffer, "establish a buffer for feedback mode values"),
 // METH(glVertex3fv, ""),
+METH(glGenBuffers, "generate a buffer object name"),
+METH(glDeleteBuffers, "delete a buffer object"),
+METH(glBindBuffer, "bind a named buffer object"),
+METH(glBufferData, "create and initialize a buffer object's data store"),
 METH(gluSphere, "draw a sphere"),
 METH(gluCylinder, "draw a cylinder"),
 METH(gluDeleteQuadric, "destroy a quadrics object"),
@@ -870,5 +915,8 @@ void initminigl(void) {
     CONST(GL_UNPACK_ALIGNMENT);
     CONST(GL_LUMINANCE);
     CONST(GL_UNSIGNED_BYTE);
+    CONST(GL_ARRAY_BUFFER);
+    CONST(GL_STATIC_DRAW);
+    CONST(GL_CLIENT_VERTEX_ARRAY_BIT);
 
 }
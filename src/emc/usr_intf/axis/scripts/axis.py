@@ -60,6 +60,7 @@ sys.setdlopenflags(old_flags)
 from rs274.OpenGLTk import *
 from rs274.interpret import StatMixin
 from rs274.glcanon import GLCanon, GlCanonDraw
+from rs274.previewcache import PreviewCache
 from hershey import Hershey
 from propertywindow import properties
 import rs274.options
@@ -166,6 +167,11 @@ if preview == "YES" :
 else:
     allow_preview = True
 
+# size of the on-disk preview cache in MB, 0 disables it
+preview_cache_size = int(inifile.find('DISPLAY', 'PREVIEW_CACHE_SIZE') or 256)
+# show the preview every this many moves while a program loads, 0 disables
+preview_chunk_size = int(inifile.find('DISPLAY', 'PREVIEW_CHUNK_SIZE') or 10000)
+
 loadlast = inifile.find('USER_COMMANDS', 'LOAD_LASTFILE')
 if loadlast == "YES" :
     load_lastfile = True
@@ -487,6 +493,10 @@ class MyOpengl(GlCanonDraw, Opengl):
         if self.after_id: return
         self.after_id = self.after(50, self.actual_tkRedraw)
 
+    def preview_chunk_ready(self):
+        # drawn by the root_window.update() in AxisCanon.check_abort
+        self.tkRedraw()
+
     def tkRedraw_perspective(self, *dummy):
         """Cause the opengl widget to redraw itself."""
         self.redraw_perspective()
@@ -1862,14 +1872,11 @@ class TclCommands(nf.TclCommands):
             mf = vars.max_speed.get()
             #print o.canon.traverse[0]
 
-            g0 = sum(dist(l[1][:3], l[2][:3]) for l in o.canon.traverse)
-            g1 = (sum(dist(l[1][:3], l[2][:3]) for l in o.canon.feed) +
-                sum(dist(l[1][:3], l[2][:3]) for l in o.canon.arcfeed))
-            gt = (sum(dist(l[1][:3], l[2][:3])/min(mf, l[3]) for l in o.canon.feed) +
-                sum(dist(l[1][:3], l[2][:3])/min(mf, l[3])  for l in o.canon.arcfeed) +
-                sum(dist(l[1][:3], l[2][:3])/mf  for l in o.canon.traverse) +
-                o.canon.dwell_time
-                )
+            g0, t0 = o.canon.traverse.totals(mf)
+            g1f, t1f = o.canon.feed.totals(mf)
+            g1a, t1a = o.canon.arcfeed.totals(mf)
+            g1 = g1f + g1a
+            gt = t1f + t1a + t0 + o.canon.dwell_time
  
             props['g0'] = "%f %s".replace("%f", fmt) % (from_internal_linear_unit(g0, conv), units)
             props['g1'] = "%f %s".replace("%f", fmt) % (from_internal_linear_unit(g1, conv), units)
@@ -3214,6 +3221,9 @@ c.wait_complete()
 
 o = MyOpengl(widgets.preview_frame, width=400, height=300, double=1, depth=1)
 o.last_line = 1
+if preview_cache_size > 0:
+    o.preview_cache = PreviewCache(max_size=preview_cache_size * 1024 * 1024)
+o.preview_chunk_size = preview_chunk_size
 o.pack(fill="both", expand=1)
 
 def match_grid_size(v):
@@ -24,6 +24,8 @@ import gettext;
 gettext.install("linuxcnc", localedir=os.path.join(BASE, "share", "locale"), unicode=True)
 
 import Image
+import numpy
+import multiprocessing
 
 try:
     import numpy.numarray as numarray
@@ -35,7 +37,7 @@ except ImportError:
     import numarray, numarray.ieeespecial
     plus_inf = numarray.ieeespecial.inf
 
-from rs274.author import Gcode
+from rs274.author import Gcode, douglas
 import rs274.options
 
 from math import *
@@ -76,6 +78,67 @@ def make_tool_shape(f, wdia, resp):
     n = n - n.min()
     return n
 
+def running_max(a, k):
+    """Return the maximum of a[:, x:x+k] for each x, by doubling the window"""
+    m = a
+    n = 1
+    while 2 * n <= k:
+        m = numpy.maximum(m[:, :-n], m[:, n:])
+        n *= 2
+    width = a.shape[1] - k + 1
+    return numpy.maximum(m[:, :width], m[:, k-n:k-n+width])
+
+def dilate_row(rows, profile, cols, w):
+    """\
+Return the maximum of rows[:, x+dx] - profile[dx] over the tool columns dx
+for the first w positions x."""
+    a = cols[0]; b = cols[-1] + 1
+    if len(cols) == b - a and (profile[a:b] == profile[a]).all():
+        # a flat row, as for an endmill: a running maximum is enough
+        r = running_max(rows[:, a:b+w-1], b - a)
+        r -= profile[a]
+        return r
+    r = rows[:, a:a+w] - profile[a]
+    t = numpy.empty_like(r)
+    for dx in cols[1:]:
+        numpy.subtract(rows[:, dx:dx+w], profile[dx], out=t)
+        numpy.maximum(r, t, out=r)
+    return r
+
+def height_map(image, tool, block=256):
+    """\
+Return the height of the tool at every position over the image, which is
+(image[y:y+ts, x:x+ts] - tool).max() for every y and x: the grayscale
+dilation of the image by the tool shape.
+
+The dilation is done one tool row at a time over blocks of output rows.
+Tool rows with the same profile (a round tool is symmetric) are computed
+once per block."""
+    image = numpy.asarray(image, numpy.float32)
+    tool = numpy.asarray(tool, numpy.float32)
+    th, tw = tool.shape
+    h = image.shape[0] - th + 1
+    w = image.shape[1] - tw + 1
+    profiles = {}
+    for dy in range(th):
+        cols = numpy.nonzero(tool[dy] != plus_inf)[0]
+        if not len(cols): continue
+        key = tool[dy].tostring()
+        profiles.setdefault(key, (tool[dy], cols, []))[2].append(dy)
+
+    result = numpy.empty((h, w), numpy.float32)
+    result.fill(-plus_inf)
+    for y0 in range(0, h, block):
+        progress(y0, h)
+        y1 = min(h, y0 + block)
+        out = result[y0:y1]
+        rows = image[y0:y1+th-1]
+        for profile, cols, dys in profiles.values():
+            r = dilate_row(rows, profile, cols, w)
+            for dy in dys:
+                numpy.maximum(out, r[dy:dy+y1-y0], out=out)
+    return result
+
 def amax(seq):
     res = 0
     for i in seq:
@@ -112,6 +175,9 @@ class Convert_Scan_Alternating:
     def reset(self):
         self.st = 0
 
+    def skip(self, n):
+        self.st += n
+
 class Convert_Scan_Increasing:
     def __call__(self, primary, items):
         yield True, items
@@ -119,6 +185,9 @@ class Convert_Scan_Increasing:
     def reset(self):
         pass
 
+    def skip(self, n):
+        pass
+
 class Convert_Scan_Decreasing:
     def __call__(self, primary, items):
         items.reverse()
@@ -127,6 +196,9 @@ class Convert_Scan_Decreasing:
     def reset(self):
         pass
 
+    def skip(self, n):
+        pass
+
 class Convert_Scan_Upmill:
     def __init__(self, slop = sin(pi / 18)):
         self.slop = slop
@@ -140,6 +212,9 @@ class Convert_Scan_Upmill:
     def reset(self):
         pass
 
+    def skip(self, n):
+        pass
+
 class Convert_Scan_Downmill:
     def __init__(self, slop = sin(pi / 18)):
         self.slop = slop
@@ -153,6 +228,9 @@ class Convert_Scan_Downmill:
     def reset(self):
         pass
 
+    def skip(self, n):
+        pass
+
 class Reduce_Scan_Lace:
     def __init__(self, converter, slope, keep):
         self.converter = converter
@@ -197,6 +275,9 @@ class Reduce_Scan_Lace:
     def reset(self):
         self.converter.reset()
 
+    def skip(self, n):
+        self.converter.skip(n)
+
 unitcodes = ['G20', 'G21']
 convert_makers = [ Convert_Scan_Increasing, Convert_Scan_Decreasing, Convert_Scan_Alternating, Convert_Scan_Upmill, Convert_Scan_Downmill ]
 
@@ -210,7 +291,7 @@ class Converter:
             image, units, tool_shape, pixelsize, pixelstep, safetyheight, \
             tolerance, feed, convert_rows, convert_cols, cols_first_flag,
             entry_cut, spindle_speed, roughing_offset, roughing_delta,
-            roughing_feed):
+            roughing_feed, processes=1):
         self.image = image
         self.units = units
         self.tool = tool_shape
@@ -227,8 +308,7 @@ class Converter:
         self.roughing_offset = roughing_offset
         self.roughing_delta = roughing_delta
         self.roughing_feed = roughing_feed
-
-        self.cache = {}
+        self.processes = processes
 
         w, h = self.w, self.h = image.shape
         ts = self.ts = tool_shape.shape[0]
@@ -267,21 +347,20 @@ class Converter:
         g.begin()
         g.continuous(self.tolerance)
         g.safety()
+        self.heightmap = height_map(self.image, self.tool)
         if self.roughing_delta and self.roughing_offset:
             base_image = self.image
+            base_heightmap = self.heightmap
             rough = make_tool_shape(ball_tool,
                                 2*self.roughing_offset, self.pixelsize)
             w, h = base_image.shape
             tw, th = rough.shape
             w1 = w + tw
             h1 = h + th
-            nim1 = numarray.zeros((w1, h1), 'Float32') + base_image.min()
+            nim1 = numpy.zeros((w1, h1), numpy.float32) + base_image.min()
             nim1[tw/2:tw/2+w, th/2:th/2+h] = base_image
-            self.image = numarray.zeros((w,h), type="Float32")
-            for j in range(0, w):
-                progress(j,w)
-                for i in range(0, h):
-                    self.image[j,i] = (nim1[j:j+tw,i:i+th] - rough).max()
+            self.image = height_map(nim1, rough)[:w, :h]
+            self.heightmap = height_map(self.image, self.tool)
             self.feed = self.roughing_feed
             r = -self.roughing_delta
             m = self.image.min()
@@ -294,7 +373,7 @@ class Converter:
                 self.rd = m
                 self.one_pass()
             self.image = base_image
-            self.cache.clear()
+            self.heightmap = base_heightmap
         self.feed = self.base_feed
         self.ro = 0
         self.rd = self.image.min()
@@ -302,71 +381,138 @@ class Converter:
         g.end()
 
     def get_z(self, x, y):
-        try:
-            return min(0, max(self.rd, self.cache[x,y]) + self.ro)
-        except KeyError:
-            m1 = self.image[y:y+self.ts, x:x+self.ts]
-            self.cache[x,y] = d = (m1 - self.tool).max()
-            return min(0, max(self.rd, d) + self.ro)
-        
+        return min(0, max(self.rd, self.heightmap[y, x]) + self.ro)
+
     def get_dz_dy(self, x, y):
         y1 = max(0, y-1)
         y2 = min(self.image.shape[0]-1, y+1)
         dy = self.pixelsize * (y2-y1)
         return (self.get_z(x, y2) - self.get_z(x, y1)) / dy
-        
+
     def get_dz_dx(self, x, y):
         x1 = max(0, x-1)
         x2 = min(self.image.shape[1]-1, x+1)
         dx = self.pixelsize * (x2-x1)
         return (self.get_z(x2, y) - self.get_z(x1, y)) / dx
 
+    def get_z_line(self, zs):
+        return numpy.minimum(0, numpy.maximum(self.rd, zs.astype(float))
+                                + self.ro)
+
+    def get_gradient(self, z):
+        # the same differences as get_dz_dx and get_dz_dy, along a line
+        d = numpy.empty(len(z) - 1)
+        d[0] = (z[1] - z[0]) / self.pixelsize
+        d[1:] = (z[2:] - z[:-2]) / (2 * self.pixelsize)
+        return d
+
+    def get_row(self, j, n):
+        # z, dz/dx and dz/dy for the first n pixels of row j
+        hm = self.heightmap
+        j1 = max(0, j-1)
+        j2 = min(self.image.shape[0]-1, j+1)
+        z = self.get_z_line(hm[j, :n+1])
+        dy = (self.get_z_line(hm[j2, :n]) - self.get_z_line(hm[j1, :n])) \
+                / (self.pixelsize * (j2-j1))
+        return z[:n].tolist(), self.get_gradient(z).tolist(), dy.tolist()
+
+    def get_col(self, j, n):
+        # z, dz/dy and dz/dx for the first n pixels of column j
+        hm = self.heightmap
+        j1 = max(0, j-1)
+        j2 = min(self.image.shape[1]-1, j+1)
+        z = self.get_z_line(hm[:n+1, j])
+        dx = (self.get_z_line(hm[:n, j2]) - self.get_z_line(hm[:n, j1])) \
+                / (self.pixelsize * (j2-j1))
+        return z[:n].tolist(), self.get_gradient(z).tolist(), dx.tolist()
+
+    def row_scan(self, j):
+        w1 = self.w1; h1 = self.h1; pixelsize = self.pixelsize
+        y = (w1-j) * pixelsize
+        zs, dzdx, dzdy = self.get_row(j, h1)
+        scan = []
+        for i in range(h1):
+            x = i * pixelsize
+            milldata = (i, (x, y, zs[i]), dzdx[i], dzdy[i])
+            scan.append(milldata)
+        return scan
+
+    def col_scan(self, j):
+        w1 = self.w1; pixelsize = self.pixelsize
+        x = j * pixelsize
+        zs, dzdy, dzdx = self.get_col(j, w1)
+        scan = []
+        for i in range(w1):
+            y = (w1-i) * pixelsize
+            milldata = (i, (x, y, zs[i]), dzdy[i], dzdx[i])
+            scan.append(milldata)
+        return scan
+
+    def scan_groups(self, convert_scan, primary, cols, plane, k, j):
+        """\
+Convert the k-th scan line of a pass, row or column j.  The cuts of the
+line are split into groups at each entry cut, and each group is returned
+as (entry cut flag, first index, first points, simplified moves), which
+is all mill() needs to write the G-code of the line."""
+        if cols: scan = self.col_scan(j)
+        else: scan = self.row_scan(j)
+        convert_scan.reset()
+        convert_scan.skip(k)
+        groups = []
+        for flag, points in convert_scan(primary, scan):
+            if flag or not groups:
+                groups.append((flag, points[0][0], points[:2], []))
+            groups[-1][3].extend([list(p[1]) for p in points])
+        return [(flag, i0, first, list(douglas(cuts, self.tolerance, plane)))
+                for flag, i0, first, cuts in groups]
+
+    def mill(self, convert_scan, primary, cols, jrange):
+        g = self.g
+        args = (convert_scan, primary, cols, g.plane)
+        tasks = list(enumerate(jrange))
+        pool = None
+        if self.processes > 1 and len(tasks) > 1:
+            global pool_state
+            pool_state = self, args
+            pool = multiprocessing.Pool(min(self.processes, len(tasks)))
+            results = pool.imap(pool_scan_groups, tasks)
+        else:
+            results = (self.scan_groups(*(args + task)) for task in tasks)
+
+        try:
+            for k, j in tasks:
+                progress(k, len(tasks))
+                for flag, i0, first, moves in results.next():
+                    if flag:
+                        if cols: self.entry_cut(self, j, i0, first)
+                        else: self.entry_cut(self, i0, j, first)
+                    g.write_moves(moves)
+        finally:
+            if pool:
+                pool.terminate()
+                pool.join()
+        convert_scan.reset()
+        convert_scan.skip(len(tasks))
+
     def mill_rows(self, convert_scan, primary):
-        w1 = self.w1; h1 = self.h1;
-        pixelsize = self.pixelsize; pixelstep = self.pixelstep
+        w1 = self.w1; pixelstep = self.pixelstep
         jrange = range(0, w1, pixelstep)
         if w1-1 not in jrange: jrange.append(w1-1)
-        irange = range(h1)
-
-        for j in jrange:
-            progress(jrange.index(j), len(jrange))
-            y = (w1-j) * pixelsize
-            scan = []
-            for i in irange:
-                x = i * pixelsize
-                milldata = (i, (x, y, self.get_z(i, j)),
-                    self.get_dz_dx(i, j), self.get_dz_dy(i, j))
-                scan.append(milldata)
-            for flag, points in convert_scan(primary, scan):
-                if flag:
-                    self.entry_cut(self, points[0][0], j, points)
-                for p in points:
-                    self.g.cut(*p[1])
-            self.g.flush()
+        self.mill(convert_scan, primary, False, jrange)
 
     def mill_cols(self, convert_scan, primary):
-        w1 = self.w1; h1 = self.h1;
-        pixelsize = self.pixelsize; pixelstep = self.pixelstep
+        h1 = self.h1; pixelstep = self.pixelstep
         jrange = range(0, h1, pixelstep)
-        irange = range(w1)
         if h1-1 not in jrange: jrange.append(h1-1)
         jrange.reverse()
+        self.mill(convert_scan, primary, True, jrange)
+
+pool_state = None
 
-        for j in jrange:
-            progress(jrange.index(j), len(jrange))
-            x = j * pixelsize
-            scan = []
-            for i in irange:
-                y = (w1-i) * pixelsize
-                milldata = (i, (x, y, self.get_z(j, i)),
-                    self.get_dz_dy(j, i), self.get_dz_dx(j, i))
-                scan.append(milldata)
-            for flag, points in convert_scan(primary, scan):
-                if flag:
-                    self.entry_cut(self, j, points[0][0], points)
-                for p in points:
-                    self.g.cut(*p[1])
-            self.g.flush()
+def pool_scan_groups(task):
+    # runs in a worker process, which inherited pool_state when it was forked
+    conv, args = pool_state
+    return conv.scan_groups(*(args + task))
 
 def convert(*args, **kw):
     return Converter(*args, **kw).convert()
@@ -625,6 +771,7 @@ def ui(im, nim, im_name):
         ("contact_angle", floatentry),
         ("roughing_offset", floatentry),
         ("roughing_depth", floatentry),
+        ("processes", intentry),
     ]
 
     defaults = dict(
@@ -648,6 +795,7 @@ def ui(im, nim, im_name):
         spindle_speed = 1000,
         roughing_offset = .1,
         roughing_depth = .25,
+        processes = 0,
     )
 
     texts = dict(
@@ -671,6 +819,7 @@ def ui(im, nim, im_name):
         spindle_speed=_("Spindle Speed (RPM)"),
         roughing_offset=_("Roughing offset (units, 0=no roughing)"),
         roughing_depth=_("Roughing depth per pass (units)"),
+        processes=_("Processes (0=one per CPU)"),
     )
 
     try:
@@ -819,10 +968,12 @@ def main():
                 convert_rows = Reduce_Scan_Lace(convert_rows, slope, step+1)
 
     units = unitcodes[options['units']]
+    processes = options['processes'] or multiprocessing.cpu_count()
     convert(nim, units, tool, pixel_size, step,
         options['safety_height'], options['tolerance'], options['feed_rate'],
         convert_rows, convert_cols, columns_first, ArcEntryCut(options['plunge_feed_rate'], .125),
-        spindle_speed, options['roughing_offset'], options['roughing_depth'], options['feed_rate'])
+        spindle_speed, options['roughing_offset'], options['roughing_depth'], options['feed_rate'],
+        processes)
 
 if __name__ == '__main__':
     main()
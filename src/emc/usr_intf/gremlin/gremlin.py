@@ -38,6 +38,7 @@ import pango
 
 import rs274.glcanon
 import rs274.interpret
+import rs274.previewcache
 import linuxcnc
 import gcode
 
@@ -99,6 +100,15 @@ class Gremlin(gtk.gtkgl.widget.DrawingArea, glnav.GlNavBase,
 
         rs274.glcanon.GlCanonDraw.__init__(self, linuxcnc.stat(), self.logger)
 
+        # size of the on-disk preview cache in MB, 0 disables it
+        cache_size = int(inifile.find("DISPLAY", "PREVIEW_CACHE_SIZE") or 256)
+        if cache_size > 0:
+            self.preview_cache = rs274.previewcache.PreviewCache(
+                max_size=cache_size * 1024 * 1024)
+        # show the preview every this many moves while a program loads
+        self.preview_chunk_size = int(
+            inifile.find("DISPLAY", "PREVIEW_CHUNK_SIZE") or 10000)
+
         self.current_view = 'z'
 
         self.select_primed = None
@@ -189,6 +199,8 @@ class Gremlin(gtk.gtkgl.widget.DrawingArea, glnav.GlNavBase,
 
     def _redraw(self): self.expose()
 
+    def preview_chunk_ready(self): self.expose()
+
     def clear_live_plotter(self):
         self.logger.clear()
 
@@ -8,13 +8,32 @@
 
 from libc.errno cimport EAGAIN
 from libc.string cimport memcpy
-from buffer cimport PyBuffer_FillInfo
+from buffer cimport PyBuffer_FillInfo, PyObject_GetBuffer, PyBuffer_Release
+from buffer cimport PyBUF_SIMPLE, PyBUF_WRITABLE
 from cpython.bytes cimport PyBytes_AsString, PyBytes_Size, PyBytes_FromStringAndSize
 from cpython.string cimport PyString_FromStringAndSize
 from cpython cimport bool
 
 from .ring cimport *
 
+import time
+
+
+def _wait_ready(ready, timeout, max_interval = 0.005):
+    # rings have no kernel object to block on, since writers may be
+    # realtime functions: poll with a backoff from 0.1ms to max_interval
+    cdef double delay = 0.0001
+    deadline = None if timeout is None else time.time() + timeout
+    while not ready():
+        if deadline is not None:
+            left = deadline - time.time()
+            if left <= 0:
+                return False
+            delay = min(delay, left)
+        time.sleep(delay)
+        delay = min(delay * 2, max_interval)
+    return True
+
 
 cdef class Ring:
     cdef ringbuffer_t _rb
@@ -83,9 +102,58 @@ cdef class Ring:
             return None
         return memoryview(mview(<long>ptr, size))
 
+    def readinto(self, buf, int count = -1, sizes = None):
+        '''copy up to count records (all if count < 0) back to back into
+        the writable buffer buf, for instance a bytearray or a NumPy array,
+        and consume them. Stops early if the ring is empty or the next
+        record does not fit. Returns the number of records copied; if
+        sizes is a list, the size of each record is appended to it.'''
+
+        cdef Py_buffer view
+        cdef const void * ptr
+        cdef ringsize_t size
+        cdef size_t offset = 0
+        cdef int n = 0
+        cdef int r
+
+        PyObject_GetBuffer(buf, &view, PyBUF_SIMPLE | PyBUF_WRITABLE)
+        try:
+            while count < 0 or n < count:
+                r = record_read(&self._rb, &ptr, &size)
+                if r:
+                    if r != EAGAIN:
+                        raise IOError("Ring %s read failed: %d - %s" %
+                                      (self.name, r, strerror(r)))
+                    break
+                if offset + size > <size_t>view.len:
+                    break
+                memcpy(<char *>view.buf + offset, ptr, size)
+                offset += size
+                record_shift(&self._rb)
+                n += 1
+                if sizes is not None:
+                    sizes.append(size)
+        finally:
+            PyBuffer_Release(&view)
+        return n
+
     def shift(self):
         record_shift(&self._rb)
 
+    def ready(self):
+        '''True if a record, or for a stream ring any byte, can be read.'''
+        cdef const void * ptr
+        cdef ringsize_t size
+        if self._rb.header.type == RINGTYPE_STREAM:
+            return stream_read_space(self._rb.header) > 0
+        return record_read(&self._rb, &ptr, &size) == 0
+
+    def wait(self, timeout = None):
+        '''wait until ready() or timeout seconds have passed.
+        Returns ready(). See machinekit.ringwait for waiting on
+        a file descriptor instead.'''
+        return _wait_ready(self.ready, timeout)
+
     def __iter__(self):
         return RingIter(self)
 
@@ -217,6 +285,15 @@ cdef class StreamRing:
         '''returns the number of bytes readable or 0 if no data is available.'''
         return stream_read_space(self._rb.header)
 
+    def ready(self):
+        '''True if any byte can be read.'''
+        return stream_read_space(self._rb.header) > 0
+
+    def wait(self, timeout = None):
+        '''wait until ready() or timeout seconds have passed.
+        Returns ready().'''
+        return _wait_ready(self.ready, timeout)
+
     def write(self, s):
         '''write to ring. Returns 0 on success.
         nozero return value indicates the number
@@ -227,19 +304,57 @@ cdef class StreamRing:
     def read(self):
         ''' return all bytes readable as a string, or None'''
         cdef ringvec_t v[2]
+        cdef char *p
         stream_get_read_vector(self._rb, v)
 
         if v[0].rv_len:
-            b1 = PyString_FromStringAndSize(<const char *>v[0].rv_base, v[0].rv_len)
             if v[1].rv_len == 0:
+                b = PyString_FromStringAndSize(<const char *>v[0].rv_base, v[0].rv_len)
                 stream_read_advance(self._rb,v[0].rv_len)
-                return b1
+                return b
 
-            b2 = PyString_FromStringAndSize(<const char *>v[1].rv_base, v[1].rv_len)
+            # copy both parts into one string instead of concatenating
+            b = PyString_FromStringAndSize(NULL, v[0].rv_len + v[1].rv_len)
+            p = PyBytes_AsString(b)
+            memcpy(p, v[0].rv_base, v[0].rv_len)
+            memcpy(p + v[0].rv_len, v[1].rv_base, v[1].rv_len)
             stream_read_advance(self._rb,v[0].rv_len + v[1].rv_len)
-            return b1 + b2
+            return b
         return None
 
+    def readinto(self, buf):
+        ''' copy up to len(buf) readable bytes into the writable buffer
+        buf and consume them. Returns the number of bytes copied.'''
+        cdef Py_buffer view
+        cdef ringvec_t v[2]
+        cdef size_t n0, n1
+
+        PyObject_GetBuffer(buf, &view, PyBUF_SIMPLE | PyBUF_WRITABLE)
+        try:
+            stream_get_read_vector(self._rb, v)
+            n0 = min(<size_t>v[0].rv_len, <size_t>view.len)
+            n1 = min(<size_t>v[1].rv_len, <size_t>view.len - n0)
+            memcpy(view.buf, v[0].rv_base, n0)
+            memcpy(<char *>view.buf + n0, v[1].rv_base, n1)
+            stream_read_advance(self._rb, n0 + n1)
+        finally:
+            PyBuffer_Release(&view)
+        return n0 + n1
+
+    def views(self):
+        ''' return the readable bytes as a tuple of up to two memoryviews
+        into the ring, without copying. The bytes stay in the ring until
+        consume() is called, which invalidates the views.'''
+        cdef ringvec_t v[2]
+        stream_get_read_vector(self._rb, v)
+
+        if v[0].rv_len == 0:
+            return ()
+        if v[1].rv_len == 0:
+            return (memoryview(mview(<long>v[0].rv_base, v[0].rv_len)),)
+        return (memoryview(mview(<long>v[0].rv_base, v[0].rv_len)),
+                memoryview(mview(<long>v[1].rv_base, v[1].rv_len)))
+
 
 cdef class MultiframeRing:
     cdef msgbuffer_t _rb
@@ -279,6 +394,11 @@ cdef class MultiframeRing:
     def ready(self):
         return record_next_size(self._rb.ring) > -1
 
+    def wait(self, timeout = None):
+        '''wait until ready() or timeout seconds have passed.
+        Returns ready().'''
+        return _wait_ready(self.ready, timeout)
+
 def rings():
     ''' return list of ring names'''
     hal_required()
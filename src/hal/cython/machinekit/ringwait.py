@@ -0,0 +1,102 @@
+import os
+import fcntl
+import errno
+import threading
+import time
+
+
+class RingNotifier(object):
+    """A file descriptor that becomes readable when data is available on a
+    HAL ring, returned by RingWatcher.watch().
+
+    Register it with select(), zmq.Poller.register(notifier, zmq.POLLIN)
+    or asyncio's loop.add_reader(notifier, callback).  When it is readable,
+    call clear() and then read the ring until it is empty.
+    """
+
+    def __init__(self, ring):
+        self.ring = ring
+        self.signalled = False
+        self._r, self._w = os.pipe()
+        for fd in (self._r, self._w):
+            flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+            fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+
+    def fileno(self):
+        return self._r
+
+    def signal(self):
+        if self.signalled:
+            return
+        self.signalled = True
+        try:
+            os.write(self._w, b'\0')
+        except OSError as e:
+            if e.errno != errno.EAGAIN:
+                raise
+
+    def clear(self):
+        # drain before resetting the flag, a signal() in between then leaves
+        # a byte in the pipe instead of getting lost
+        try:
+            while os.read(self._r, 4096):
+                pass
+        except OSError as e:
+            if e.errno != errno.EAGAIN:
+                raise
+        self.signalled = False
+
+    def close(self):
+        os.close(self._r)
+        os.close(self._w)
+
+
+class RingWatcher(threading.Thread):
+    """Signal a RingNotifier whenever its ring has data to read.
+
+    Ring writers are often realtime functions which cannot make system
+    calls, so a ring has nothing to block on.  A single watcher thread
+    checks all watched rings every interval seconds instead of every
+    reader polling on its own; readers block on the notifier file
+    descriptor and only wake up when there is data.
+    """
+
+    def __init__(self, interval=0.001):
+        threading.Thread.__init__(self, name='ringwatcher')
+        self.daemon = True
+        self.interval = interval
+        self.notifiers = []
+        self.lock = threading.Lock()  # held while the notifiers are checked
+        self.running = True
+        self.started = False
+
+    def watch(self, ring):
+        with self.lock:
+            if not self.running:
+                raise RuntimeError('RingWatcher is stopped')
+            notifier = RingNotifier(ring)
+            self.notifiers.append(notifier)
+            if not self.started:
+                self.started = True
+                self.start()
+        return notifier
+
+    def unwatch(self, notifier):
+        # the watcher thread does not use the notifier while the lock is held
+        with self.lock:
+            self.notifiers.remove(notifier)
+            notifier.close()
+
+    def stop(self):
+        with self.lock:
+            self.running = False
+
+    def run(self):
+        while True:
+            with self.lock:
+                if not self.running:
+                    return
+                for notifier in self.notifiers:
+                    if not notifier.signalled and notifier.ring.ready():
+                        notifier.signal()
+            time.sleep(self.interval)
@@ -9,6 +9,8 @@ Created by Alexander Rössler on 2014-03-24.
 from drivers.MCP23017 import MCP23017
 
 import argparse
+import os
+import select
 import time
 import sys
 
@@ -26,6 +28,31 @@ class Pin:
         self.halInvertedPin = 0
 
 
+class InterruptPin:
+    # GPIO connected to the INT output of the MCP23017, a rising edge
+    # wakes up the poll on the sysfs value file
+    def __init__(self, gpio):
+        path = '/sys/class/gpio/gpio' + str(gpio)
+        if not os.path.exists(path):
+            with open('/sys/class/gpio/export', 'w') as f:
+                f.write(str(gpio))
+        with open(os.path.join(path, 'direction'), 'w') as f:
+            f.write('in')
+        with open(os.path.join(path, 'edge'), 'w') as f:
+            f.write('rising')
+        self.fd = os.open(os.path.join(path, 'value'), os.O_RDONLY)
+        self.poller = select.poll()
+        self.poller.register(self.fd, select.POLLPRI | select.POLLERR)
+
+    def active(self):
+        # reading the value also acknowledges the edge
+        os.lseek(self.fd, 0, os.SEEK_SET)
+        return os.read(self.fd, 2)[:1] == '1'
+
+    def wait(self, timeout):
+        self.poller.poll(timeout * 1000.0)
+
+
 def parseInputPin(pinRaw, direction):
     if (len(pinRaw) != 3):
         print(("wrong input"))
@@ -66,12 +93,14 @@ parser.add_argument('-i', '--interval', help='I2C update interval', default=0.05
 parser.add_argument('-op', '--output_pins', help='Komma separated list of output pins e.g. A01,B02', default="")
 parser.add_argument('-ip', '--input_pins', help='Komma separated list of input pins e.g. A01,B02', default="")
 parser.add_argument('-d', '--delay', help='Delay before the i2c should be updated', default=0.0)
+parser.add_argument('-g', '--interrupt_gpio', help='GPIO number connected to the INT pin, inputs are only read when they change', default=None)
 args = parser.parse_args()
 
 updateInterval = float(args.interval)
 delayInterval = float(args.delay)
 error = True
 watchdog = True
+readInputs = True
 
 gpio = MCP23017(busId=int(args.bus_id),
                 address=int(args.address))
@@ -92,6 +121,10 @@ if (len(pins) == 0):
     print(("No pins specified"))
     sys.exit(1)
 
+interruptPin = None
+if (args.interrupt_gpio is not None):
+    interruptPin = InterruptPin(int(args.interrupt_gpio))
+
 # Initialize HAL
 h = hal.component(args.name)
 for pin in pins:
@@ -116,14 +149,16 @@ try:
         try:
             if (error):
                 gpio.init()
+                for pin in pins:
+                    gpio.setDir(pin.port, pin.pin, pin.direction)
+                    if (interruptPin is not None):
+                        gpio.setInterrupt(pin.port, pin.pin, pin.direction == MCP23017.DIR_IN)
                 error = False
+                readInputs = True
 
-            gpio.read()  # read
+            # the driver keeps the register contents and only writes changes
             for pin in pins:
-                gpio.setDir(pin.port, pin.pin, pin.direction)
-                if (pin.direction == MCP23017.DIR_IN):
-                    pin.halPin.value = gpio.getValue(pin.port, pin.pin) != pin.halInvertedPin.value
-                else:
+                if (pin.direction == MCP23017.DIR_OUT):
                     gpio.setValue(pin.port, pin.pin, pin.halPin.value != pin.halInvertedPin.value)
                 pullup = pin.halPullupPin.value
                 if (pullup):
@@ -131,6 +166,13 @@ try:
                 else:
                     gpio.setPullup(pin.port, pin.pin, MCP23017.PULLUP_DIS)
             gpio.write()  # write
+
+            if (interruptPin is None) or readInputs or interruptPin.active():
+                gpio.read()  # read
+                readInputs = False
+            for pin in pins:
+                if (pin.direction == MCP23017.DIR_IN):
+                    pin.halPin.value = gpio.getValue(pin.port, pin.pin) != pin.halInvertedPin.value
         except IOError as e:
             error = True
 
@@ -138,7 +180,10 @@ try:
         halNoErrorPin.value = not error
         watchdog = not watchdog
         halWatchdogPin.value = watchdog
-        time.sleep(updateInterval)
+        if (interruptPin is not None) and not error:
+            interruptPin.wait(updateInterval)
+        else:
+            time.sleep(updateInterval)
 except:
     print(("exiting HAL component " + args.name))
     h.exit()
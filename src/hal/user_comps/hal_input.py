@@ -49,140 +49,142 @@ class HalWrapper:
 	raise KeyError, k
 	self._drive[k] = v
 
+class Axis:
+    # pins of a relative or absolute axis
+    pass
+
 class HalInputDevice:
     def __init__(self, comp, idx, name, parts='KRAL'):
-	self.device = linux_event.InputDevice(name)
-
-	self.idx = idx
-	self.codes = set()
-	self.last = {}
-	self.rel_items = []
-	self.abs_items = []
-	self.comp = comp
+        self.device = linux_event.InputDevice(name)
+
+        self.idx = idx
+        # event code -> pin handles, resolved once instead of per event
+        self.keys = {}
+        self.rels = {}
+        self.abss = {}
+        self.leds = []
+        self.comp = comp
         self.parts = parts
 
         if 'K' in parts:
             for key in self.device.get_bits('EV_KEY'):
-                key = tohalname(key)
-                self.codes.add(key)
-                comp.newpin("%s.%s" % (idx, key), HAL_BIT, HAL_OUT)
-                comp.newpin("%s.%s-not" % (idx, key), HAL_BIT, HAL_OUT)
-                self.set(key + "-not", 1)
+                name = tohalname(key)
+                pin = self.newpin(name, HAL_BIT, HAL_OUT)
+                notpin = self.newpin(name + "-not", HAL_BIT, HAL_OUT)
+                notpin.set(1)
+                self.keys[key] = (pin, notpin)
 
         if 'R' in parts:
-            for axis in self.device.get_bits('EV_REL'):
-                name = tohalname(axis)
-                self.codes.add(name)
-                comp.newpin("%s.%s-position" % (idx, name), HAL_FLOAT, HAL_OUT)
-                comp.newpin("%s.%s-counts" % (idx, name), HAL_S32, HAL_OUT)
-                comp.newpin("%s.%s-reset" % (idx, name), HAL_BIT, HAL_IN)
-                comp.newpin("%s.%s-scale" % (idx, name), HAL_FLOAT, HAL_IN)
-                self.set(name + '-scale', 1.)
-                self.rel_items.append(name)
+            for code in self.device.get_bits('EV_REL'):
+                name = tohalname(code)
+                axis = Axis()
+                axis.position = self.newpin(name + "-position", HAL_FLOAT, HAL_OUT)
+                axis.counts = self.newpin(name + "-counts", HAL_S32, HAL_OUT)
+                axis.reset = self.newpin(name + "-reset", HAL_BIT, HAL_IN)
+                axis.scale = self.newpin(name + "-scale", HAL_FLOAT, HAL_IN)
+                axis.scale.set(1.)
+                self.rels[code] = axis
 
         if 'A' in parts:
-            for axis in self.device.get_bits('EV_ABS'):
-                name = tohalname(axis)
-                self.codes.add(name)
-                absinfo = self.device.get_absinfo(axis)
-                comp.newpin("%s.%s-position" % (idx, name), HAL_FLOAT, HAL_OUT)
-                comp.newpin("%s.%s-counts" % (idx, name), HAL_S32, HAL_OUT)
-                comp.newpin("%s.%s-is-pos" % (idx, name), HAL_BIT, HAL_OUT)
-                comp.newpin("%s.%s-is-neg" % (idx, name), HAL_BIT, HAL_OUT)
-                comp.newpin("%s.%s-scale" % (idx, name), HAL_FLOAT, HAL_IN)
-                comp.newpin("%s.%s-offset" % (idx, name), HAL_FLOAT, HAL_IN)
-                comp.newpin("%s.%s-fuzz" % (idx, name), HAL_S32, HAL_IN)
-                comp.newpin("%s.%s-flat" % (idx, name), HAL_S32, HAL_IN)
-                comp.newparam("%s.%s-min" % (idx, name), HAL_S32, HAL_RO)
-                comp.newparam("%s.%s-max" % (idx, name), HAL_S32, HAL_RO)
+            for code in self.device.get_bits('EV_ABS'):
+                name = tohalname(code)
+                absinfo = self.device.get_absinfo(code)
+                axis = Axis()
+                axis.position = self.newpin(name + "-position", HAL_FLOAT, HAL_OUT)
+                axis.counts = self.newpin(name + "-counts", HAL_S32, HAL_OUT)
+                axis.is_pos = self.newpin(name + "-is-pos", HAL_BIT, HAL_OUT)
+                axis.is_neg = self.newpin(name + "-is-neg", HAL_BIT, HAL_OUT)
+                axis.scale = self.newpin(name + "-scale", HAL_FLOAT, HAL_IN)
+                axis.offset = self.newpin(name + "-offset", HAL_FLOAT, HAL_IN)
+                axis.fuzz = self.newpin(name + "-fuzz", HAL_S32, HAL_IN)
+                axis.flat = self.newpin(name + "-flat", HAL_S32, HAL_IN)
+                minimum = comp.newparam("%s.%s-min" % (idx, name), HAL_S32, HAL_RO)
+                maximum = comp.newparam("%s.%s-max" % (idx, name), HAL_S32, HAL_RO)
                 center = (absinfo.minimum + absinfo.maximum)/2.
                 halfrange = (absinfo.maximum - absinfo.minimum)/2. or 1
-                self.set(name + "-counts", absinfo.value)
-                self.set(name + "-position",
-                    (absinfo.value - center) / halfrange)
-                self.set(name + "-scale", halfrange)
-                self.set(name + "-offset", center)
-                self.set(name + "-fuzz", absinfo.fuzz)
-                self.set(name + "-flat", absinfo.flat)
-                self.set(name + "-min", absinfo.minimum)
-                self.set(name + "-max", absinfo.maximum)
-                self.abs_items.append(name)
-
-	self.ledmap = {}
+                axis.counts.set(absinfo.value)
+                axis.position.set((absinfo.value - center) / halfrange)
+                axis.scale.set(halfrange)
+                axis.offset.set(center)
+                axis.fuzz.set(absinfo.fuzz)
+                axis.flat.set(absinfo.flat)
+                minimum.set(absinfo.minimum)
+                maximum.set(absinfo.maximum)
+                self.abss[code] = axis
+
         if 'L' in parts:
             for led in self.device.get_bits('EV_LED'):
                 name = tohalname(led)
-                self.ledmap[name] = led
-                comp.newpin("%s.%s" % (idx, name), HAL_BIT, HAL_IN)
-                comp.newpin("%s.%s-invert" % (idx, name), HAL_BIT, HAL_IN)
-                self.last[name] = 0
+                pin = self.newpin(name, HAL_BIT, HAL_IN)
+                invert = self.newpin(name + "-invert", HAL_BIT, HAL_IN)
+                self.leds.append([led, pin, invert, 0])
                 self.device.write_event('EV_LED', led, 0)
-	
-    def get(self, name):
-	name = "%s.%s" % (self.idx, name)
-	return self.comp[name]
 
-    def set(self, name, value):
-	name = "%s.%s" % (self.idx, name)
-	self.comp[name] = value
+    def newpin(self, name, type, dir):
+        return self.comp.newpin("%s.%s" % (self.idx, name), type, dir)
+
+    def read(self):
+        # handle the events available, read in one batch
+        for ev in self.device.read_events():
+            if ev.type == 'EV_KEY':
+                if 'K' not in self.parts: continue
+                pins = self.keys.get(ev.code)
+                if pins is None:
+                    print >>sys.stderr, "Unexpected event", ev.type, ev.code
+                    continue
+                if ev.value:
+                    pins[0].set(1)
+                    pins[1].set(0)
+                else:
+                    pins[0].set(0)
+                    pins[1].set(1)
+            elif ev.type == 'EV_REL':
+                if 'R' not in self.parts: continue
+                axis = self.rels.get(ev.code)
+                if axis is None:
+                    print >>sys.stderr, "Unexpected event", ev.type, ev.code
+                    continue
+                axis.counts.set(axis.counts.get() + ev.value)
+            elif ev.type == 'EV_ABS':
+                if 'A' not in self.parts: continue
+                axis = self.abss.get(ev.code)
+                if axis is None:
+                    print >>sys.stderr, "Unexpected event", ev.type, ev.code
+                    continue
+                flat = axis.flat.get()
+                center = int(axis.offset.get())
+                if ev.value < center-flat or ev.value > center+flat:
+                    value = ev.value
+                else: value = center
+                if abs(value - axis.counts.get()) > axis.fuzz.get():
+                    axis.counts.set(value)
+            elif ev.type in ('EV_SYN', 'EV_SND', 'EV_MSC', 'EV_LED'):
+                continue
+            else:
+                print >>sys.stderr, "Unexpected event", ev.type, ev.code
 
     def update(self):
-	while self.device.readable():
-	    ev = self.device.read_event()
-	    if ev.type == 'EV_SYN': continue
-	    elif ev.type == 'EV_SND': continue
-	    elif ev.type == 'EV_MSC': continue
-            elif ev.type == 'EV_LED': continue
-            elif ev.type == 'EV_KEY' and 'K' not in self.parts: continue
-            elif ev.type == 'EV_REL' and 'R' not in self.parts: continue
-            elif ev.type == 'EV_ABS' and 'A' not in self.parts: continue
-	    code = tohalname(ev.code)
-	    if code not in self.codes:
-		print >>sys.stderr, "Unexpected event", ev.type, ev.code
-		continue
-	    if ev.type == 'EV_KEY':
-		if ev.value:
-		    self.set(code, 1)
-		    self.set(code + "-not", 0)
-		else:
-		    self.set(code, 0)
-		    self.set(code + "-not", 1)
-	    elif ev.type == 'EV_REL':
-		self.set(code + "-counts", self.get(code + "-counts") + ev.value)
-	    elif ev.type == 'EV_ABS':
-		flat = self.get(code + "-flat")
-		fuzz = self.get(code + "-fuzz")
-		center = int(self.get(code + "-offset"))
-		if ev.value < center-flat or ev.value > center+flat:
-		    value = ev.value
-		else: value = center
-		if abs(value - self.get(code + "-counts")) > fuzz:
-		    self.set(code + "-counts", value)
-
-                
-	for a in self.abs_items:
-	    value = self.get(a + "-counts")
-	    scale = self.get(a + "-scale") or 1
-	    offset = self.get(a + "-offset")
-	    position = (value - offset) / scale
-	    self.set(a + "-position", position)
-	    # Use .01 because my Joystick isn't exactly zero at rest. maybe should be a parameter?
-	    self.set(a + "-is-neg", (position < -.01) )
-	    self.set(a + "-is-pos", (position >  .01) )
-
-	for r in self.rel_items:
-	    reset = self.get(r + "-reset")
-	    scale = self.get(r + "-scale") or 1
-	    if reset: self.set(r + "-counts", 0)
-	    self.set(r + "-position", self.get(r + "-counts") / scale)
-
-	for k, v in self.last.items():
-	    # Note: this is OK because the hal module always returns True or False for HAL_BIT values
-	    u = self.comp["%s.%s" % (self.idx, k)] != self.comp["%s.%s-invert" % (self.idx, k)]
-	    if u != self.last[k]:
-		led = self.ledmap[k]
-		self.device.write_event('EV_LED', led, u)
-		self.last[k] = u
+        for axis in self.abss.itervalues():
+            value = axis.counts.get()
+            scale = axis.scale.get() or 1
+            offset = axis.offset.get()
+            position = (value - offset) / scale
+            axis.position.set(position)
+            # Use .01 because my Joystick isn't exactly zero at rest. maybe should be a parameter?
+            axis.is_neg.set(position < -.01)
+            axis.is_pos.set(position > .01)
+
+        for axis in self.rels.itervalues():
+            scale = axis.scale.get() or 1
+            if axis.reset.get(): axis.counts.set(0)
+            axis.position.set(axis.counts.get() / scale)
+
+        for led in self.leds:
+            # Note: this is OK because the hal module always returns True or False for HAL_BIT values
+            u = led[1].get() != led[2].get()
+            if u != led[3]:
+                self.device.write_event('EV_LED', led[0], u)
+                led[3] = u
 
 h = component("hal_input")
 w = HalWrapper(h)
@@ -203,11 +205,26 @@ for f in sys.argv[1:]:
 w.drive()
 h.ready()
 
-fds = [dev.device.fileno() for dev in d]
+# one epoll loop for all devices: events are handled as soon as they
+# arrive, the pins driven by HAL inputs are updated every 10ms
+poller = select.epoll()
+devices = {}
+for dev in d:
+    poller.register(dev.device.fileno(), select.EPOLLIN)
+    devices[dev.device.fileno()] = dev
+interval = .01
+next_update = time.time()
 try:
     while 1:
-	select.select(fds, [], [], .01)
-	for i in d: i.update()
-	w.drive()
+        timeout = max(next_update - time.time(), 0)
+        ready = poller.poll(timeout)
+        for fd, event in ready:
+            devices[fd].read()
+        if time.time() >= next_update:
+            for dev in d: dev.update()
+            next_update = time.time() + interval
+        else:
+            for fd, event in ready: devices[fd].update()
+        w.drive()
 except KeyboardInterrupt:
     pass
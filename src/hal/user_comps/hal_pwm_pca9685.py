@@ -16,16 +16,10 @@ import hal
 
 class Pin:
     def __init__(self):
-        self.enable = False
-        self.value = 0.0
         self.pin = 0
         self.halValuePin = 0
         self.halEnablePin = 0
 
-    def reset(self):
-        self.enable = False
-        self.value = 0.0
-
 
 def getHalName(pin):
     return "out-" + '{0:02d}'.format(pin.pin)
@@ -86,10 +80,11 @@ halNoErrorPin.value = not error
 halWatchdogPin.value = watchdog
 halResetPin.value = reset
 
+updatePin = 0
+
 try:
     time.sleep(delayInterval)
     while (True):
-        updatePin = 0
         try:
             if (halResetPin.value != reset):
                 reset = halResetPin.value
@@ -98,45 +93,32 @@ try:
 
             if error or resetTriggered:
                 pwm.init()
-                for pin in pins:
-                    pin.reset()
                 error = False
                 resetTriggered = False
 
             updated = False  # when idle update a pin to monitor the I2C state
 
             if (frequencyPin.value != frequencyValue):
-                pwm.setPwmClock(frequencyValue)
+                # remember the frequency only once it reached the device,
+                # after an I2C error it is set again with the next cycle
+                pwm.setPwmClock(frequencyPin.value)
                 frequencyValue = frequencyPin.value
                 updated = True
 
+            # the driver only writes channels whose duty cycle changed
             for pin in pins:
-                value = pin.halValuePin.value
-                enable = pin.halEnablePin.value
-                if (enable != pin.enable):
-                    if (enable):
-                        pwm.setPwmDuty(pin.pin, value)
-                        pin.value = value
-                    else:
-                        pwm.setPwmDuty(pin.pin, 0.0)
-                    pin.enable = enable
-                    updated = True
-                elif (value != pin.value):
-                    if (pin.enable):
-                        pwm.setPwmDuty(pin.pin, value)
-                        updated = True
-                    pin.value = value
-
-            if not updated:
-                pin = pins[updatePin]
-                if (pin.enable):
-                    pwm.setPwmDuty(pin.pin, pin.value)
+                if (pin.halEnablePin.value):
+                    pwm.setPwmDuty(pin.pin, pin.halValuePin.value)
                 else:
                     pwm.setPwmDuty(pin.pin, 0.0)
+
+            if not updated and not pwm.dirty():
+                pwm.refresh(pins[updatePin].pin)
                 if updatePin < (len(pins) - 1):
                     updatePin += 1
                 else:
                     updatePin = 0
+            pwm.write()
         except IOError as e:
             error = True
 
@@ -10,6 +10,8 @@ import time
 import sys
 import os
 import argparse
+import threading
+import StringIO
 
 import ConfigParser
 
@@ -23,23 +25,128 @@ class Pin:
         self.section = ''
         self.name = ''
         self.lastValue = 0.0
-        
-        
-def savePins(cfg, filename, pins):
-    for pin in pins:
-        cfg.set(pin.section, pin.name, str(pin.halPin.value))
-    with open(filename, 'w') as f:
-        cfg.write(f)
-        f.close()
-        
-        
-def readPins(cfg, filename, pins):
-    cfg.read(filename)
-    for pin in pins:
-        pin.lastValue = float(cfg.get(pin.section, pin.name))
-        pin.halPin.value = pin.lastValue
-        
-        
+        self.dirty = False
+
+
+class Storage:
+    # Values are stored in the INI file, which is replaced atomically by a
+    # temporary file.  With a journal, changed values are appended to
+    # <file>.journal instead; when it grows too long it is renamed to
+    # <file>.journal.old and merged into the INI file in the background.
+    def __init__(self, cfg, filename, pins, journal=False, journalSize=100):
+        self.cfg = cfg
+        self.filename = filename
+        self.pins = pins
+        self.journal = journal
+        self.journalSize = journalSize
+        self.journalName = filename + '.journal'
+        self.journalOldName = filename + '.journal.old'
+        self.journalFile = None
+        self.journalEntries = 0
+        self.lock = threading.Lock()  # protects cfg and the files
+        self.compactThread = None
+
+    def configData(self):
+        data = StringIO.StringIO()
+        self.cfg.write(data)
+        return data.getvalue()
+
+    def writeConfig(self, data):
+        tmpName = self.filename + '.tmp'
+        with open(tmpName, 'w') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(tmpName, self.filename)
+
+    def readJournal(self, name):
+        if not os.path.isfile(name):
+            return
+        with open(name, 'r') as f:
+            for line in f:
+                entry = line.rstrip('\n').split('\t')
+                if (len(entry) != 3) or not line.endswith('\n'):
+                    continue  # incomplete last entry
+                try:
+                    self.cfg.set(entry[0], entry[1], entry[2])
+                except ConfigParser.NoSectionError:
+                    pass
+
+    def read(self):
+        self.waitCompact()
+        with self.lock:
+            self.cfg.read(self.filename)
+            if self.journal:
+                self.readJournal(self.journalOldName)
+                self.readJournal(self.journalName)
+            for pin in self.pins:
+                pin.lastValue = float(self.cfg.get(pin.section, pin.name))
+                pin.halPin.value = pin.lastValue
+                pin.dirty = False
+
+    def save(self):
+        # write all values to the INI file, the journals are not needed then
+        self.waitCompact()
+        with self.lock:
+            for pin in self.pins:
+                self.cfg.set(pin.section, pin.name, str(pin.halPin.value))
+                pin.dirty = False
+            self.writeConfig(self.configData())
+            if self.journal:
+                self.closeJournal()
+                for name in (self.journalName, self.journalOldName):
+                    if os.path.isfile(name):
+                        os.remove(name)
+
+    def update(self, pins):
+        # store the values of changed pins
+        if not self.journal:
+            self.save()
+            return
+        with self.lock:
+            if self.journalFile is None:
+                self.journalFile = open(self.journalName, 'a')
+            for pin in pins:
+                value = str(pin.halPin.value)
+                self.cfg.set(pin.section, pin.name, value)
+                self.journalFile.write('%s\t%s\t%s\n' % (pin.section, pin.name, value))
+                self.journalEntries += 1
+                pin.dirty = False
+            self.journalFile.flush()
+            os.fsync(self.journalFile.fileno())
+        if (self.journalEntries >= self.journalSize) \
+           and ((self.compactThread is None) or not self.compactThread.is_alive()):
+            self.compact()
+
+    def closeJournal(self):
+        if self.journalFile is not None:
+            self.journalFile.close()
+            self.journalFile = None
+        self.journalEntries = 0
+
+    def compact(self):
+        if os.path.isfile(self.journalOldName):  # left over from a crash
+            self.save()
+            return
+        with self.lock:
+            self.closeJournal()
+            os.rename(self.journalName, self.journalOldName)
+            data = self.configData()
+        self.compactThread = threading.Thread(target=self.compactJournal, args=(data,))
+        self.compactThread.start()
+
+    def compactJournal(self, data):
+        # data contains all entries of the old journal, it is only dropped
+        # once the INI file is replaced
+        self.writeConfig(data)
+        os.remove(self.journalOldName)
+
+    def waitCompact(self):
+        if self.compactThread is not None:
+            self.compactThread.join()
+            self.compactThread = None
+
+
 parser = argparse.ArgumentParser(description='HAL component to store and load values')
 parser.add_argument('-n', '--name', help='HAL component name', required=True)
 parser.add_argument('-f', '--file', help='Filename to store values', required=True)
@@ -47,10 +154,16 @@ parser.add_argument('-x', '--on_exit', help='Save on exit', action='store_true')
 parser.add_argument('-a', '--autosave', help='Automatically save on value change', action='store_true')
 parser.add_argument('-l', '--autoload', help='Automatically load the file values', action='store_true')
 parser.add_argument('-i', '--interval', help='Update interval', default=1.00)
+parser.add_argument('-w', '--write_delay', help='Autosave once the values did not change for this time', default=0.0)
+parser.add_argument('-m', '--max_delay', help='Autosave changes at latest after this time', default=10.0)
+parser.add_argument('-j', '--journal', help='Autosave changes to an append-only journal', action='store_true')
+parser.add_argument('-s', '--journal_size', help='Number of journal entries before it is merged into the file', default=100)
 
 args = parser.parse_args()
 
 updateInterval = float(args.interval)
+writeDelay = float(args.write_delay)
+maxDelay = float(args.max_delay)
 autosave = args.autosave
 autoload = args.autoload
 saveOnExit = args.on_exit
@@ -79,33 +192,51 @@ halReadTriggerPin = h.newpin("read-trigger", hal.HAL_BIT, hal.HAL_IN)
 halWriteTriggerPin = h.newpin("write-trigger", hal.HAL_BIT, hal.HAL_IN)
 h.ready()
 
+storage = Storage(cfg, filename, pins, journal=args.journal,
+                  journalSize=int(args.journal_size))
+
 if autoload:
-    readPins(cfg, filename, pins)
+    storage.read()
     loaded = True
 
 lastReadTrigger = 0
 lastWriteTrigger = 0
+firstChange = 0.0  # time of the oldest unsaved change
+lastChange = 0.0
 
 try:
     while (True):
         if lastReadTrigger ^ halReadTriggerPin.value:
             lastReadTrigger = halReadTriggerPin.value
-            readPins(cfg, filename, pins)
+            storage.read()
             loaded = True
-            
+
         if lastWriteTrigger ^ halWriteTriggerPin.value:
             lastWriteTrigger = halWriteTriggerPin.value
-            savePins(cfg, filename, pins)
-            
+            storage.save()
+
         if autosave and loaded:
+            # all pins changed since the last pass are saved with one write
+            # once they settled
+            now = time.time()
             for pin in pins:
                 if pin.halPin.value != pin.lastValue:
                     pin.lastValue = pin.halPin.value
-                    savePins(cfg, filename, pins)
-                    
+                    if not firstChange:
+                        firstChange = now
+                    lastChange = now
+                    pin.dirty = True
+            if firstChange and (((now - lastChange) >= writeDelay)
+                                or ((now - firstChange) >= maxDelay)):
+                storage.update([pin for pin in pins if pin.dirty])
+                firstChange = 0.0
+
         time.sleep(updateInterval)
 except KeyboardInterrupt:
     if saveOnExit:
-        savePins(cfg, filename, pins)
+        storage.save()
+    elif firstChange:
+        storage.update([pin for pin in pins if pin.dirty])
+    storage.waitCompact()
     print(("exiting HAL component " + args.name))
     h.exit()
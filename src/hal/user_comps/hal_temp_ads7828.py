@@ -7,7 +7,8 @@ Created by Alexander Rössler on 2014-03-24.
 """
 
 from drivers.ADS7828 import ADS7828
-from fdm.r2temp import R2Temp
+from fdm import filters
+from fdm import r2temp
 
 import argparse
 import time
@@ -19,35 +20,20 @@ import hal
 class Pin:
     def __init__(self):
         self.pin = 0
-        self.r2temp = None
+        self.thermistor = None
         self.halValuePin = 0
         self.halRawPin = 0
-        self.filterSamples = []
-        self.filterSize = 10
-        self.rawValue = 0.0
-        self.filterSamples = []
+        self.filter = None
         self.rawValue = 0.0
 
     def addSample(self, value):
-        self.filterSamples.append(value)
-        if (len(self.filterSamples) > self.filterSize):
-            self.filterSamples.pop(0)
-        sampleSum = 0.0
-        for sample in self.filterSamples:
-            sampleSum += sample
-        self.rawValue = sampleSum / len(self.filterSamples)
+        self.rawValue = self.filter.add(value)
 
 
 def getHalName(pin):
     return "ch-" + '{0:02d}'.format(pin.pin)
 
 
-def adc2Temp(pin):
-    R1 = 4700.0
-    R2 = R1 / max(4095.0 / pin.rawValue - 1.0, 0.000001)
-    return round(pin.r2temp.r2t(R2) * 10.0) / 10.0
-
-
 parser = argparse.ArgumentParser(description='HAL component to read Temperature values over I2C')
 parser.add_argument('-n', '--name', help='HAL component name', required=True)
 parser.add_argument('-b', '--bus_id', help='I2C bus id', default=2)
@@ -55,6 +41,8 @@ parser.add_argument('-a', '--address', help='I2C device address', default=0x20)
 parser.add_argument('-i', '--interval', help='I2C update interval', default=0.05)
 parser.add_argument('-c', '--channels', help='Komma separated list of channels and thermistors to use e.g. 01:semitec_103GT_2,02:epcos_B57560G1104', required=True)
 parser.add_argument('-f', '--filter_size', help='Size of the low pass filter to use', default=10)
+parser.add_argument('-t', '--filter_type', help='Type of the low pass filter to use', default='mean',
+                    choices=sorted(filters.filterTypes))
 parser.add_argument('-d', '--delay', help='Delay before the i2c should be updated', default=0.0)
 
 args = parser.parse_args()
@@ -62,6 +50,7 @@ args = parser.parse_args()
 updateInterval = float(args.interval)
 delayInterval = float(args.delay)
 filterSize = int(args.filter_size)
+filterType = args.filter_type
 error = True
 watchdog = True
 
@@ -84,15 +73,20 @@ if (args.channels != ""):
             print(("Pin not available"))
             sys.exit(1)
         if (pinRaw[1] != "none"):
-            pin.r2temp = R2Temp(pinRaw[1])
-        pin.filterSize = filterSize
+            pin.thermistor = pinRaw[1]
+        pin.filter = filters.createFilter(filterType, filterSize)
         pins.append(pin)
 
+# All channels with a thermistor are converted at once
+tempPins = [pin for pin in pins if pin.thermistor is not None]
+converter = r2temp.TempConverter([r2temp.lookupTable(pin.thermistor, 'ADS7828')
+                                  for pin in tempPins])
+
 # Initialize HAL
 h = hal.component(args.name)
 for pin in pins:
     pin.halRawPin = h.newpin(getHalName(pin) + ".raw", hal.HAL_FLOAT, hal.HAL_OUT)
-    if (pin.r2temp is not None):
+    if (pin.thermistor is not None):
         pin.halValuePin = h.newpin(getHalName(pin) + ".value", hal.HAL_FLOAT, hal.HAL_OUT)
 halErrorPin = h.newpin("error", hal.HAL_BIT, hal.HAL_OUT)
 halNoErrorPin = h.newpin("no-error", hal.HAL_BIT, hal.HAL_OUT)
@@ -111,8 +105,10 @@ try:
                 value = float(adc.readChannel(pin.pin))
                 pin.addSample(value)
                 pin.halRawPin.value = pin.rawValue
-                if (pin.r2temp is not None):
-                    pin.halValuePin.value = adc2Temp(pin)
+            if tempPins:
+                temps = converter.convert([pin.rawValue for pin in tempPins])
+                for pin, temp in zip(tempPins, temps.round(1)):
+                    pin.halValuePin.value = temp
             error = False
         except IOError as e:
             error = True
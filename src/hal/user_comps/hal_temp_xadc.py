@@ -51,6 +51,7 @@ import sys
 import time
 
 import hal
+from fdm import filters
 from fdm.r2temp import R2Temp
 
 # CRAMPS board:  A voltage divider is formed by a pull-up resistor,
@@ -96,21 +97,12 @@ class Pin:
         self.r2temp = None
         self.halValuePin = 0
         self.halRawPin = 0
-        self.filterSamples = []
-        self.filterSize = 10
+        self.filter = None
         self.rawValue = 0.0
         self.filename = ""
-        self.filterSamples = []
-        self.rawValue = 0.0
 
     def addSample(self, value):
-        self.filterSamples.append(value)
-        if (len(self.filterSamples) > self.filterSize):
-            self.filterSamples.pop(0)
-        sampleSum = 0.0
-        for sample in self.filterSamples:
-            sampleSum += sample
-        self.rawValue = sampleSum / len(self.filterSamples)
+        self.rawValue = self.filter.add(value)
 
 
 def adc2Temp(pin):
@@ -148,6 +140,8 @@ parser.add_argument('-n','--name', help='HAL component name',required=True)
 parser.add_argument('-i', '--interval', help='Adc update interval', default=0.05)
 parser.add_argument('-c', '--channels', help='Komma separated list of channels and thermistors to use e.g. 01:semitec_103GT_2,02:epcos_B57560G1104', required=True)
 parser.add_argument('-f', '--filter_size', help='Size of the low pass filter to use', default=10)
+parser.add_argument('-t', '--filter_type', help='Type of the low pass filter to use', default='mean',
+                    choices=sorted(filters.filterTypes))
 parser.add_argument('-b', '--baseboard', help='Type of baseboard used', default='Replicookie')
 parser.add_argument('-r', '--r_pu', default=2000, type=float,
                     help='Divider pull-up resistor value (default 2k Ohms)')
@@ -157,6 +151,7 @@ args = parser.parse_args()
 
 updateInterval = float(args.interval)
 filterSize = int(args.filter_size)
+filterType = args.filter_type
 error = False
 watchdog = True
 
@@ -175,7 +170,7 @@ if (args.channels != ""):
         checkAdcInput(pin)
         if (pinRaw[1] != "none"):
             pin.r2temp = R2Temp(pinRaw[1])
-        pin.filterSize = filterSize
+        pin.filter = filters.createFilter(filterType, filterSize)
         pins.append(pin)
 
 
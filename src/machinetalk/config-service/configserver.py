@@ -7,6 +7,7 @@ import threading
 import signal
 import time
 import argparse
+import hashlib
 
 import ConfigParser
 from machinekit import service
@@ -18,6 +19,63 @@ from machinetalk.protobuf.config_pb2 import CLEARTEXT, QT5_QML, GLADEVCP, JAVASC
 import machinetalk.protobuf.types_pb2 as pb
 
 
+def hash_file(pathname):
+    h = hashlib.sha1()
+    with open(pathname, 'rb') as f:
+        while True:
+            data = f.read(1 << 16)
+            if not data:
+                break
+            h.update(data)
+    return h.hexdigest()
+
+
+class AppFiles(object):
+    """Manifest of the files of an app directory.
+
+    Every file is listed with its path name, hash and size.  A file is
+    only hashed again when its mtime or size changes.  The serialized
+    reply with all files of the app is kept until one of them changes.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.files = {}  # name -> (pathname, mtime, size, hash)
+        self.detail = None
+
+    def scan(self, path, files):
+        for f in os.listdir(path):
+            pathname = os.path.join(path, f)
+            st = os.stat(pathname)
+            if S_ISREG(st.st_mode):
+                filename = os.path.join(os.path.relpath(path, self.path), f)
+                files[filename] = (pathname, st.st_mtime, st.st_size)
+            elif S_ISDIR(st.st_mode):
+                self.scan(pathname, files)
+
+    def update(self):
+        files = {}
+        self.scan(self.path, files)
+        changed = len(files) != len(self.files)
+        for filename, (pathname, mtime, size) in files.items():
+            old = self.files.get(filename)
+            if old is not None and old[1:3] == (mtime, size):
+                continue
+            self.files[filename] = (pathname, mtime, size, hash_file(pathname))
+            changed = True
+        for filename in list(self.files):
+            if filename not in files:
+                del self.files[filename]
+        if changed:
+            self.detail = None
+        return changed
+
+    def read(self, filename, offset=0, size=-1):
+        with open(self.files[filename][0], 'rb') as f:
+            f.seek(offset)
+            return f.read(size)
+
+
 class ConfigServer(object):
     def __init__(self, context, appDirs=None, topdir=".",
                  host='', svcUuid=None, debug=False, name=None,
@@ -53,6 +111,7 @@ class ConfigServer(object):
                         print(("type: " + cfg.get('Default', 'type')))
                         print(("files: " + root))
 
+        self.appFiles = {}
         self.rx = Container()
         self.tx = Container()
         self.topdir = topdir
@@ -136,35 +195,87 @@ class ConfigServer(object):
             app.type = self.typeToPb(self.cfg.get(name, 'type'))
         self.send_msg(origin, pb.MT_DESCRIBE_APPLICATION)
 
-    def add_files(self, basePath, path, app):
-        if self.debug:
-            print(("add files " + path))
-        for f in os.listdir(path):
-            pathname = os.path.join(path, f)
-            mode = os.stat(pathname).st_mode
-            if S_ISREG(mode):
-                filename = os.path.join(os.path.relpath(path, basePath), f)
-                if self.debug:
-                    print(("add " + pathname))
-                    print(("name " + filename))
-                fileBuffer = open(pathname, 'rb').read()
-                appFile = app.file.add()
-                appFile.name = filename
-                appFile.encoding = CLEARTEXT
-                appFile.blob = fileBuffer
-            elif S_ISDIR(mode):
-                self.add_files(basePath, pathname, app)
-
-    def retrieve_app(self, origin, name):
-        if self.debug:
-            print(("retrieve app " + name))
-        app = self.tx.app.add()
+    def get_app_files(self, name):
+        appFiles = self.appFiles.get(name)
+        if appFiles is None:
+            appFiles = AppFiles(self.cfg.get(name, 'files'))
+            self.appFiles[name] = appFiles
+        if appFiles.update() and self.debug:
+            print(("app files changed " + name))
+        return appFiles
+
+    def add_files(self, appFiles, app, known=None, chunkSize=0):
+        for filename in sorted(appFiles.files):
+            _, _, size, fileHash = appFiles.files[filename]
+            appFile = app.file.add()
+            appFile.name = filename
+            appFile.encoding = CLEARTEXT
+            appFile.hash = fileHash
+            appFile.size = size
+            if known is not None and known.get(filename) == fileHash:
+                continue  # client has this file
+            if chunkSize and size > chunkSize:
+                continue  # client retrieves this file in chunks
+            if self.debug:
+                print(("add " + filename))
+            appFile.blob = appFiles.read(filename)
+
+    def add_app(self, name, container):
+        app = container.app.add()
         app.name = name
         app.description = self.cfg.get(name, 'description')
         app.type = self.typeToPb(self.cfg.get(name, 'type'))
-        self.add_files(self.cfg.get(name, 'files'),
-                       self.cfg.get(name, 'files'), app)
+        return app
+
+    def retrieve_app(self, origin, name, request=None):
+        if self.debug:
+            print(("retrieve app " + name))
+        appFiles = self.get_app_files(name)
+        known = None
+        chunkSize = 0
+        if request is not None:
+            known = dict((f.name, f.hash) for f in request.file
+                         if f.HasField('hash'))
+            chunkSize = request.chunk_size
+            chunks = [f for f in request.file if f.HasField('offset')]
+            if chunks:
+                self.retrieve_chunks(origin, name, appFiles, chunks, chunkSize)
+                return
+
+        if not known and not chunkSize:
+            # complete app, serialized once for all clients
+            if appFiles.detail is None:
+                tx = Container()
+                tx.type = pb.MT_APPLICATION_DETAIL
+                self.add_files(appFiles, self.add_app(name, tx))
+                appFiles.detail = tx.SerializeToString()
+            if self.debug:
+                print(("send cached app " + name))
+            self.socket.send_multipart(origin + [appFiles.detail], zmq.NOBLOCK)
+            return
+
+        app = self.add_app(name, self.tx)
+        self.add_files(appFiles, app, known, chunkSize)
+        self.send_msg(origin, pb.MT_APPLICATION_DETAIL)
 
+    def retrieve_chunks(self, origin, name, appFiles, chunks, chunkSize):
+        app = self.add_app(name, self.tx)
+        for chunk in chunks:
+            entry = appFiles.files.get(chunk.name)
+            if entry is None or entry[3] != chunk.hash:
+                self.tx.Clear()
+                note = 'file %s of app %s has changed' % (chunk.name, name)
+                self.tx.note.append(note)
+                self.send_msg(origin, pb.MT_ERROR)
+                return
+            appFile = app.file.add()
+            appFile.name = chunk.name
+            appFile.encoding = CLEARTEXT
+            appFile.hash = entry[3]
+            appFile.size = entry[2]
+            appFile.offset = chunk.offset
+            appFile.blob = appFiles.read(chunk.name, chunk.offset,
+                                         chunkSize or -1)
         self.send_msg(origin, pb.MT_APPLICATION_DETAIL)
 
     def process(self, s):
@@ -188,7 +299,7 @@ class ConfigServer(object):
 
         elif self.rx.type == pb.MT_RETRIEVE_APPLICATION:
             a = self.rx.app[0]
-            self.retrieve_app(identity, a.name)
+            self.retrieve_app(identity, a.name, a)
 
         elif self.rx.type == pb.MT_PING:
             self.send_msg(identity, pb.MT_PING_ACKNOWLEDGE)
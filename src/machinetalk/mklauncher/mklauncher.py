@@ -7,7 +7,7 @@ import zmq
 import threading
 import time
 import signal
-import math
+import errno
 import subprocess
 import fcntl
 import shlex
@@ -21,9 +21,8 @@ from machinekit import config
 
 from google.protobuf.message import DecodeError
 from machinetalk.protobuf.message_pb2 import Container
-from machinetalk.protobuf.config_pb2 import Launcher, MachineInfo, File, StdoutLine, CLEARTEXT
+from machinetalk.protobuf.config_pb2 import Launcher, MachineInfo, File, CLEARTEXT
 import machinetalk.protobuf.types_pb2 as pb
-from machinetalk.protobuf.object_pb2 import ProtocolParameters
 
 if sys.version_info >= (3, 0):
     import configparser
@@ -83,7 +82,7 @@ class LauncherImportance(object):
 class Mklauncher(object):
     def __init__(self, context, launcher_dirs=None, host='',
                  svc_uuid='', debug=False, name=None, host_in_name=True,
-                 poll_interval=0.5, ping_interval=2.0, loopback=False,
+                 ping_interval=2.0, loopback=False, output_lines=1000,
                  config_dir='~/.config/machinekit/mklauncher'):
         if launcher_dirs is None:
             launcher_dirs = []
@@ -95,20 +94,31 @@ class Mklauncher(object):
         self.debug = debug
         self.shutdown = threading.Event()
         self.running = False
-        self.poll_interval = poll_interval
         self.ping_interval = ping_interval
+        self.output_lines = output_lines  # lines of output kept per launcher
 
         # published container
         self.container = Container()
         self.tx_container = Container()
         self.launcher_subscribed = False
         self.launcher_full_update = False
+        # the serial of every update is the version of the status it leads
+        # to, a full update is only serialized once per version
+        self.launcher_serial = 0
+        self.launcher_snapshot = None  # (serial, serialized full update)
         # command rx and tx containers for reuse
         self.rx = Container()
         self.tx = Container()
 
         self.processes = {}  # for processes mapped to launcher
         self.terminating = set()  # set of terminating processes
+        self.poller = zmq.Poller()  # sockets, process output and SIGCHLD
+
+        # self-pipe written on SIGCHLD, see start()
+        self._sigchld_pipe = os.pipe()
+        for fd in self._sigchld_pipe:
+            flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+            fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
 
         launchers, ids = self._search_launchers(self.launcher_dirs)
         self._launcher_ids = {}
@@ -123,17 +133,17 @@ class Mklauncher(object):
         self._importances = LauncherImportance(config_file)
         self._importances.load()
 
-        # prepare pings
-        if self.ping_interval > 0:
-            self.ping_ratio = math.floor(self.ping_interval / self.poll_interval)
-        else:
-            self.ping_ratio = -1
-        self.pingCount = 0
-
         self._create_sockets(context)
         self._create_services(host_in_name, svc_uuid)
 
     def start(self):
+        # Python signal handlers only run in the main thread, while the
+        # signal usually hits the poller thread.  The wakeup fd is written
+        # by the C level handler in whichever thread receives the signal.
+        # Python 2 skips that write while an earlier signal still waits for
+        # the main thread, so the Python handler writes the pipe as well.
+        signal.signal(signal.SIGCHLD, self._sigchld_handler)
+        signal.set_wakeup_fd(self._sigchld_pipe[1])
         self._publish_services()
         self._start_threads()
 
@@ -214,7 +224,6 @@ class Mklauncher(object):
 
     def _start_threads(self):
         threading.Thread(target=self._process_sockets).start()
-        threading.Thread(target=self._poll).start()
         self.running = True
 
     def _create_sockets(self, context):
@@ -235,16 +244,38 @@ class Mklauncher(object):
         self.command_ds_name = self.command_ds_name.replace('0.0.0.0', self.host)
 
     def _process_sockets(self):
-        poll = zmq.Poller()
+        poll = self.poller
         poll.register(self.launcher_socket, zmq.POLLIN)
         poll.register(self.command_socket, zmq.POLLIN)
+        poll.register(self._sigchld_pipe[0], zmq.POLLIN)
+        next_ping = time.time() + self.ping_interval
 
         while not self.shutdown.is_set():
-            s = dict(poll.poll(1000))
+            timeout = 1000
+            if self.ping_interval > 0:
+                timeout = min(timeout, max(0, int((next_ping - time.time()) * 1000.0)))
+            try:
+                s = dict(poll.poll(timeout))
+            except zmq.ZMQError as e:
+                if e.errno == errno.EINTR:
+                    continue
+                raise
             if self.launcher_socket in s and s[self.launcher_socket] == zmq.POLLIN:
                 self._process_launcher_socket(self.launcher_socket)
             if self.command_socket in s and s[self.command_socket] == zmq.POLLIN:
                 self._process_command_socket(self.command_socket)
+            for index, process in self.processes.items():
+                if not process.stdout.closed and process.stdout.fileno() in s:
+                    self._read_process_output(index)
+            if self._sigchld_pipe[0] in s:
+                self._reap_processes()
+            if s:
+                self._update_launcher_status()
+
+            if self.ping_interval > 0 and time.time() >= next_ping:
+                if self.launcher_subscribed:
+                    self._send_launcher_message(pb.MT_PING)
+                next_ping = time.time() + self.ping_interval
 
         self._unpublish_services()
         self.running = False
@@ -285,11 +316,6 @@ class Mklauncher(object):
         self.launcher_service.unpublish()
         self.commandService.unpublish()
 
-    def _add_pparams_to_message(self):
-        parameters = ProtocolParameters()
-        parameters.keepalive_timer = int(self.ping_interval * 1000.0)
-        self.tx_container.pparams.MergeFrom(parameters)
-
     def _update_launcher_status(self):
         tx_launcher = Launcher()  # new pb message for tx
         has_update = False
@@ -310,29 +336,24 @@ class Mklauncher(object):
 
             if index in self.processes:
                 process = self.processes[index]
-                process.poll()
+                if process.started:  # update running value
+                    process.started = False
+                    if len(launcher.output) > 0:
+                        launcher.ClearField('output')  # clear output for new processes
+                        self.launcher_full_update = True  # request a full update
+                    tx_launcher.running = True
+                    tx_launcher.returncode = 0
+                    modified = True
+                # send stdout lines
+                for line in process.lines:
+                    stdoutLine = tx_launcher.output.add()
+                    stdoutLine.index = process.output_index
+                    stdoutLine.line = line
+                    process.output_index += 1
+                    modified = True
+                process.lines = []
                 returncode = process.returncode
                 if returncode is None:
-                    if not launcher.running:  # update running value
-                        if len(launcher.output) > 0:
-                            launcher.ClearField('output')  # clear output for new processes
-                            self.launcher_full_update = True  # request a full update
-                        tx_launcher.running = True
-                        tx_launcher.returncode = 0
-                        modified = True
-                    # read stdout
-                    stdout_index = len(launcher.output)
-                    while True:
-                        try:
-                            line = process.stdout.read()
-                            stdoutLine = StdoutLine()
-                            stdoutLine.index = stdout_index
-                            stdoutLine.line = line
-                            tx_launcher.output.add().MergeFrom(stdoutLine)
-                            stdout_index += 1
-                            modified = True
-                        except IOError:  # process has no new line
-                            break
                     # send termination status
                     if terminating:
                         tx_launcher.terminating = True
@@ -342,21 +363,81 @@ class Mklauncher(object):
                     tx_launcher.terminating = False
                     modified = True
                     self.processes.pop(index, None)  # remove from watchlist
+                    self._close_process_output(process)
             if modified:
                 launcher.MergeFrom(tx_launcher)
+                excess = len(launcher.output) - self.output_lines
+                if excess > 0:
+                    del launcher.output[:excess]  # keep the latest lines only
                 tx_launcher.index = index
                 self.tx_container.launcher.add().MergeFrom(tx_launcher)
                 tx_launcher.Clear()
                 has_update = True
 
-        if self.launcher_full_update:
-            self._add_pparams_to_message()
-            self.tx_container.CopyFrom(self.container)
-            self._send_launcher_message(pb.MT_LAUNCHER_FULL_UPDATE)
-            self.launcher_full_update = False
+        if has_update:
+            self.launcher_serial += 1
+        if not self.launcher_subscribed:
+            # nobody listens, the next subscriber gets a full update
+            self.tx_container.Clear()
+        elif self.launcher_full_update:
+            self._send_launcher_snapshot()
         elif has_update:
+            self.tx_container.serial = self.launcher_serial
             self._send_launcher_message(pb.MT_LAUNCHER_INCREMENTAL_UPDATE)
 
+    def _read_process_output(self, index):
+        process = self.processes[index]
+        fd = process.stdout.fileno()
+        while True:
+            try:
+                data = os.read(fd, 4096)
+            except OSError as e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    break
+                raise
+            if not data:  # end of file
+                self._close_process_output(process)
+                if process.partial:
+                    process.lines.append(process.partial.decode('utf-8', 'replace'))
+                    process.partial = b''
+                process.poll()
+                break
+            lines = (process.partial + data).split(b'\n')
+            process.partial = lines.pop()
+            if len(process.partial) > 4096:  # no line break in sight
+                lines.append(process.partial)
+                process.partial = b''
+            process.lines.extend(line.decode('utf-8', 'replace') + u'\n'
+                                 for line in lines)
+        excess = len(process.lines) - self.output_lines
+        if excess > 0:
+            process.output_index += excess  # dropped lines keep their index
+            del process.lines[:excess]
+
+    def _close_process_output(self, process):
+        if not process.stdout.closed:
+            self.poller.unregister(process.stdout.fileno())
+            process.stdout.close()
+
+    def _sigchld_handler(self, signum, frame):
+        del signum  # ignored
+        del frame  # ignored
+        try:
+            os.write(self._sigchld_pipe[1], b'\0')
+        except OSError:  # pipe full, already signalled
+            pass
+
+    def _reap_processes(self):
+        try:
+            while os.read(self._sigchld_pipe[0], 4096):
+                pass
+        except OSError:
+            pass
+        for index, process in self.processes.items():
+            if process.returncode is None and process.poll() is not None \
+               and not process.stdout.closed:
+                self._read_process_output(index)  # remaining output
+
     def _send_launcher_message(self, msgType):
         logger.debug('sending launcher message')
         self.tx_container.type = msgType
@@ -364,28 +445,29 @@ class Mklauncher(object):
         self.tx_container.Clear()
         self.launcher_socket.send_multipart(['launcher', txBuffer], zmq.NOBLOCK)
 
+    def _send_launcher_snapshot(self):
+        # subscribers joining at the same version share one full update;
+        # they apply the incremental updates with a higher serial
+        if self.launcher_snapshot is None \
+           or self.launcher_snapshot[0] != self.launcher_serial:
+            tx = Container()
+            tx.CopyFrom(self.container)
+            tx.type = pb.MT_LAUNCHER_FULL_UPDATE
+            tx.serial = self.launcher_serial
+            tx.pparams.keepalive_timer = int(self.ping_interval * 1000.0)
+            self.launcher_snapshot = (self.launcher_serial, tx.SerializeToString())
+        self.tx_container.Clear()  # the snapshot includes pending changes
+        self.launcher_full_update = False
+        logger.debug('sending launcher snapshot %i' % self.launcher_serial)
+        self.launcher_socket.send_multipart(['launcher', self.launcher_snapshot[1]],
+                                            zmq.NOBLOCK)
+
     def _send_command_message(self, identity, msgType):
         self.tx.type = msgType
         txBuffer = self.tx.SerializeToString()
         self.command_socket.send_multipart(identity + [txBuffer], zmq.NOBLOCK)
         self.tx.Clear()
 
-    def _poll(self):
-        while not self.shutdown.is_set():
-            if self.launcher_subscribed:
-                self._update_launcher_status()
-                if (self.pingCount == self.ping_ratio):
-                    self._send_launcher_message(pb.MT_PING)
-
-            if (self.pingCount == self.ping_ratio):
-                self.pingCount = 0
-            else:
-                self.pingCount += 1
-            time.sleep(self.poll_interval)
-
-        self.running = False
-        return
-
     def _process_launcher_socket(self, s):
         try:
             rc = s.recv()
@@ -394,7 +476,8 @@ class Mklauncher(object):
 
             if subscription == 'launcher':
                 self.launcher_subscribed = status
-                self.launcher_full_update = status
+                if status:
+                    self._send_launcher_snapshot()
 
             logger.debug(("process launcher called " + subscription + ' ' + str(status)))
 
@@ -419,9 +502,14 @@ class Mklauncher(object):
         except OSError as e:
             return False, str(e)
         process.command = command
+        process.started = True
+        process.lines = []  # output lines not yet sent
+        process.partial = b''  # incomplete last line
+        process.output_index = 0
         # set the O_NONBLOCK flag of stdout file descriptor:
         flags = fcntl.fcntl(process.stdout, fcntl.F_GETFL)  # get current stdout flags
         fcntl.fcntl(process.stdout, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+        self.poller.register(process.stdout.fileno(), zmq.POLLIN)
         self.processes[index] = process
         return True, ''
 
@@ -626,7 +714,9 @@ def main():
     mklauncher.start()
 
     while mklauncher.running and not check_exit():
-        time.sleep(1)
+        # unlike time.sleep(), the wait wakes up every few ms on Python 2
+        # and runs pending signal handlers, see Mklauncher.start()
+        mklauncher.shutdown.wait(1)
 
     logger.debug('stopping threads')
     mklauncher.stop()
@@ -139,3 +139,80 @@ def test_updating_launcher_importance_works(context, single_launcher_file, confi
     launchers = launcher.container.launcher
     assert len(launchers) == 1
     assert launchers[0].importance == 5
+
+
+@pytest.fixture
+def output_launcher_file(tmpdir):
+    data = '''
+[output]
+name = Output
+command = printf 'foo\\nbar\\nba'
+shell = true
+'''
+    ini = tmpdir.join('launcher.ini')
+    ini.write(data)
+    return [str(tmpdir)]
+
+
+def test_process_output_is_split_into_lines(context, output_launcher_file, config_dir):
+    launcher = Mklauncher(context, launcher_dirs=output_launcher_file, config_dir=config_dir)
+
+    success, _ = launcher._start_process(0)
+    assert success
+    launcher.processes[0].wait()
+    launcher._read_process_output(0)
+    launcher._update_launcher_status()
+
+    launchers = launcher.container.launcher
+    assert [line.line for line in launchers[0].output] == ['foo\n', 'bar\n', 'ba']
+    assert [line.index for line in launchers[0].output] == [0, 1, 2]
+    assert launchers[0].running is False
+    assert 0 not in launcher.processes
+
+
+def test_process_output_keeps_latest_lines(context, output_launcher_file, config_dir):
+    launcher = Mklauncher(context, launcher_dirs=output_launcher_file,
+                          config_dir=config_dir, output_lines=2)
+
+    launcher._start_process(0)
+    launcher.processes[0].wait()
+    launcher._read_process_output(0)
+    launcher._update_launcher_status()
+
+    launchers = launcher.container.launcher
+    assert [line.line for line in launchers[0].output] == ['bar\n', 'ba']
+    assert [line.index for line in launchers[0].output] == [1, 2]
+
+
+class RecordingSocket(object):
+    def __init__(self):
+        self.messages = []
+
+    def send_multipart(self, frames, flags=0):
+        self.messages.append(frames)
+
+
+def test_late_subscribers_get_cached_snapshot(context, output_launcher_file, config_dir):
+    launcher = Mklauncher(context, launcher_dirs=output_launcher_file, config_dir=config_dir)
+    launcher.launcher_socket = RecordingSocket()
+    launcher.launcher_subscribed = True
+
+    launcher._send_launcher_snapshot()
+    launcher._send_launcher_snapshot()
+    first, second = launcher.launcher_socket.messages
+    assert first[1] is second[1]  # serialized only once
+
+    launcher._start_process(0)
+    launcher.processes[0].wait()
+    launcher._read_process_output(0)
+    launcher._update_launcher_status()
+    launcher._send_launcher_snapshot()
+
+    from machinetalk.protobuf.message_pb2 import Container
+    update = Container()
+    update.ParseFromString(launcher.launcher_socket.messages[2][1])
+    snapshot = Container()
+    snapshot.ParseFromString(launcher.launcher_socket.messages[3][1])
+    assert update.serial == 1
+    assert snapshot.serial == 1
+    assert [line.line for line in snapshot.launcher[0].output] == ['foo\n', 'bar\n', 'ba']
@@ -7,7 +7,6 @@ import zmq
 import threading
 import multiprocessing
 import time
-import math
 import socket
 import signal
 import argparse
@@ -17,10 +16,13 @@ import tempfile
 import subprocess
 import re
 import codecs
+import operator
+import collections
 import ConfigParser
 import linuxcnc
 from machinekit import service
 from machinekit import config
+from interpfiles import interpreter_file_stats
 
 from pyftpdlib.authorizers import DummyAuthorizer
 from pyftpdlib.handlers import FTPHandler
@@ -33,7 +35,6 @@ from machinetalk.protobuf.types_pb2 import *
 from machinetalk.protobuf.status_pb2 import *
 from machinetalk.protobuf.preview_pb2 import *
 from machinetalk.protobuf.motcmds_pb2 import *
-from machinetalk.protobuf.object_pb2 import ProtocolParameters
 
 
 def printError(msg):
@@ -153,6 +154,7 @@ class PreviewCanon():
     def __init__(self, canon, debug=False):
         self.c = canon
         self.debug = debug
+        self.parameter_file = canon.parameterFile
 
     def check_abort(self):
         if self.debug:
@@ -185,32 +187,48 @@ class PreviewCanon():
         return self.c.blockDelete
 
 
+def fileStat(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_ino, st.st_size, st.st_mtime)
+
+
 # Preview class works concurrently using multiprocessing
-# Queues are used for communication
+# A single worker process with the interpreter already loaded serves all
+# requests, queues are used for communication.  Every request gets a new
+# id; a request which is still queued or running when a newer one arrives
+# is cancelled.  If the program, tool table, parameter file, settings,
+# INI file and the subroutine and remap files did not change since the
+# last completed preview, the worker publishes the recorded result again
+# instead of running the interpreter.
 class Preview():
-    def __init__(self, stat, randomToolchanger=False, parameterFile="", initcode="", debug=False):
+    def __init__(self, stat, randomToolchanger=False, parameterFile="", initcode="", iniFile=None, debug=False):
         self.debug = debug
+        # the interpreter reads the INI file named in the environment
+        self.iniFile = iniFile or os.environ.get('INI_FILE_NAME', '')
         self.filename = ""
         self.unitcode = ""
         self.initcode = initcode
         self.stat = stat
         self.parameterFile = parameterFile
         self.randomToolchanger = randomToolchanger
-        self.canon = None
         self.preview = None
         self.errorCallback = None
+        self.isBound = False
+        self.requestId = 0
+        self.timing = {}  # phase durations of the last finished request
+
+        # the preview reads a private copy of the parameter file, which is
+        # refreshed when the original changes
+        self.tempdir = tempfile.mkdtemp()
+        self.parameterCopy = os.path.join(self.tempdir, os.path.basename(parameterFile))
+        self.parameterStat = None
 
         # multiprocessing tools
-        self.bindEvent = multiprocessing.Event()
-        self.bindCompletedEvent = multiprocessing.Event()
-        self.previewEvent = multiprocessing.Event()
-        self.previewCompleteEvent = multiprocessing.Event()
-        self.shutdownEvent = multiprocessing.Event()
-        self.errorEvent = multiprocessing.Event()
-        self.isStarted = multiprocessing.Value('b', False, lock=False)
-        self.isBound = multiprocessing.Value('b', False, lock=False)
-        self.isRunning = multiprocessing.Value('b', False, lock=False)
-        self.aborted = multiprocessing.Value('b', False, lock=False)
+        self.request = multiprocessing.Value('i', 0, lock=False)  # id of the current request
+        self.aborted = multiprocessing.Value('i', 0, lock=False)  # id of the aborted request
         self.inqueue = multiprocessing.Queue()  # used to send data to the process
         self.outqueue = multiprocessing.Queue()  # used to get data from the process
         self.process = multiprocessing.Process(target=self.run)
@@ -220,13 +238,18 @@ class Preview():
         self.errorCallback = callback
 
     def bind(self, previewUri, statusUri):
-        self.inqueue.put((previewUri, statusUri))
-        self.bindEvent.set()
-        self.bindCompletedEvent.wait()
-        return self.outqueue.get()
+        self.inqueue.put(('bind', (previewUri, statusUri)))
+        uris = self.outqueue.get()
+        self.isBound = True
+
+        # start the result thread
+        thread = threading.Thread(target=self.result_thread)
+        thread.daemon = True
+        thread.start()
+        return uris
 
     def abort(self):
-        self.aborted.value = True
+        self.aborted.value = self.request.value
 
     def program_open(self, filename):
         if os.path.isfile(filename):
@@ -235,105 +258,110 @@ class Preview():
             raise Exception("file does not exist " + filename)
 
     def start(self):
-        if self.isRunning.value is True:
-            raise Exception("Preview already running")
-
-        # start the monitoring daemon
-        thread = threading.Thread(target=self.monitoring_thread)
-        thread.daemon = True
-        thread.start()
-
-    def stop(self):
-        self.shutdownEvent.set()
-        self.previewCompleteEvent.set()  # in case we are monitoring
-        self.process.join()  # make sure to have one process at exit
-
-    def monitoring_thread(self):
-        if not self.isBound.value:
+        if not self.isBound:
             raise Exception('Preview is not bound')
 
-        self.isRunning.value = True
-
-        # create temp dir
-        tempdir = tempfile.mkdtemp()
+        startTime = time.time()
+        self.update_parameter_file()
 
         # prepare Canon data
         canon = PreviewCanonData()
-        tools = []
-        for entry in self.stat.tool_table:
-            tools.append(tuple(entry))
-        canon.tools = tools
-        temp_parameter = os.path.join(tempdir, os.path.basename(self.parameterFile))
-        if os.path.exists(self.parameterFile):
-            shutil.copy(self.parameterFile, temp_parameter)
-        canon.parameterFile = temp_parameter
+        canon.tools = [tuple(entry) for entry in self.stat.tool_table]
+        canon.parameterFile = self.parameterCopy if self.parameterStat else ''
         canon.randomToolchanger = self.randomToolchanger
         canon.axisMask = self.stat.axis_mask
         canon.blockDelete = self.stat.block_delete
         canon.angularUnits = self.stat.angular_units
         canon.linearUnits = self.stat.linear_units
-
         self.unitcode = "G%d" % (20 + (self.stat.linear_units == 1))
-        # put everything on the process queue
-        while not self.inqueue.empty():
-            self.inqueue.get_nowait()
-        self.inqueue.put((self.filename, self.unitcode, self.initcode, canon))
-        # release the dragon
-        self.previewCompleteEvent.clear()
-        self.previewEvent.set()
-        self.previewCompleteEvent.wait()
-        # handle error events
-        if self.errorEvent.wait(0.1):
-            (error, line) = self.outqueue.get()
-            if self.errorCallback is not None:
-                self.errorCallback(error, line)
-            self.errorEvent.clear()
 
-        # cleanup temp dir
-        shutil.rmtree(tempdir)
+        # everything the result depends on
+        key = (self.filename, fileStat(self.filename), self.unitcode,
+               self.initcode, self.parameterStat, canon.randomToolchanger,
+               canon.axisMask, canon.blockDelete, canon.angularUnits,
+               canon.linearUnits, tuple(canon.tools),
+               interpreter_file_stats(self.iniFile))
+
+        # a new request id cancels the running request
+        self.requestId += 1
+        self.request.value = self.requestId
+        timing = {'prepare': time.time() - startTime}
+        self.inqueue.put(('preview', (self.requestId, key, time.time(), timing,
+                                      self.filename, self.unitcode,
+                                      self.initcode, canon)))
+
+    def stop(self):
+        self.request.value = -1  # cancel a running preview
+        self.inqueue.put(('shutdown', None))
+        self.process.join()  # make sure to have one process at exit
+        shutil.rmtree(self.tempdir, ignore_errors=True)
 
-        self.isRunning.value = False
+    def update_parameter_file(self):
+        stat = fileStat(self.parameterFile)
+        if stat == self.parameterStat:
+            return
+        if stat is None:
+            os.remove(self.parameterCopy)
+        else:
+            shutil.copy(self.parameterFile, self.parameterCopy)
+        self.parameterStat = stat
+
+    def result_thread(self):
+        while True:
+            result = self.outqueue.get()
+            if result is None:  # process exited
+                return
+            (requestId, error, line, timing) = result
+            self.timing = timing
+            if self.debug:
+                print('Preview %d: %s' % (requestId, ' '.join(
+                    '%s=%.3fs' % (phase, timing[phase]) for phase in sorted(timing))))
+            if error is not None and self.errorCallback is not None:
+                self.errorCallback(error, line)
 
     def run(self):
         import preview  # must be imported in new process to work properly
         self.preview = preview
+        self.lastKey = None
+        self.lastError = (None, None)
 
-        self.isStarted.value = True
-
-        # waiting for a bind event
-        while not self.bindEvent.wait(timeout=0.1):
-            if self.shutdownEvent.is_set():  # in case someone shuts down when we are not bound
-                self.isStarted.value = False
+        while True:
+            (command, args) = self.inqueue.get()
+            if command == 'shutdown':
+                break
+            elif command == 'bind':
+                self.outqueue.put(self.preview.bind(*args))
+                if self.debug:
+                    print('Preview socket bound')
+            elif command == 'preview':
+                self.do_preview(*args)
 
-        # bind the socket here
-        (previewUri, statusUri) = self.inqueue.get()
-        (previewUri, statusUri) = self.preview.bind(previewUri, statusUri)
-        self.outqueue.put((previewUri, statusUri))
-        self.isBound.value = True
-        self.bindCompletedEvent.set()
+        self.outqueue.put(None)
         if self.debug:
-            print('Preview socket bound')
+            print('Preview process exited')
 
-        # wait for preview request or shutdown
-        # event handshaking is used to synchronize the monitoring thread
-        # and the process
-        while not self.shutdownEvent.is_set():
-            if self.previewEvent.wait(timeout=0.1):
-                self.do_preview()
-                self.previewCompleteEvent.set()
-                self.previewEvent.clear()
+    def cancelled(self, requestId):
+        return self.request.value != requestId or self.aborted.value == requestId
 
-        if self.debug:
-            print('Preview process exited')
-        self.isStarted.value = False
+    def do_preview(self, requestId, key, queueTime, timing, filename, unitcode, initcode, canonData):
+        if self.cancelled(requestId):
+            return  # superseded while queued
+        startTime = time.time()
+        timing['queue'] = startTime - queueTime
+
+        if key == self.lastKey and self.preview.replay():
+            (error, line) = self.lastError
+            timing['replay'] = time.time() - startTime
+            if self.debug:
+                print("Preview unchanged, result published again")
+            self.outqueue.put((requestId, error, line, timing))
+            return
 
-    def do_preview(self):
-        # get all stuff that is modified at runtime
-        (filename, unitcode, initcode, canonData) = self.inqueue.get()
         # make abort possible
         canon = PreviewCanon(canonData, self.debug)
-        self.aborted.value = False
-        canon.check_abort = lambda : self.aborted.value
+        canon.check_abort = lambda: self.cancelled(requestId)
+        self.lastKey = None
+        error = line = None
         if self.debug:
             print("Preview starting")
             print("Filename: " + filename)
@@ -350,28 +378,202 @@ class Preview():
             # check if we encountered a error during execution
             if result > self.preview.MIN_ERROR:
                 error = " gcode error: %s " % (self.preview.strerror(result))
-                line = last_sequence_number - 1
+                line = str(last_sequence_number - 1)
                 if self.debug:
                     printError("preview: " + filename)
-                    printError(error + " on line " + str(line))
-                # pass error through queue
-                self.outqueue.put((error, str(line)))
-                self.errorEvent.set()
+                    printError(error + " on line " + line)
+            self.lastKey = key
+            self.lastError = (error, line)
+
+        except KeyboardInterrupt:  # check_abort() returned True
+            timing['parse'] = time.time() - startTime
+            if self.debug:
+                print("Preview aborted")
+            self.outqueue.put((requestId, None, None, timing))
+            return
 
         except Exception as e:
             error = "preview error: " + str(e)
+            line = "0"
             if self.debug:
                 printError(error)
-            self.outqueue.put((error, "0"))
-            self.errorEvent.set()
+
+        timing['parse'] = time.time() - startTime
+        # pass result through queue
+        self.outqueue.put((requestId, error, line, timing))
 
         if self.debug:
             print("Preview exiting")
 
 
+# CompletionTracker resolves the tickets of all commands in one thread
+# Task executes commands in order, so the pending tickets are resolved in
+# order as well: a command is complete when task echoes its serial number
+# with a done or error status, or has already received a later command.
+# Tickets are answered as completed on timeout or when too many are
+# pending, like waiting for the command used to do.
+class CompletionTracker():
+    def __init__(self, stat, callback, maxPending=100, timeout=5.0,
+                 interval=0.01, debug=False):
+        self.stat = stat  # own stat channel, polled only while waiting
+        self.callback = callback  # called with identity and ticket
+        self.maxPending = maxPending
+        self.timeout = timeout
+        self.interval = interval
+        self.debug = debug
+        self.pending = collections.deque()  # (serial, identity, ticket, start time)
+        self.condition = threading.Condition()
+        self.running = True
+
+        # metrics
+        self.completed = 0
+        self.timeouts = 0
+        self.overflows = 0
+        self.latencyTotal = 0.0
+        self.latencyMax = 0.0
+
+        thread = threading.Thread(target=self.run, name='completion_tracker')
+        thread.daemon = True
+        thread.start()
+
+    def add(self, serial, identity, ticket):
+        overflow = None
+        with self.condition:
+            if len(self.pending) >= self.maxPending:
+                overflow = self.pending.popleft()
+            self.pending.append((serial, identity, ticket, time.time()))
+            self.condition.notify()
+        if overflow is not None:
+            self.resolve(overflow, 'overflow')
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        if self.debug:
+            print(self.stats())
+
+    def stats(self):
+        average = self.latencyTotal / self.completed if self.completed else 0.0
+        return ('commands: %i completed, %i timed out, %i overflowed, '
+                'latency avg %.1f ms max %.1f ms' %
+                (self.completed, self.timeouts, self.overflows,
+                 average * 1000.0, self.latencyMax * 1000.0))
+
+    def resolve(self, entry, reason=None):
+        (serial, identity, ticket, start) = entry
+        latency = time.time() - start
+        if reason == 'timeout':
+            self.timeouts += 1
+        elif reason == 'overflow':
+            self.overflows += 1
+        else:
+            self.completed += 1
+            self.latencyTotal += latency
+            self.latencyMax = max(self.latencyMax, latency)
+        self.callback(identity, ticket)
+
+        if self.debug:
+            print('command #%i from %s completed after %.1f ms%s' %
+                  (ticket, identity, latency * 1000.0,
+                   (' (%s)' % reason) if reason else ''))
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.running and not self.pending:
+                    self.condition.wait()
+                if not self.running:
+                    return
+
+            try:
+                self.stat.poll()
+            except linuxcnc.error as detail:
+                printError(str(detail))
+                time.sleep(self.interval)
+                continue
+            echo = self.stat.echo_serial_number
+            done = self.stat.state != linuxcnc.RCS_EXEC
+            now = time.time()
+
+            resolved = []
+            with self.condition:
+                while self.pending:
+                    (serial, identity, ticket, start) = self.pending[0]
+                    if serial < echo or (serial == echo and done):
+                        reason = None
+                    elif now - start > self.timeout:
+                        reason = 'timeout'
+                    else:
+                        break
+                    resolved.append((self.pending.popleft(), reason))
+            for (entry, reason) in resolved:
+                self.resolve(entry, reason)
+
+            time.sleep(self.interval)
+
+
+class StatusFieldTable():
+    # Classifies the scalar fields of a status message once from its
+    # protobuf descriptor, so the update functions do not need to keep
+    # hand written attribute lists in sync with the proto files.
+    def __init__(self, descriptor, exclude=[]):
+        self.values = []
+        self.floats = []
+        self.positions = []
+
+        for field in descriptor.fields:
+            if field.label == field.LABEL_REPEATED or field.name in exclude:
+                continue
+            if field.type == field.TYPE_MESSAGE:
+                if field.message_type.name == 'Position':
+                    self.positions.append(field.name)
+            elif field.type in [field.TYPE_DOUBLE, field.TYPE_FLOAT]:
+                self.floats.append(field.name)
+            else:
+                self.values.append(field.name)
+
+        self.names = self.values + self.floats + self.positions
+
+
+class StatusSnapshot():
+    # Keeps the raw stat values of one subtopic from the last poll.
+    # Comparing the tuples is a single pass in C and lets us skip the
+    # per field protobuf comparison when nothing changed at all.
+    def __init__(self, names):
+        self.getter = operator.attrgetter(*names)
+        self.last = None
+
+    def changed(self, stat, extra=None):
+        values = (self.getter(stat), extra)
+        if values == self.last:
+            return False
+        self.last = values
+        return True
+
+
+class StatusTopic():
+    # Container and lock of one status subtopic.  The container is reused
+    # for every message of the subtopic, data is its status message.
+    # Every update carries the version of the status it leads to as
+    # serial; late joiners get the full update of the current version,
+    # which is serialized once and then cached.
+    def __init__(self, topic):
+        self.topic = topic
+        self.tx = Container()
+        self.data = getattr(self.tx, 'emc_status_' + topic)
+        self.lock = threading.Lock()
+        self.serial = 0
+        self.snapshot = None  # (serial, serialized full update)
+
+
 class StatusValues():
 
-    def __init__(self):
+    def __init__(self, topics=None):
+        if topics is not None:  # use the messages inside the containers
+            for topic in topics.values():
+                setattr(self, topic.topic, topic.data)
+            return
         self.io = EmcStatusIo()
         self.config = EmcStatusConfig()
         self.motion = EmcStatusMotion()
@@ -388,9 +590,24 @@ class StatusValues():
 
 class LinuxCNCWrapper():
 
+    positionAxes = ('x', 'y', 'z', 'a', 'b', 'c', 'u', 'v', 'w')
+    motionAxisValues = ('enabled', 'fault', 'homed', 'homing', 'inpos',
+                        'max_hard_limit', 'max_soft_limit', 'min_hard_limit',
+                        'min_soft_limit', 'override_limits')
+    motionAxisFloats = ('ferror_current', 'ferror_highmark', 'input',
+                        'output', 'velocity')
+
+    ioFields = StatusFieldTable(EmcStatusIo.DESCRIPTOR)
+    taskFields = StatusFieldTable(EmcStatusTask.DESCRIPTOR, exclude=['total_lines'])
+    interpFields = StatusFieldTable(EmcStatusInterp.DESCRIPTOR)
+    motionFields = StatusFieldTable(EmcStatusMotion.DESCRIPTOR)
+    configFields = ['axis_mask', 'debug', 'kinematics_type', 'axes',
+                    'cycle_time', 'acceleration', 'velocity']
+
     def __init__(self, context, host='', loopback=False,
                 iniFile=None, svcUuid=None,
-                pollInterval=None, pingInterval=2, debug=False):
+                pollInterval=None, maxPollInterval=None,
+                pingInterval=2, debug=False):
         self.debug = debug
         self.host = host
         self.loopback = loopback
@@ -404,27 +621,7 @@ class LinuxCNCWrapper():
         self.errorLock = threading.Lock()
         self.errorNoteLock = threading.Lock()
 
-        # status
-        self.status = StatusValues()
-        self.statusTx = StatusValues()
-        self.motionSubscribed = False
-        self.motionFullUpdate = False
-        self.motionFirstrun = True
-        self.ioSubscribed = False
-        self.ioFullUpdate = False
-        self.ioFirstrun = True
-        self.ioToolTableCount = 0
-        self.ioToolTableLoaded = False
-        self.taskSubscribed = False
-        self.taskFullUpdate = False
-        self.taskFirstrun = True
-        self.configSubscribed = False
-        self.configFullUpdate = False
-        self.configFirstrun = True
-        self.interpSubscribed = False
-        self.interpFullUpdate = False
-        self.interpFirstrun = True
-        self.statusServiceSubscribed = False
+        self.init_status()
 
         self.textSubscribed = False
         self.displaySubscribed = False
@@ -439,6 +636,9 @@ class LinuxCNCWrapper():
         try:
             self.stat = linuxcnc.stat()
             self.command = linuxcnc.command()
+            self.completionTracker = CompletionTracker(linuxcnc.stat(),
+                                                       self.send_command_completed,
+                                                       debug=self.debug)
             self.error = linuxcnc.error_channel()
 
             iniFile = iniFile or os.environ.get('INI_FILE_NAME', '/dev/null')
@@ -446,6 +646,13 @@ class LinuxCNCWrapper():
             self.directory = self.ini.find('DISPLAY', 'PROGRAM_PREFIX') or os.getcwd()
             self.directory = os.path.abspath(os.path.expanduser(self.directory))
             self.pollInterval = float(pollInterval or self.ini.find('DISPLAY', 'CYCLE_TIME') or 0.1)
+            # the poll interval is stretched up to this value while the machine is idle
+            self.maxPollInterval = float(maxPollInterval or self.ini.find('DISPLAY', 'MAX_CYCLE_TIME')
+                                         or self.pollInterval * 5)
+            self.maxPollInterval = max(self.maxPollInterval, self.pollInterval)
+            if self.pingInterval > 0:  # keepalive must not be delayed
+                self.maxPollInterval = min(self.maxPollInterval,
+                                           max(self.pingInterval, self.pollInterval))
             self.interpParameterFile = self.ini.find('RS274NGC', 'PARAMETER_FILE') or "linuxcnc.var"
             self.interpParameterFile = os.path.abspath(os.path.expanduser(self.interpParameterFile))
             self.interpInitcode = self.ini.find("EMC", "RS274NGC_STARTUP_CODE") or ""
@@ -491,14 +698,8 @@ class LinuxCNCWrapper():
             printError(str(detail))
             sys.exit(1)
 
-        if self.pingInterval > 0:
-            self.pingRatio = math.floor(self.pingInterval / self.pollInterval)
-        else:
-            self.pingRatio = -1
-        self.pingCount = 0
-
+        self.activePollInterval = self.pollInterval
         self.rx = Container()          # Used by the command socket
-        self.txStatus = Container()    # Status socket - PUB-SUB
         self.txCommand = Container()   # Command socket - ROUTER-DEALER
         self.txError = Container()     # Error socket - PUB-SUB
         self.context = context
@@ -575,6 +776,49 @@ class LinuxCNCWrapper():
         threading.Thread(target=self.process_sockets, name="process_sockets").start()
         self.running = True
 
+    def init_status(self):
+        self.status = StatusValues()
+        # one container and lock per subtopic, kept for all messages; the
+        # incremental updates are built inside the containers
+        self.statusTopics = {}
+        for topic in ['io', 'config', 'motion', 'task', 'interp']:
+            self.statusTopics[topic] = StatusTopic(topic)
+        self.statusTx = StatusValues(self.statusTopics)
+        ping = Container()  # pings carry no status, the message never changes
+        ping.type = MT_PING
+        self.statusPingBuffer = ping.SerializeToString()
+        self.motionSubscribed = False
+        self.motionFullUpdate = False
+        self.motionFirstrun = True
+        self.ioSubscribed = False
+        self.ioFullUpdate = False
+        self.ioFirstrun = True
+        self.ioToolTableCount = 0
+        self.ioToolTableLoaded = False
+        self.ioToolTableRaw = {}  # table index -> stat tool entry of the last update
+        self.toolFileKey = None  # mtime and size of the parsed tool file
+        self.toolFileMap = {}  # tool id -> (pocket, comment) from the tool file
+        self.taskSubscribed = False
+        self.taskFullUpdate = False
+        self.taskFirstrun = True
+        self.configSubscribed = False
+        self.configFullUpdate = False
+        self.configFirstrun = True
+        self.interpSubscribed = False
+        self.interpFullUpdate = False
+        self.interpFirstrun = True
+        self.statusServiceSubscribed = False
+
+        # raw stat values of the last poll, used to skip unchanged subtopics
+        self.ioSnapshot = StatusSnapshot(self.ioFields.names + ['tool_table'])
+        self.taskSnapshot = StatusSnapshot(self.taskFields.names)
+        self.interpSnapshot = StatusSnapshot(self.interpFields.names
+                                             + ['gcodes', 'mcodes', 'settings'])
+        self.motionSnapshot = StatusSnapshot(self.motionFields.names
+                                             + ['ain', 'aout', 'din', 'dout',
+                                                'limit', 'axis'])
+        self.configSnapshot = StatusSnapshot(self.configFields + ['axis'])
+
     def process_sockets(self):
         poll = zmq.Poller()
         poll.register(self.statusSocket, zmq.POLLIN)
@@ -582,8 +826,9 @@ class LinuxCNCWrapper():
         poll.register(self.commandSocket, zmq.POLLIN)
     
         next_poll = time.time() + self.pollInterval
-        polldelay = (self.pollInterval) * 1000 # convert to ms
+        next_ping = time.time() + self.pingInterval
         while not self.shutdown.is_set():
+            polldelay = max(next_poll - time.time(), 0.0) * 1000  # convert to ms
             s = dict(poll.poll(polldelay))
             if self.statusSocket in s and s[self.statusSocket] == zmq.POLLIN:
                 self.process_status(self.statusSocket)
@@ -591,33 +836,43 @@ class LinuxCNCWrapper():
                 self.process_error(self.errorSocket)
             if self.commandSocket in s and s[self.commandSocket] == zmq.POLLIN:
                 self.process_command(self.commandSocket)
-            
-            polldelay = (next_poll - time.time()) * 1000 # convert to ms
-            if (polldelay > 0):
+            if s:
+                # new subscribers and commands expect a quick status update
+                self.activePollInterval = self.pollInterval
+                next_poll = min(next_poll, time.time() + self.pollInterval)
+
+            now = time.time()
+            if now < next_poll:
                 continue
 
-            next_poll = time.time() + self.pollInterval
-            polldelay = (self.pollInterval) * 1000 # convert to ms
+            ping = (self.pingInterval > 0) and (now >= next_ping)
+            if ping:
+                next_ping = now + self.pingInterval
 
+            modified = False
             try:
                 if (self.statusServiceSubscribed):
                     self.stat.poll()
-                    self.update_status(self.stat)
-                    if (self.pingCount == self.pingRatio):
+                    modified |= self.update_status(self.stat)
+                    if ping:
                         self.ping_status()
                 if (self.errorServiceSubscribed):
                     error = self.error.poll()
+                    modified |= bool(error)
                     self.update_error(error)
-                    if (self.pingCount == self.pingRatio):
+                    if ping:
                         self.ping_error()
             except linuxcnc.error as detail:
                 printError(str(detail))
                 self.stop()
 
-            if (self.pingCount == self.pingRatio):
-                self.pingCount = 0
+            # poll at full rate while something changes, back off while idle
+            if modified:
+                self.activePollInterval = self.pollInterval
             else:
-                self.pingCount += 1
+                self.activePollInterval = min(self.activePollInterval * 2,
+                                              self.maxPollInterval)
+            next_poll = now + self.activePollInterval
 
         self.unpublish()
         self.running = False
@@ -644,6 +899,7 @@ class LinuxCNCWrapper():
 
     def stop(self):
         self.shutdown.set()
+        self.completionTracker.stop()
         self.preview.stop()
 
     # handle program extensions
@@ -674,46 +930,76 @@ class LinuxCNCWrapper():
             self.totalLines = sum(1 for line in f)
         return filePath
 
-    def load_tool_table(self, io, txIo):
-        if self.toolTablePath is '':
-            return
+    toolLineRegex = re.compile(r'(?:.*?T(\d+))(?:.*?P(\d+))?(?:.*;(.*))?', re.IGNORECASE)
 
-        lines = []
-        with codecs.open(self.toolTablePath, 'r', encoding='utf-8') as file:
-            lines = file.readlines()
+    def read_tool_file(self):
+        # returns the pocket and comment of each tool id in the tool file
+        # and whether the file was parsed again since the last call
+        try:
+            st = os.stat(self.toolTablePath)
+        except OSError:
+            return self.toolFileMap, False
+        key = (st.st_mtime, st.st_size)
+        if key == self.toolFileKey:
+            return self.toolFileMap, False
 
         # parsing pocket number and comment, not emc status object
         toolMap = {}
-        regex = re.compile(r'(?:.*?T(\d+))(?:.*?P(\d+))?(?:.*;(.*))?', re.IGNORECASE)
-        for line in lines:
-            match = regex.match(line)
-            if match:
-                id = int(match.group(1))
-                pocket = match.group(2)
-                comment = match.group(3)
-                if pocket == '':
-                    pocket = 0
-                toolMap[id] = {'pocket': int(pocket), 'comment': comment}
-
-        for i, toolResult in enumerate(io.tool_table):
-            txToolResult = None
-            for result in txIo.tool_table:
-                if result.index == toolResult.index:
-                    txToolResult = result
-            if not txToolResult:
+        with codecs.open(self.toolTablePath, 'r', encoding='utf-8') as file:
+            for line in file:
+                match = self.toolLineRegex.match(line)
+                if match:
+                    id = int(match.group(1))
+                    pocket = int(match.group(2) or 0)
+                    comment = match.group(3) or ''
+                    toolMap[id] = (pocket, comment)
+
+        self.toolFileKey = key
+        self.toolFileMap = toolMap
+        return toolMap, True
+
+    def load_tool_table(self, io, txIo, indices=None):
+        # merge pocket and comment from the tool file into the tool table
+        # entries at indices, or into all entries if the file has changed,
+        # only the entries that change are added to txIo
+        if self.toolTablePath is '':
+            return False
+
+        toolMap, reloaded = self.read_tool_file()
+        if reloaded or indices is None:
+            entries = io.tool_table
+        else:
+            entries = [io.tool_table[i] for i in sorted(indices) if i < len(io.tool_table)]
+
+        txEntries = None
+        modified = False
+        for toolResult in entries:
+            tool = toolMap.get(toolResult.id)
+            if tool is None:
+                continue
+            pocket, comment = tool
+            if toolResult.pocket == pocket and toolResult.comment == comment:
+                continue
+            toolResult.pocket = pocket
+            toolResult.comment = comment
+            if txEntries is None:
+                txEntries = dict((result.index, result) for result in txIo.tool_table)
+            txToolResult = txEntries.get(toolResult.index)
+            if txToolResult is None:
                 txToolResult = txIo.tool_table.add()
-                txToolResult.CopyFrom(toolResult)
-            id = toolResult.id
-            if id in toolMap:
-                toolResult.pocket = toolMap[id]['pocket']
-                toolResult.comment = toolMap[id]['comment']
-                txToolResult.pocket = toolMap[id]['pocket']
-                txToolResult.comment = toolMap[id]['comment']
+                txToolResult.index = toolResult.index
+                txEntries[toolResult.index] = txToolResult
+            txToolResult.pocket = pocket
+            txToolResult.comment = comment
+            modified = True
+
+        return modified
 
     def update_tool_table(self, toolTable):
         if self.toolTablePath is '':
             return False
 
+        self.toolFileKey = None  # reparse even if mtime and size match
         with codecs.open(self.toolTablePath, 'w', encoding='utf-8') as file:
             for tool in toolTable:
                 line = 'T%d P%d D%f X%+f Y%+f Z%+f A%+f B%+f C%+f U%+f V%+f W%+f I%+f J%+f Q%d ;%s\n' \
@@ -741,44 +1027,6 @@ class LinuxCNCWrapper():
         position.w = 0.0
         return position
 
-    def check_position(self, oldPosition, newPosition):
-        modified = False
-        txPosition = Position()
-
-        if self.notEqual(oldPosition.x, newPosition[0]):
-            txPosition.x = newPosition[0]
-            modified = True
-        if self.notEqual(oldPosition.y, newPosition[1]):
-            txPosition.y = newPosition[1]
-            modified = True
-        if self.notEqual(oldPosition.z, newPosition[2]):
-            txPosition.z = newPosition[2]
-            modified = True
-        if self.notEqual(oldPosition.a, newPosition[3]):
-            txPosition.a = newPosition[3]
-            modified = True
-        if self.notEqual(oldPosition.b, newPosition[4]):
-            txPosition.b = newPosition[4]
-            modified = True
-        if self.notEqual(oldPosition.c, newPosition[5]):
-            txPosition.c = newPosition[5]
-            modified = True
-        if self.notEqual(oldPosition.u, newPosition[6]):
-            txPosition.u = newPosition[6]
-            modified = True
-        if self.notEqual(oldPosition.v, newPosition[7]):
-            txPosition.v = newPosition[7]
-            modified = True
-        if self.notEqual(oldPosition.w, newPosition[8]):
-            txPosition.w = newPosition[8]
-            modified = True
-
-        if modified:
-            return True, txPosition
-        else:
-            del txPosition
-            return False, None
-
     def update_proto_value(self, obj, txObj, prop, value):
         if getattr(obj, prop) != value:
             setattr(obj, prop, value)
@@ -793,35 +1041,36 @@ class LinuxCNCWrapper():
             return True
         return False
 
-    def update_proto_list(self, obj, txObj, txObjItem, prop, values, default):
+    def update_proto_list(self, obj, txObj, prop, values, default):
         modified = False
         for index, value in enumerate(values):
-            txObjItem.Clear()
-            objModified = False
-
             if len(obj) == index:
                 obj.add()
                 obj[index].index = index
                 setattr(obj[index], prop, default)
 
             objItem = obj[index]
-            objModified |= self.update_proto_value(objItem, txObjItem, prop, value)
-
-            if objModified:
+            if getattr(objItem, prop) != value:
+                setattr(objItem, prop, value)
+                txObjItem = txObj.add()
                 txObjItem.index = index
-                txObj.add().CopyFrom(txObjItem)
+                setattr(txObjItem, prop, value)
                 modified = True
 
         return modified
 
     def update_proto_position(self, obj, txObj, prop, value):
-        modified, txPosition = self.check_position(getattr(obj, prop), value)
-        if modified:
-            getattr(obj, prop).MergeFrom(txPosition)
-            getattr(txObj, prop).CopyFrom(txPosition)
-
-        del txPosition
-        return modified
+        # fields are assigned directly, building a Position to merge
+        # costs more than the comparison
+        position = getattr(obj, prop)
+        txPosition = None
+        for axis, newValue in zip(self.positionAxes, value):
+            if self.notEqual(getattr(position, axis), newValue):
+                setattr(position, axis, newValue)
+                if txPosition is None:
+                    txPosition = getattr(txObj, prop)
+                setattr(txPosition, axis, newValue)
+        return txPosition is not None
 
     def update_config_value(self, prop, value):
         return self.update_proto_value(self.status.config, self.statusTx.config, prop, value)
@@ -885,20 +1134,14 @@ class LinuxCNCWrapper():
             self.configFirstrun = False
 
             extensions = self.ini.findall("FILTER", "PROGRAM_EXTENSION")
-            txObjItem = EmcProgramExtension()
-            obj = self.status.config.program_extension
-            txObj = self.statusTx.config.program_extension
-            modified |= self.update_proto_list(obj, txObj, txObjItem,
+            modified |= self.update_proto_list(self.status.config.program_extension,
+                                               self.statusTx.config.program_extension,
                                                'extension', extensions, '')
-            del txObjItem
 
             commands = self.ini.findall("DISPLAY", "USER_COMMAND")
-            txObjItem = EmcStatusUserCommand()
-            obj = self.status.config.user_command
-            txObj = self.statusTx.config.user_command
-            modified |= self.update_proto_list(obj, txObj, txObjItem,
+            modified |= self.update_proto_list(self.status.config.user_command,
+                                               self.statusTx.config.user_command,
                                                'command', commands, '')
-            del txObjItem
 
             positionOffset = self.ini.find('DISPLAY', 'POSITION_OFFSET') or 'RELATIVE'
             if positionOffset == 'MACHINE':
@@ -1074,12 +1317,13 @@ class LinuxCNCWrapper():
         del txAxis
 
         if self.configFullUpdate:
-            self.add_pparams()
             self.send_config(self.status.config, MT_EMCSTAT_FULL_UPDATE)
             self.configFullUpdate = False
         elif modified:
             self.send_config(self.statusTx.config, MT_EMCSTAT_INCREMENTAL_UPDATE)
 
+        return modified
+
     def update_io(self, stat):
         modified = False
 
@@ -1094,27 +1338,35 @@ class LinuxCNCWrapper():
             self.status.io.tool_offset.MergeFrom(self.zero_position())
             self.ioFirstrun = False
 
-        for name in ['estop', 'flood', 'lube', 'lube_level', 'mist',
-                     'pocket_prepped', 'tool_in_spindle']:
+        for name in self.ioFields.values:
             modified |= self.update_io_value(name, getattr(stat, name))
 
-        modified |= self.update_proto_position(self.status.io, self.statusTx.io,
-                                               'tool_offset', stat.tool_offset)
+        for name in self.ioFields.positions:
+            modified |= self.update_proto_position(self.status.io, self.statusTx.io,
+                                                   name, getattr(stat, name))
 
         txToolResult = EmcToolData()
         toolTableChanged = False
+        changedIndices = set()
         tableIndex = 0
         for index, statToolResult in enumerate(stat.tool_table):
-            txToolResult.Clear()
-            resultModified = False
-            newItem = False
-
             if (index == 0 and not self.randomToolChanger):
                 continue
 
             if (statToolResult.id == -1 and not self.randomToolChanger):
                 break  # last tool in table, except index = 0 (spindle !)
 
+            # compare the raw stat entry first, most entries do not change
+            raw = tuple(statToolResult)
+            if self.ioToolTableRaw.get(tableIndex) == raw:
+                tableIndex += 1
+                continue
+            self.ioToolTableRaw[tableIndex] = raw
+
+            txToolResult.Clear()
+            resultModified = False
+            newItem = False
+
             if len(self.status.io.tool_table) == tableIndex:  # item added
                 item = self.status.io.tool_table.add()
                 item.index = tableIndex
@@ -1154,12 +1406,15 @@ class LinuxCNCWrapper():
                     self.statusTx.io.tool_table.add().CopyFrom(txToolResult)
                 modified = True
                 toolTableChanged = True
+                changedIndices.add(tableIndex)
 
             tableIndex += 1
 
         # cleanup dead entries
         while tableIndex < len(self.status.io.tool_table):
             del self.status.io.tool_table[-1]
+        for index in [i for i in self.ioToolTableRaw if i >= tableIndex]:
+            del self.ioToolTableRaw[index]
 
         # check if new tool table is smaller
         # if so we need to send empty messages (only index) to the subscribers
@@ -1173,18 +1428,19 @@ class LinuxCNCWrapper():
 
         if toolTableChanged or self.ioToolTableLoaded:
             # update pocket and comment from tool table file
-            self.load_tool_table(self.status.io, self.statusTx.io)
+            modified |= self.load_tool_table(self.status.io, self.statusTx.io,
+                                             changedIndices)
             self.ioToolTableLoaded = False
-            modified = True
         del txToolResult
 
         if self.ioFullUpdate:
-            self.add_pparams()
             self.send_io(self.status.io, MT_EMCSTAT_FULL_UPDATE)
             self.ioFullUpdate = False
         elif modified:
             self.send_io(self.statusTx.io, MT_EMCSTAT_INCREMENTAL_UPDATE)
 
+        return modified
+
     def update_task(self, stat):
         modified = False
 
@@ -1201,20 +1457,19 @@ class LinuxCNCWrapper():
             self.status.task.total_lines = 0
             self.taskFirstrun = False
 
-        for name in ['echo_serial_number', 'exec_state', 'file',
-                     'input_timeout', 'optional_stop', 'read_line',
-                     'task_mode', 'task_paused', 'task_state']:
+        for name in self.taskFields.values:
             modified |= self.update_task_value(name, getattr(stat, name))
 
         modified |= self.update_task_value('total_lines', self.totalLines)
 
         if self.taskFullUpdate:
-            self.add_pparams()
             self.send_task(self.status.task, MT_EMCSTAT_FULL_UPDATE)
             self.taskFullUpdate = False
         elif modified:
             self.send_task(self.statusTx.task, MT_EMCSTAT_INCREMENTAL_UPDATE)
 
+        return modified
+
     def update_interp(self, stat):
         modified = False
 
@@ -1225,37 +1480,29 @@ class LinuxCNCWrapper():
             self.status.interp.program_units = CANON_UNITS_INCH
             self.interpFirstrun = False
 
-        for name in ['command', 'interp_state', 'interpreter_errcode', 'program_units']:
+        for name in self.interpFields.values:
             modified |= self.update_interp_value(name, getattr(stat, name))
 
-        txObjItem = EmcStatusGCode()
-        obj = self.status.interp.gcodes
-        txObj = self.statusTx.interp.gcodes
-        modified |= self.update_proto_list(obj, txObj, txObjItem,
+        modified |= self.update_proto_list(self.status.interp.gcodes,
+                                           self.statusTx.interp.gcodes,
                                            'value', stat.gcodes, 0)
-        del txObjItem
 
-        txObjItem = EmcStatusMCode()
-        obj = self.status.interp.mcodes
-        txObj = self.statusTx.interp.mcodes
-        modified |= self.update_proto_list(obj, txObj, txObjItem,
+        modified |= self.update_proto_list(self.status.interp.mcodes,
+                                           self.statusTx.interp.mcodes,
                                            'value', stat.mcodes, 0)
-        del txObjItem
 
-        txObjItem = EmcStatusSetting()
-        obj = self.status.interp.settings
-        txObj = self.statusTx.interp.settings
-        modified |= self.update_proto_list(obj, txObj, txObjItem,
+        modified |= self.update_proto_list(self.status.interp.settings,
+                                           self.statusTx.interp.settings,
                                            'value', stat.settings, 0.0)
-        del txObjItem
 
         if self.interpFullUpdate:
-            self.add_pparams()
             self.send_interp(self.status.interp, MT_EMCSTAT_FULL_UPDATE)
             self.interpFullUpdate = False
         elif modified:
             self.send_interp(self.statusTx.interp, MT_EMCSTAT_INCREMENTAL_UPDATE)
 
+        return modified
+
     def update_motion(self, stat):
         modified = False
 
@@ -1305,68 +1552,38 @@ class LinuxCNCWrapper():
             self.status.motion.max_acceleration = 0.0
             self.motionFirstrun = False
 
-        for name in ['active_queue', 'adaptive_feed_enabled', 'block_delete',
-                     'current_line', 'enabled', 'feed_hold_enabled',
-                     'feed_override_enabled', 'g5x_index', 'id', 'inpos',
-                     'motion_line', 'motion_type', 'motion_mode', 'paused',
-                     'probe_tripped', 'probe_val', 'probing', 'queue',
-                     'queue_full', 'spindle_brake', 'spindle_direction',
-                     'spindle_enabled', 'spindle_increasing',
-                     'spindle_override_enabled', 'state']:
+        for name in self.motionFields.values:
             modified |= self.update_motion_value(name, getattr(stat, name))
 
-        for name in ['current_vel', 'delay_left', 'distance_to_go',
-                     'feedrate',  'rapidrate', 'rotation_xy', 'spindle_speed',
-                     'spindlerate', 'max_acceleration', 'max_velocity']:
+        for name in self.motionFields.floats:
             modified |= self.update_motion_float(name, getattr(stat, name))
 
-        for name in ['actual_position', 'dtg', 'g5x_offset', 'g92_offset',
-                     'joint_actual_position', 'joint_position', 'position',
-                     'probed_position']:
+        for name in self.motionFields.positions:
             modified |= self.update_proto_position(self.status.motion,
                                                    self.statusTx.motion,
                                                    name, getattr(stat, name))
 
-        txObjItem = EmcStatusAnalogIO()
-        obj = self.status.motion.ain
-        txObj = self.statusTx.motion.ain
-        modified |= self.update_proto_list(obj, txObj, txObjItem,
+        modified |= self.update_proto_list(self.status.motion.ain,
+                                           self.statusTx.motion.ain,
                                            'value', stat.ain, 0.0)
-        del txObjItem
 
-        txObjItem = EmcStatusAnalogIO()
-        obj = self.status.motion.aout
-        txObj = self.statusTx.motion.aout
-        modified |= self.update_proto_list(obj, txObj, txObjItem,
+        modified |= self.update_proto_list(self.status.motion.aout,
+                                           self.statusTx.motion.aout,
                                            'value', stat.aout, 0.0)
-        del txObjItem
 
-        txObjItem = EmcStatusDigitalIO()
-        obj = self.status.motion.din
-        txObj = self.statusTx.motion.din
-        modified |= self.update_proto_list(obj, txObj, txObjItem,
+        modified |= self.update_proto_list(self.status.motion.din,
+                                           self.statusTx.motion.din,
                                            'value', stat.din, False)
-        del txObjItem
 
-        txObjItem = EmcStatusDigitalIO()
-        obj = self.status.motion.dout
-        txObj = self.statusTx.motion.dout
-        modified |= self.update_proto_list(obj, txObj, txObjItem,
+        modified |= self.update_proto_list(self.status.motion.dout,
+                                           self.statusTx.motion.dout,
                                            'value', stat.dout, False)
-        del txObjItem
 
-        txObjItem = EmcStatusLimit()
-        obj = self.status.motion.limit
-        txObj = self.statusTx.motion.limit
-        modified |= self.update_proto_list(obj, txObj, txObjItem,
+        modified |= self.update_proto_list(self.status.motion.limit,
+                                           self.statusTx.motion.limit,
                                            'value', stat.limit, False)
-        del txObjItem
 
-        txAxis = EmcStatusMotionAxis()
         for index, statAxis in enumerate(stat.axis):
-            txAxis.Clear()
-            axisModified = False
-
             if index == stat.axes:
                 break
 
@@ -1389,44 +1606,61 @@ class LinuxCNCWrapper():
                 self.status.motion.axis[index].override_limits = False
                 self.status.motion.axis[index].velocity = 0.0
 
+            # changed fields are assigned to the tx axis directly, it is
+            # only added when something changed
             axis = self.status.motion.axis[index]
-            for name in ['enabled', 'fault', 'homed', 'homing',
-                         'inpos', 'max_hard_limit', 'max_soft_limit',
-                         'min_hard_limit', 'min_soft_limit',
-                         'override_limits']:
-                axisModified |= self.update_proto_value(axis, txAxis,
-                                                        name, statAxis[name])
-
-            for name in ['ferror_current', 'ferror_highmark', 'input',
-                         'output', 'velocity']:
-                axisModified |= self.update_proto_float(axis, txAxis,
-                                                        name, statAxis[name])
-
-            if axisModified:
-                txAxis.index = index
-                self.statusTx.motion.axis.add().CopyFrom(txAxis)
+            txAxis = None
+            for name in self.motionAxisValues:
+                value = statAxis[name]
+                if getattr(axis, name) != value:
+                    setattr(axis, name, value)
+                    if txAxis is None:
+                        txAxis = self.statusTx.motion.axis.add()
+                        txAxis.index = index
+                    setattr(txAxis, name, value)
+
+            for name in self.motionAxisFloats:
+                value = statAxis[name]
+                if self.notEqual(getattr(axis, name), value):
+                    setattr(axis, name, value)
+                    if txAxis is None:
+                        txAxis = self.statusTx.motion.axis.add()
+                        txAxis.index = index
+                    setattr(txAxis, name, value)
+
+            if txAxis is not None:
                 modified = True
-        del txAxis
 
         if self.motionFullUpdate:
-            self.add_pparams()
             self.send_motion(self.status.motion, MT_EMCSTAT_FULL_UPDATE)
             self.motionFullUpdate = False
         elif modified:
             self.send_motion(self.statusTx.motion, MT_EMCSTAT_INCREMENTAL_UPDATE)
 
+        return modified
+
     def update_status(self, stat):
+        # subtopics whose raw stat values did not change since the last
+        # poll are skipped without touching the protobuf containers
         self.statusTx.clear()
+        modified = False
         if (self.ioSubscribed):
-            self.update_io(stat)
+            if self.ioSnapshot.changed(stat) or self.ioFullUpdate \
+               or self.ioToolTableLoaded:
+                modified |= self.update_io(stat)
         if (self.taskSubscribed):
-            self.update_task(stat)
+            if self.taskSnapshot.changed(stat, self.totalLines) or self.taskFullUpdate:
+                modified |= self.update_task(stat)
         if (self.interpSubscribed):
-            self.update_interp(stat)
+            if self.interpSnapshot.changed(stat) or self.interpFullUpdate:
+                modified |= self.update_interp(stat)
         if (self.motionSubscribed):
-            self.update_motion(stat)
+            if self.motionSnapshot.changed(stat) or self.motionFullUpdate:
+                modified |= self.update_motion(stat)
         if (self.configSubscribed):
-            self.update_config(stat)
+            if self.configSnapshot.changed(stat) or self.configFullUpdate:
+                modified |= self.update_config(stat)
+        return modified
 
     def update_error(self, error):
         with self.errorNoteLock:
@@ -1469,41 +1703,73 @@ class LinuxCNCWrapper():
         self.add_error("%s\non line %s" % (error, str(line)))
 
     def send_config(self, data, type):
-        self.txStatus.emc_status_config.MergeFrom(data)
         if self.debug:
             print("sending config message")
-        self.send_status_msg('config', type)
+        self.send_status_msg('config', type, data)
 
     def send_io(self, data, type):
-        self.txStatus.emc_status_io.MergeFrom(data)
         if self.debug:
             print("sending io message")
-        self.send_status_msg('io', type)
+        self.send_status_msg('io', type, data)
 
     def send_task(self, data, type):
-        self.txStatus.emc_status_task.MergeFrom(data)
         if self.debug:
             print("sending task message")
-        self.send_status_msg('task', type)
+        self.send_status_msg('task', type, data)
 
     def send_motion(self, data, type):
-        self.txStatus.emc_status_motion.MergeFrom(data)
         if self.debug:
             print("sending motion message")
-        self.send_status_msg('motion', type)
+        self.send_status_msg('motion', type, data)
 
     def send_interp(self, data, type):
-        self.txStatus.emc_status_interp.MergeFrom(data)
         if self.debug:
             print("sending interp message")
-        self.send_status_msg('interp', type)
+        self.send_status_msg('interp', type, data)
+
+    def send_status_msg(self, topic, type, data):
+        statusTopic = self.statusTopics[topic]
+        with statusTopic.lock:
+            tx = statusTopic.tx
+            if data is not statusTopic.data:  # full update
+                statusTopic.data.CopyFrom(data)
+            statusTopic.serial += 1
+            tx.type = type
+            tx.serial = statusTopic.serial
+            if type == MT_EMCSTAT_FULL_UPDATE:
+                self.add_pparams(tx)
+            txBuffer = tx.SerializeToString()
+            if type == MT_EMCSTAT_FULL_UPDATE:
+                statusTopic.snapshot = (statusTopic.serial, txBuffer)
+            tx.ClearField('pparams')
+        with self.statusLock:
+            self.statusSocket.send_multipart([topic, txBuffer], zmq.NOBLOCK)
 
-    def send_status_msg(self, topic, type):
+    def send_status_snapshot(self, topic):
+        # a new subscriber gets the full update of the current version
+        # right away, the next poll only sends the changes
+        if getattr(self, topic + 'Firstrun'):  # no status yet
+            setattr(self, topic + 'FullUpdate', True)
+            return
+        statusTopic = self.statusTopics[topic]
+        with statusTopic.lock:
+            if statusTopic.snapshot is None \
+               or statusTopic.snapshot[0] != statusTopic.serial:
+                tx = Container()
+                tx.type = MT_EMCSTAT_FULL_UPDATE
+                tx.serial = statusTopic.serial
+                getattr(tx, 'emc_status_' + topic).CopyFrom(getattr(self.status, topic))
+                self.add_pparams(tx)
+                statusTopic.snapshot = (statusTopic.serial, tx.SerializeToString())
+            txBuffer = statusTopic.snapshot[1]
+        if self.debug:
+            print("sending %s snapshot %i" % (topic, statusTopic.serial))
         with self.statusLock:
-            self.txStatus.type = type
-            txBuffer = self.txStatus.SerializeToString()
             self.statusSocket.send_multipart([topic, txBuffer], zmq.NOBLOCK)
-            self.txStatus.Clear()
+
+    def send_status_ping(self, topic):
+        with self.statusLock:
+            self.statusSocket.send_multipart([topic, self.statusPingBuffer], zmq.NOBLOCK)
 
     def send_error_msg(self, topic, type):
         with self.errorLock:
@@ -1519,26 +1785,24 @@ class LinuxCNCWrapper():
             self.commandSocket.send_multipart(identity + [txBuffer], zmq.NOBLOCK)
             self.txCommand.Clear()
 
-    def add_pparams(self):
-        parameters = ProtocolParameters()
-        parameters.keepalive_timer = int(self.pingInterval * 1000.0)
-        self.txStatus.pparams.MergeFrom(parameters)
+    def add_pparams(self, tx):
+        tx.pparams.keepalive_timer = int(self.pingInterval * 1000.0)
 
     def ping_status(self):
         if (self.ioSubscribed):
-            self.send_status_msg('io', MT_PING)
+            self.send_status_ping('io')
         if (self.taskSubscribed):
-            self.send_status_msg('task', MT_PING)
+            self.send_status_ping('task')
         if (self.interpSubscribed):
-            self.send_status_msg('interp', MT_PING)
+            self.send_status_ping('interp')
         if (self.motionSubscribed):
-            self.send_status_msg('motion', MT_PING)
+            self.send_status_ping('motion')
         if (self.configSubscribed):
-            self.send_status_msg('config', MT_PING)
+            self.send_status_ping('config')
 
     def ping_error(self):
         if self.newErrorSubscription:        # not very clear
-            self.add_pparams()
+            self.add_pparams(self.txError)
             self.newErrorSubscription = False
 
         if (self.errorSubscribed):
@@ -1557,19 +1821,16 @@ class LinuxCNCWrapper():
 
             if subscription == 'motion':
                 self.motionSubscribed = status
-                self.motionFullUpdate = status
             elif subscription == 'task':
                 self.taskSubscribed = status
-                self.taskFullUpdate = status
             elif subscription == 'io':
                 self.ioSubscribed = status
-                self.ioFullUpdate = status
             elif subscription == 'config':
                 self.configSubscribed = status
-                self.configFullUpdate = status
             elif subscription == 'interp':
                 self.interpSubscribed = status
-                self.interpFullUpdate = status
+            if status and subscription in self.statusTopics:
+                self.send_status_snapshot(subscription)
 
             self.statusServiceSubscribed = self.motionSubscribed \
             or self.taskSubscribed \
@@ -1632,31 +1893,13 @@ class LinuxCNCWrapper():
         self.txCommand.reply_ticket = ticket
         self.send_command_msg(identity, MT_EMCCMD_EXECUTED)
 
-    def command_completion_process(self, event):
-        self.command.wait_complete()  # wait for emcmodule
-        event.set()  # inform the listening thread
-
-    def command_completion_thread(self, identity, ticket):
-        event = multiprocessing.Event()
-        # wait in separate process to prevent GIL from causing problems
-        multiprocessing.Process(target=self.command_completion_process,
-                                args=(event,)).start()
-        # wait until the command is completed
-        event.wait()
-        self.send_command_completed(identity, ticket)
-
-        if self.debug:
-            print('command #%i from %s completed' % (ticket, identity))
-
     def wait_complete(self, identity, ticket):
         self.send_command_executed(identity, ticket)
 
         if self.debug:
-            print('waiting for command #%ifrom %s to complete' % (ticket, identity))
+            print('waiting for command #%i from %s to complete' % (ticket, identity))
 
-        # kick off the monitoring thread
-        threading.Thread(target=self.command_completion_thread,
-                         args=(identity, ticket, )).start()
+        self.completionTracker.add(self.command.serial, identity, ticket)
 
     def process_command(self, socket):
         with self.commandLock:
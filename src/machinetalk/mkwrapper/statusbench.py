@@ -0,0 +1,122 @@
+#!/usr/bin/python2
+# -*- coding: UTF-8 -*
+# Microbenchmark of the mkwrapper status updates
+#
+# A simulated linuxcnc.stat moves all axes a little on every poll, like a
+# running program, while the motion, task and interp subtopics are
+# subscribed.  The status messages go to a socket which only counts them,
+# so the result is the rate at which mkwrapper can build and serialize
+# status messages.
+#
+# usage: python2 statusbench.py [-n POLLS]
+import sys
+import time
+import types
+import threading
+import argparse
+
+import mkwrapper
+
+
+class CountingSocket():
+    def __init__(self):
+        self.messages = 0
+        self.bytes = 0
+
+    def send_multipart(self, frames, flags=0):
+        self.messages += 1
+        self.bytes += len(frames[-1])
+
+
+def field_default(field):
+    if field.enum_type is not None:
+        return field.enum_type.values[0].number
+    if field.type == field.TYPE_STRING:
+        return ''
+    if field.type == field.TYPE_BOOL:
+        return False
+    return 0
+
+
+class SimulatedStat():
+    axes = 3
+    positions = ['actual_position', 'position', 'joint_position',
+                 'joint_actual_position', 'dtg']
+
+    def __init__(self):
+        tables = [(mkwrapper.LinuxCNCWrapper.motionFields, mkwrapper.EmcStatusMotion),
+                  (mkwrapper.LinuxCNCWrapper.taskFields, mkwrapper.EmcStatusTask),
+                  (mkwrapper.LinuxCNCWrapper.interpFields, mkwrapper.EmcStatusInterp)]
+        for table, message in tables:
+            for name in table.values:
+                setattr(self, name, field_default(message.DESCRIPTOR.fields_by_name[name]))
+            for name in table.floats:
+                setattr(self, name, 0.0)
+            for name in table.positions:
+                setattr(self, name, (0.0,) * 9)
+        self.ain = (0.0,) * 64
+        self.aout = (0.0,) * 64
+        self.din = (False,) * 64
+        self.dout = (False,) * 64
+        self.limit = (0,) * 9
+        self.gcodes = (0,) * 16
+        self.mcodes = (0,) * 10
+        self.settings = (0.0,) * 3
+        self.axis = tuple({'enabled': True, 'fault': False, 'homed': True,
+                           'homing': False, 'inpos': False,
+                           'max_hard_limit': False, 'max_soft_limit': False,
+                           'min_hard_limit': False, 'min_soft_limit': False,
+                           'override_limits': False, 'ferror_current': 0.0,
+                           'ferror_highmark': 0.0, 'input': 0.0,
+                           'output': 0.0, 'velocity': 0.0}
+                          for _ in range(9))
+        self.cycle = 0
+
+    def poll(self):
+        self.cycle += 1
+        value = self.cycle * 0.001
+        position = (value,) * self.axes + (0.0,) * (9 - self.axes)
+        for name in self.positions:
+            setattr(self, name, position)
+        self.current_vel = value
+        self.distance_to_go = value
+        for index in range(self.axes):
+            self.axis[index]['input'] = value
+            self.axis[index]['output'] = value
+            self.axis[index]['velocity'] = value
+        self.read_line = self.cycle // 100
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the status message rate of mkwrapper')
+    parser.add_argument('-n', '--polls', help='number of polls', type=int, default=20000)
+    args = parser.parse_args()
+
+    # a wrapper with only the status state, no sockets and no linuxcnc
+    wrapper = types.InstanceType(mkwrapper.LinuxCNCWrapper)
+    wrapper.debug = False
+    wrapper.pingInterval = 2
+    wrapper.totalLines = 0
+    wrapper.statusLock = threading.Lock()
+    wrapper.statusSocket = CountingSocket()
+    wrapper.init_status()
+    for topic in ['motion', 'task', 'interp']:
+        setattr(wrapper, topic + 'Subscribed', True)
+        setattr(wrapper, topic + 'FullUpdate', True)
+    wrapper.statusServiceSubscribed = True
+
+    stat = SimulatedStat()
+    start = time.time()
+    for _ in xrange(args.polls):
+        stat.poll()
+        wrapper.update_status(stat)
+    elapsed = time.time() - start
+
+    socket = wrapper.statusSocket
+    print('%i polls in %.2f s: %.0f polls/s, %.0f messages/s, %.0f bytes/message'
+          % (args.polls, elapsed, args.polls / elapsed, socket.messages / elapsed,
+             float(socket.bytes) / max(socket.messages, 1)))
+
+
+if __name__ == "__main__":
+    main()
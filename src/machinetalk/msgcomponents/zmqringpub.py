@@ -1,10 +1,24 @@
-# demo how ZMQ messaging can be hooked into HAL rings:
-#   reading from rings and publishing messages
+# bridge HAL rings to ZeroMQ: read records from rings and publish them
 #
 # scheme:
-#    for all rings found:
-#      if the ring has a writer but no reader, attach to the ring, read messages
-#      and publish them on the <ringname> ZMQ publish channel
+#    for all rings named on the command line, or all rings found which
+#    have a writer but no reader: attach to the ring, read records and
+#    publish them on the <ringname> ZMQ publish channel
+#
+# A message is the topic frame followed by one frame per record; up to
+# --batch records which are available at once go into one message.  A
+# multiframe ring message is published as one message with its frames,
+# a stream ring as one frame with the bytes available.
+#
+# Records, multiframe messages and stream data of at least --zero-copy
+# bytes are sent straight from the ring memory, which is released to the
+# writer once ZeroMQ is done with it.  Smaller ones are copied, which is
+# cheaper than tracking them.
+#
+# Every ring is read as soon as it has data; the program only waits
+# when all rings are empty.  If a subscriber cannot keep up, messages
+# are dropped and counted instead of blocking the other rings (needs
+# ZeroMQ 4.1 or later, older versions drop silently).
 #
 # run this program after executing:
 #
@@ -16,39 +30,233 @@
 #
 # adapted from: https://github.com/zeromq/pyzmq/tree/master/examples/pubsub
 
-import os,sys
+import sys
 import time
+import argparse
 import zmq
 from machinekit import hal
+from machinekit.ringwait import RingWatcher
 
-debug = 1
-ip = "127.0.0.1"
-uri = "tcp://%s:5555" % (ip)
 
-ringlist = []
+class RingSource(object):
+    '''a ring being published, with its counters'''
 
-for name in hal.rings():
-    r = hal.Ring(name) # no size parameter: attach to existing ring
-    if debug: print "inspecting ring %s: reader=%d writer=%d " %  (name,r.reader,r.writer)
-    if r.reader == 0 and r.writer:
-        ringlist.append((name,r))
-        if debug: print "reading from ring",name
+    def __init__(self, name, ring):
+        self.name = name
+        self.ring = ring
+        self.type = ring.type
+        if self.type == hal.RINGTYPE_MULTIPART:
+            self.reader = hal.MultiframeRing(ring)
+        elif self.type == hal.RINGTYPE_STREAM:
+            self.reader = hal.StreamRing(ring)
+        else:
+            self.reader = ring
+        self.notifier = None
+        self.tracker = None  # zero-copy send still using the ring memory
+        self.release = None  # releases the ring memory once sent
+        self.records = 0
+        self.messages = 0
+        self.bytes = 0
+        self.drops = 0
 
-if not len(ringlist):
-    print "no readable rings found"
-    sys.exit(1)
+    def pending(self):
+        if self.tracker is None:
+            return False
+        if not self.tracker.done:
+            return True
+        self.tracker = None
+        self.release()
+        return False
 
-context = zmq.Context()
-s = context.socket(zmq.PUB)
-s.bind(uri)
+    def stats(self):
+        return "%s: %d records %d messages %d bytes %d dropped" % \
+            (self.name, self.records, self.messages, self.bytes, self.drops)
 
-# poll rings and publish messages under topic <ringname>
-while True:
-    for name,ring in ringlist:
-        record = ring.read()
-        if record:
-            if debug: print "publish topic '%s': '%s'" % (name,record.tobytes())
-            s.send_multipart([name, record.tobytes()])
-            ring.shift()
+
+class RingBridge(object):
+    def __init__(self, socket, sources, batch=256, zero_copy=1 << 16,
+                 debug=False):
+        self.socket = socket
+        self.sources = sources
+        self.batch = batch
+        self.zero_copy = zero_copy
+        self.debug = debug
+        self.buffer = bytearray(max(zero_copy, 4096))
+        self.watcher = RingWatcher()
+
+    def send(self, source, frames, records, copy=True):
+        '''publish frames, returns the tracker for zero-copy sends,
+        None for copied or dropped ones'''
+        size = sum(len(f) for f in frames)
+        try:
+            tracker = self.socket.send_multipart([source.name] + frames,
+                                                 zmq.NOBLOCK, copy=copy,
+                                                 track=not copy)
+        except zmq.Again:
+            source.drops += records
+            return None
+        source.records += records
+        source.messages += 1
+        source.bytes += size
+        if self.debug:
+            print "publish topic '%s': %d records %d bytes" % \
+                (source.name, records, size)
+        if copy:
+            return None
+        return tracker
+
+    def send_ring_memory(self, source, frames, records, release):
+        if sum(len(f) for f in frames) < self.zero_copy:
+            self.send(source, frames, records)
+            release()
+            return
+        tracker = self.send(source, frames, records, copy=False)
+        if tracker is None:
+            release()
         else:
-            time.sleep(0.1)
+            source.tracker = tracker
+            source.release = release
+
+    def service_records(self, source):
+        ring = source.ring
+        record = ring.read()
+        if record is None:
+            return 0
+        if len(record) >= self.zero_copy:
+            self.send_ring_memory(source, [record], 1, ring.shift)
+            return 1
+        # copy a batch of small records back to back, one frame each
+        sizes = []
+        n = ring.readinto(self.buffer, self.batch, sizes)
+        view = memoryview(self.buffer)
+        frames = []
+        offset = 0
+        for size in sizes:
+            frames.append(view[offset:offset + size])
+            offset += size
+        self.send(source, frames, n)
+        return n
+
+    def service_multipart(self, source):
+        frames = [frame.data for frame in source.reader.read()]
+        if not frames:
+            return 0
+        self.send_ring_memory(source, frames, 1, source.reader.shift)
+        return 1
+
+    def service_stream(self, source):
+        stream = source.reader
+        views = stream.views()
+        if not views:
+            return 0
+        if len(views) == 1:
+            size = len(views[0])
+            self.send_ring_memory(source, list(views), 1,
+                                  lambda: stream.consume(size))
+        else:  # wrapped around the end of the ring
+            self.send(source, [stream.read()], 1)
+        return 1
+
+    def service(self, source):
+        '''publish one batch from a ring, returns the number of records'''
+        if source.pending():
+            return 0
+        if source.type == hal.RINGTYPE_MULTIPART:
+            return self.service_multipart(source)
+        if source.type == hal.RINGTYPE_STREAM:
+            return self.service_stream(source)
+        return self.service_records(source)
+
+    def run(self, stats_interval=0):
+        poller = zmq.Poller()
+        poller.register(self.socket, zmq.POLLIN)
+        for source in self.sources:
+            source.notifier = self.watcher.watch(source.ring)
+            poller.register(source.notifier, zmq.POLLIN)
+        next_stats = time.time() + stats_interval
+
+        try:
+            while True:
+                active = False
+                for source in self.sources:
+                    if self.service(source):
+                        active = True
+
+                if stats_interval and time.time() >= next_stats:
+                    for source in self.sources:
+                        print source.stats()
+                    next_stats = time.time() + stats_interval
+                if active:
+                    continue
+
+                # all rings are empty or waiting for zero-copy sends
+                timeout = 1000
+                if any(source.tracker is not None for source in self.sources):
+                    timeout = 1
+                events = dict(poller.poll(timeout))
+                if self.socket in events:
+                    self.process_subscriptions()
+                for source in self.sources:
+                    if source.notifier in events:
+                        source.notifier.clear()
+        finally:
+            self.watcher.stop()
+
+    def process_subscriptions(self):
+        while True:
+            try:
+                message = self.socket.recv(zmq.NOBLOCK)
+            except zmq.Again:
+                return
+            if self.debug:
+                status = 'subscribe' if message[:1] == '\x01' else 'unsubscribe'
+                print "%s '%s'" % (status, message[1:])
+
+
+def find_rings(names, debug=False):
+    sources = []
+    for name in names or hal.rings():
+        r = hal.Ring(name)  # no size parameter: attach to existing ring
+        if debug:
+            print "inspecting ring %s: reader=%d writer=%d " % \
+                (name, r.reader, r.writer)
+        if names or (r.reader == 0 and r.writer):
+            sources.append(RingSource(name, r))
+            if debug:
+                print "reading from ring", name
+    return sources
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Publish the records of HAL rings on a ZeroMQ socket')
+    parser.add_argument('-u', '--uri', help='URI to bind the publish socket to', default='tcp://127.0.0.1:5555')
+    parser.add_argument('-b', '--batch', help='maximum number of records per message', type=int, default=256)
+    parser.add_argument('-z', '--zero-copy', help='send records of this size or larger without copying', type=int, default=1 << 16)
+    parser.add_argument('-s', '--stats', help='print counters every STATS seconds', type=float, default=0)
+    parser.add_argument('-d', '--debug', help='Enable debug mode', action='store_true')
+    parser.add_argument('rings', nargs='*', help='rings to publish, default all rings with a writer and no reader')
+    args = parser.parse_args()
+
+    sources = find_rings(args.rings, args.debug)
+    if not sources:
+        print "no readable rings found"
+        sys.exit(1)
+
+    context = zmq.Context()
+    s = context.socket(zmq.XPUB)
+    if hasattr(zmq, 'XPUB_NODROP'):
+        s.setsockopt(zmq.XPUB_NODROP, 1)  # report full queues as EAGAIN
+    s.bind(args.uri)
+
+    bridge = RingBridge(s, sources, batch=args.batch,
+                        zero_copy=args.zero_copy, debug=args.debug)
+    try:
+        bridge.run(args.stats)
+    except KeyboardInterrupt:
+        pass
+    for source in sources:
+        print source.stats()
+
+
+if __name__ == "__main__":
+    main()
@@ -31,8 +31,10 @@ def main():
             s.setsockopt(zmq.SUBSCRIBE,t)
     try:
         while True:
-            topic, msg = s.recv_multipart()
-            print 'topic: %s, msg:%s' % (topic, msg)
+            frames = s.recv_multipart()
+            topic = frames[0]
+            for msg in frames[1:]:  # one frame per record
+                print 'topic: %s, msg:%s' % (topic, msg)
     except KeyboardInterrupt:
         pass
     print "Done."